@@ -0,0 +1,311 @@
+"""
+Local stand-in for the Graph API endpoints the service calls, for load tests without hitting Meta.
+
+    MOCK_GRAPH_POSTS=10000 MOCK_GRAPH_LATENCY_MS=80 python -m benchmarks.mock_graph
+
+Then point the service at it with BASE_URL=http://127.0.0.1:8900/v21.0/. Served endpoints:
+
+    GET  /{account_id}/media      paginated media, honours the nested like_count/insights fields
+    GET  /{id}                    post like_count, or account id/username/followers_count
+    GET  /{id}/insights           post reach/saved, account total_value metrics and demographics
+    POST /                        batch requests (each sub-request is dispatched like a GET)
+    GET  /oauth/access_token      token exchange
+    GET  /debug_token
+
+Latency, injected errors and throttle responses are configured with MOCK_GRAPH_* variables.
+Every response carries an X-App-Usage header computed against MOCK_GRAPH_USAGE_BUDGET calls
+per MOCK_GRAPH_USAGE_WINDOW seconds, so the rate governor sees realistic usage.
+
+Benchmarks drive it through two extra endpoints:
+
+    GET  /_mock/stats             request counters since the last reset
+    POST /_mock/config            JSON body overriding any config key; resets the counters
+"""
+import os
+import json
+import time
+import random
+import asyncio
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from aiohttp import web
+
+MOCK_GRAPH_HOST = os.getenv("MOCK_GRAPH_HOST", "127.0.0.1")
+MOCK_GRAPH_PORT = int(os.getenv("MOCK_GRAPH_PORT", 8900))
+
+DEFAULT_CONFIG = {
+    "account_id": os.getenv("MOCK_GRAPH_ACCOUNT_ID", "17841400000000000"),
+    "posts": int(os.getenv("MOCK_GRAPH_POSTS", 1000)),
+    "latency_ms": float(os.getenv("MOCK_GRAPH_LATENCY_MS", 50)),
+    "jitter_ms": float(os.getenv("MOCK_GRAPH_JITTER_MS", 20)),
+    "batch_item_ms": float(os.getenv("MOCK_GRAPH_BATCH_ITEM_MS", 2)),  # extra latency per batch sub-request
+    "error_rate": float(os.getenv("MOCK_GRAPH_ERROR_RATE", 0)),  # share of calls answered with a 500
+    "throttle_rate": float(os.getenv("MOCK_GRAPH_THROTTLE_RATE", 0)),  # share of calls answered with a throttle error
+    "throttle_code": int(os.getenv("MOCK_GRAPH_THROTTLE_CODE", 4)),
+    "usage_budget": int(os.getenv("MOCK_GRAPH_USAGE_BUDGET", 1_000_000)),  # calls per window that read as 100% usage
+    "usage_window": float(os.getenv("MOCK_GRAPH_USAGE_WINDOW", 60)),  # seconds
+    "max_page_size": int(os.getenv("MOCK_GRAPH_MAX_PAGE_SIZE", 100)),
+    "seed": int(os.getenv("MOCK_GRAPH_SEED", 42)),
+}
+
+POST_ID_BASE = 18_000_000_000_000_000
+MEDIA_TYPES = ("IMAGE", "VIDEO", "CAROUSEL_ALBUM")
+TOKEN_LIFETIME = 60 * 24 * 3600  # seconds, same as a long-lived token
+
+
+def post_id(index):
+    return str(POST_ID_BASE + index)
+
+
+def post_index(value):
+    """
+    Index of a mock post id, or None if the id is not a post.
+    """
+    try:
+        index = int(value) - POST_ID_BASE
+    except (TypeError, ValueError):
+        return None
+    return index if index >= 0 else None
+
+
+class MockGraph:
+    """
+    Deterministic fake Graph data plus the fault injection and counters for one run.
+    Post `index` 0 is the newest post; every counter is derived from the index and the seed.
+    """
+    def __init__(self, **config):
+        self.configure(**config)
+
+    def configure(self, **config):
+        self.config = {**DEFAULT_CONFIG, **getattr(self, "config", {}), **config}
+        self.random = random.Random(self.config["seed"])
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.calls = deque()
+        self.stats = Counter()
+        self.started_at = time.monotonic()
+
+    # Data
+
+    def _metric(self, index, salt, modulo):
+        return (index * 7919 + salt * 104729 + self.config["seed"]) % modulo
+
+    def media_item(self, index, inline_metrics=False):
+        item = {
+            "id": post_id(index),
+            "media_type": MEDIA_TYPES[index % len(MEDIA_TYPES)],
+            "media_url": f"https://mock.cdninstagram.test/{post_id(index)}.jpg",
+            "timestamp": (self.now - timedelta(hours=index)).strftime("%Y-%m-%dT%H:%M:%S+0000"),
+        }
+        if inline_metrics:
+            item["like_count"] = self._metric(index, 1, 500)
+            item["insights"] = self.post_insights(index, ["reach", "saved"])
+        return item
+
+    def post_insights(self, index, metrics):
+        values = {"reach": self._metric(index, 2, 5000), "saved": self._metric(index, 3, 50)}
+        return {
+            "data": [
+                {
+                    "name": metric,
+                    "period": "lifetime",
+                    "values": [{"value": values.get(metric, 0)}],
+                    "id": f"{post_id(index)}/insights/{metric}/lifetime",
+                }
+                for metric in metrics
+            ]
+        }
+
+    def media_page(self, base_url, account_id, query):
+        limit = min(int(query.get("limit", 25)), self.config["max_page_size"])
+        offset = int(query.get("after", 0))
+        end = min(offset + limit, self.config["posts"])
+        fields = query.get("fields", "")
+        inline_metrics = "like_count" in fields and "insights" in fields
+
+        body = {"data": [self.media_item(index, inline_metrics) for index in range(offset, end)]}
+        body["paging"] = {"cursors": {"before": str(offset), "after": str(end)}}
+        if end < self.config["posts"]:
+            body["paging"]["next"] = f"{base_url}{account_id}/media?{urlencode({**query, 'after': end})}"
+        return body
+
+    def account_insights(self, query):
+        metrics = query.get("metric", "").split(",")
+        if "engaged_audience_demographics" in metrics:
+            breakdown = query.get("breakdown", "age")
+            values = {
+                "age": ["18-24", "25-34", "35-44", "45-54", "55-64", "65+"],
+                "gender": ["F", "M", "U"],
+                "city": [f"City {number}" for number in range(45)],
+            }.get(breakdown, [])
+            results = [
+                {"dimension_values": [value], "value": self._metric(position, 4, 2000)}
+                for position, value in enumerate(values)
+            ]
+            return {"data": [{
+                "name": "engaged_audience_demographics",
+                "period": "lifetime",
+                "total_value": {"breakdowns": [{"dimension_keys": [breakdown], "results": results}]},
+            }]}
+
+        return {"data": [
+            {"name": metric, "period": "day", "total_value": {"value": self._metric(position, 5, 10000)}}
+            for position, metric in enumerate(metrics)
+        ]}
+
+    # Dispatch
+
+    def handle(self, path, query, base_url):
+        """
+        Answer one GET call. Returns (status, body).
+        """
+        segments = _strip_version(path)
+
+        if segments == ["oauth", "access_token"]:
+            self.stats["endpoint:oauth/access_token"] += 1
+            return 200, {"access_token": f"mock-token-{self.random.getrandbits(32):08x}", "token_type": "bearer", "expires_in": TOKEN_LIFETIME}
+        if segments == ["debug_token"]:
+            self.stats["endpoint:debug_token"] += 1
+            expires_at = int(self.now.timestamp()) + TOKEN_LIFETIME
+            return 200, {"data": {"is_valid": True, "expires_at": expires_at, "app_id": "mock"}}
+
+        if len(segments) == 2 and segments[1] == "media":
+            self.stats["endpoint:{id}/media"] += 1
+            if segments[0] != self.config["account_id"]:
+                return self._unknown_object(segments[0])
+            return 200, self.media_page(base_url, segments[0], query)
+
+        if len(segments) == 2 and segments[1] == "insights":
+            self.stats["endpoint:{id}/insights"] += 1
+            if segments[0] == self.config["account_id"]:
+                return 200, self.account_insights(query)
+            index = post_index(segments[0])
+            if index is None or index >= self.config["posts"]:
+                return self._unknown_object(segments[0])
+            return 200, self.post_insights(index, query.get("metric", "reach").split(","))
+
+        if len(segments) == 1:
+            self.stats["endpoint:{id}"] += 1
+            if segments[0] == self.config["account_id"]:
+                return 200, {"id": segments[0], "username": "mock_account", "followers_count": 10000 + self.config["seed"]}
+            index = post_index(segments[0])
+            if index is None or index >= self.config["posts"]:
+                return self._unknown_object(segments[0])
+            return 200, {"id": segments[0], "like_count": self._metric(index, 1, 500)}
+
+        self.stats["endpoint:unknown"] += 1
+        return 400, {"error": {"message": f"Unknown path components: /{'/'.join(segments)}", "type": "OAuthException", "code": 2500}}
+
+    @staticmethod
+    def _unknown_object(object_id):
+        return 400, {"error": {
+            "message": f"Unsupported get request. Object with ID '{object_id}' does not exist",
+            "type": "GraphMethodException",
+            "code": 100,
+        }}
+
+    def inject_fault(self):
+        """
+        Return an injected (status, body) for this call, or None to answer normally.
+        """
+        roll = self.random.random()
+        if roll < self.config["throttle_rate"]:
+            self.stats["throttles_injected"] += 1
+            return 400, {"error": {"message": "Application request limit reached", "type": "OAuthException", "code": self.config["throttle_code"]}}
+        if roll < self.config["throttle_rate"] + self.config["error_rate"]:
+            self.stats["errors_injected"] += 1
+            return 500, {"error": {"message": "An unexpected error has occurred. Please retry your request later.", "type": "OAuthException", "code": 2, "is_transient": True}}
+        return None
+
+    def record_call(self):
+        now = time.monotonic()
+        self.calls.append(now)
+        while self.calls and self.calls[0] < now - self.config["usage_window"]:
+            self.calls.popleft()
+        self.stats["graph_calls"] += 1
+
+    def usage_header(self):
+        usage = min(100, round(len(self.calls) * 100 / self.config["usage_budget"]))
+        return json.dumps({"call_count": usage, "total_cputime": usage // 2, "total_time": usage // 2})
+
+    def latency(self, extra_ms=0):
+        jitter = self.random.uniform(-self.config["jitter_ms"], self.config["jitter_ms"])
+        return max(0, self.config["latency_ms"] + jitter + extra_ms) / 1000
+
+    def stats_dict(self):
+        elapsed = time.monotonic() - self.started_at
+        return {
+            **self.stats,
+            "elapsed_seconds": round(elapsed, 3),
+            "config": self.config,
+        }
+
+
+def _is_version(segment):
+    return segment.startswith("v") and segment[1:].replace(".", "").isdigit()
+
+
+def _strip_version(path):
+    segments = [segment for segment in path.split("/") if segment]
+    return segments[1:] if segments and _is_version(segments[0]) else segments
+
+
+def _split_relative_url(relative_url):
+    parts = urlsplit(relative_url)
+    return parts.path, dict(parse_qsl(parts.query))
+
+
+async def handle_request(request):
+    mock = request.app["mock"]
+    path = request.match_info["tail"]
+    version = path.split("/")[0]
+    base_url = f"{request.scheme}://{request.host}/{version + '/' if _is_version(version) else ''}"
+
+    if path == "_mock/stats":
+        return web.json_response(mock.stats_dict())
+    if path == "_mock/config" and request.method == "POST":
+        mock.configure(**(await request.json()))
+        return web.json_response(mock.config)
+
+    mock.stats["http_requests"] += 1
+    query = dict(request.query)
+    is_batch = request.method == "POST" and not _strip_version(path)
+
+    if is_batch:
+        form = await request.post()
+        query.update(form)
+        sub_requests = json.loads(query.get("batch", "[]"))
+        await asyncio.sleep(mock.latency(mock.config["batch_item_ms"] * len(sub_requests)))
+    else:
+        await asyncio.sleep(mock.latency())
+
+    # The whole request can fail or be throttled, batch or not
+    mock.record_call()
+    fault = mock.inject_fault()
+    if fault:
+        status, body = fault
+    elif is_batch:
+        mock.stats["batch_requests"] += 1
+        status, body = 200, []
+        for sub_request in sub_requests:
+            mock.record_call()
+            mock.stats["batch_sub_requests"] += 1
+            sub_path, sub_query = _split_relative_url(sub_request.get("relative_url", ""))
+            sub_status, sub_body = mock.inject_fault() or mock.handle(sub_path, sub_query, base_url)
+            body.append({"code": sub_status, "headers": [], "body": json.dumps(sub_body)})
+    else:
+        status, body = mock.handle(path, query, base_url)
+
+    return web.json_response(body, status=status, headers={"X-App-Usage": mock.usage_header()})
+
+
+def create_app(**config):
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app["mock"] = MockGraph(**config)
+    app.router.add_route("*", "/{tail:.*}", handle_request)
+    return app
+
+
+if __name__ == "__main__":
+    print(f"Mock Graph API on http://{MOCK_GRAPH_HOST}:{MOCK_GRAPH_PORT}/v21.0/")
+    web.run_app(create_app(), host=MOCK_GRAPH_HOST, port=MOCK_GRAPH_PORT, access_log=None, print=None)
@@ -1,6 +1,8 @@
 import os
+import asyncio
 import urllib.parse
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -9,11 +11,27 @@ DB_PASSWORD = urllib.parse.quote_plus(os.getenv("DB_PASSWORD"))
 DB_NAME = os.getenv("DB_NAME")
 DB_HOST = os.getenv("DB_HOST")
 
+# Async pool, sized for sync jobs and requests writing at the same time
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))  # seconds to wait for a free connection
+
 db_string = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+async_db_string = f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
 
 engine = create_engine(db_string, pool_recycle=3600, pool_timeout=60)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    async_db_string,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=3600,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 # Dependency to get a new DB session
@@ -22,4 +40,19 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency for async routes: I/O goes through aiomysql instead of blocking the event loop
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def run_db(db, fn, *args):
+    """
+    Run a sync-style DB helper `fn(session, *args)` without blocking the event loop:
+    through run_sync on an AsyncSession, in a worker thread on a plain Session.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await asyncio.to_thread(fn, db, *args)
@@ -0,0 +1,185 @@
+"""
+Add snapshot_date, account scoping, the unique keys and newer columns to an existing analytics schema.
+
+    python -m database.migrate
+
+Safe to run more than once: every step checks the current schema first.
+Rows that would collide on a new unique key are merged into the oldest row
+(daily deltas are summed) before the key is created. Existing posts and
+profile rows are assigned to PKM_INSTAGRAM_ACCOUNT_ID.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import inspect, text
+from database.database import engine
+
+PKM_INSTAGRAM_ACCOUNT_ID = os.getenv("PKM_INSTAGRAM_ACCOUNT_ID")
+
+# Tables that gained an account_id column, with the index name
+ACCOUNT_TABLES = {
+    "social_profile": "ix_social_profile_account_id",
+    "social_posts": "ix_social_posts_account_id",
+}
+
+# table -> [(column, DDL type)] added after the table was first created
+ADDED_COLUMNS = {
+    "social_post_totals": [("fingerprint", "BIGINT NULL")],
+    "social_posts": [
+        ("media_hash", "VARCHAR(64) NULL"),
+        ("media_checked_ts", "DATETIME NULL"),
+        ("media_failures", "INT NOT NULL DEFAULT 0"),
+    ],
+}
+
+# Keys replaced by an account-scoped one
+DROPPED_KEYS = {
+    "social_profile": ["uq_profile_day"],
+}
+
+# table -> (unique key name, key columns, delta columns summed when merging duplicates)
+SNAPSHOT_TABLES = {
+    "social_profile": ("uq_profile_account_day", ["account_id", "snapshot_date"], ["followers", "impressions", "reach", "accounts_engaged", "website_clicks"]),
+    "social_postinsights": ("uq_postinsights_post_day", ["posts_id", "snapshot_date"], ["reach", "likes", "saves"]),
+    "social_engaged_audience_age": ("uq_audience_age_day", ["socialmedia_id", "age_group", "snapshot_date"], ["count"]),
+    "social_engaged_audience_gender": ("uq_audience_gender_day", ["socialmedia_id", "gender", "snapshot_date"], ["count"]),
+    "social_engaged_audience_location": ("uq_audience_city_day", ["socialmedia_id", "city", "snapshot_date"], ["count"]),
+}
+
+# Child tables to repoint before duplicate parents are deleted
+CHILD_TABLES = {
+    "social_profile": [
+        ("social_engaged_audience_age", "socialmedia_id"),
+        ("social_engaged_audience_gender", "socialmedia_id"),
+        ("social_engaged_audience_location", "socialmedia_id"),
+    ],
+    "social_posts": [("social_postinsights", "posts_id")],
+}
+
+
+def _duplicates_subquery(table, key_columns):
+    keys = ", ".join(key_columns)
+    return f"(SELECT MIN(id) AS keep_id, {keys} FROM {table} GROUP BY {keys} HAVING COUNT(*) > 1)"
+
+
+def merge_duplicates(conn, table, key_columns, sum_columns):
+    """
+    Collapse rows sharing `key_columns` into the row with the lowest id.
+    """
+    join_on = " AND ".join(f"t.{column} <=> d.{column}" for column in key_columns)
+    duplicates = _duplicates_subquery(table, key_columns)
+
+    if sum_columns:
+        sums = ", ".join(f"SUM({column}) AS {column}" for column in sum_columns)
+        keys = ", ".join(key_columns)
+        conn.execute(text(
+            f"UPDATE {table} t JOIN (SELECT MIN(id) AS keep_id, {sums} FROM {table} "
+            f"GROUP BY {keys} HAVING COUNT(*) > 1) d ON t.id = d.keep_id "
+            f"SET " + ", ".join(f"t.{column} = d.{column}" for column in sum_columns)
+        ))
+
+    for child_table, foreign_key in CHILD_TABLES.get(table, []):
+        conn.execute(text(
+            f"UPDATE {child_table} c JOIN {table} t ON c.{foreign_key} = t.id "
+            f"JOIN {duplicates} d ON {join_on} AND t.id <> d.keep_id "
+            f"SET c.{foreign_key} = d.keep_id"
+        ))
+
+    result = conn.execute(text(
+        f"DELETE t FROM {table} t JOIN {duplicates} d ON {join_on} AND t.id <> d.keep_id"
+    ))
+    if result.rowcount:
+        print(f"{table}: merged {result.rowcount} duplicate rows")
+
+
+def add_snapshot_date(conn, table):
+    columns = {column["name"]: column for column in inspect(conn).get_columns(table)}
+    if "snapshot_date" not in columns:
+        print(f"{table}: adding snapshot_date")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN snapshot_date DATE NULL"))
+
+    # Backfill from the row's creation time (stored in UTC)
+    conn.execute(text(
+        f"UPDATE {table} SET snapshot_date = COALESCE(DATE(created_ts), UTC_DATE()) WHERE snapshot_date IS NULL"
+    ))
+
+    if "snapshot_date" not in columns or columns["snapshot_date"]["nullable"]:
+        conn.execute(text(f"ALTER TABLE {table} MODIFY snapshot_date DATE NOT NULL"))
+
+
+def add_account_id(conn, table, index_name):
+    columns = {column["name"] for column in inspect(conn).get_columns(table)}
+    if "account_id" not in columns:
+        print(f"{table}: adding account_id")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN account_id VARCHAR(255) NULL"))
+
+    if PKM_INSTAGRAM_ACCOUNT_ID:
+        conn.execute(
+            text(f"UPDATE {table} SET account_id = :account_id WHERE account_id IS NULL"),
+            {"account_id": PKM_INSTAGRAM_ACCOUNT_ID},
+        )
+
+    if index_name not in _index_names(conn, table):
+        conn.execute(text(f"CREATE INDEX {index_name} ON {table} (account_id)"))
+
+
+def add_columns(conn, table, added):
+    columns = {column["name"] for column in inspect(conn).get_columns(table)}
+    for name, ddl_type in added:
+        if name not in columns:
+            print(f"{table}: adding {name}")
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+
+
+def _index_names(conn, table):
+    names = {constraint["name"] for constraint in inspect(conn).get_unique_constraints(table)}
+    return names | {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def drop_keys(conn, table, names):
+    for name in names:
+        if name in _index_names(conn, table):
+            print(f"{table}: dropping key {name}")
+            conn.execute(text(f"DROP INDEX {name} ON {table}"))
+
+
+def add_unique_key(conn, table, name, key_columns):
+    if name in _index_names(conn, table):
+        return
+    print(f"{table}: creating unique key {name} ({', '.join(key_columns)})")
+    conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {table} ({', '.join(key_columns)})"))
+
+
+def migrate():
+    with engine.begin() as conn:
+        tables = set(inspect(conn).get_table_names())
+
+        for table, index_name in ACCOUNT_TABLES.items():
+            if table in tables:
+                add_account_id(conn, table, index_name)
+        for table, added in ADDED_COLUMNS.items():
+            if table in tables:
+                add_columns(conn, table, added)
+        for table, names in DROPPED_KEYS.items():
+            if table in tables:
+                drop_keys(conn, table, names)
+
+        # Posts first: merging them repoints insights, which may then collide per day
+        if "social_posts" in tables:
+            merge_duplicates(conn, "social_posts", ["post_id"], [])
+            add_unique_key(conn, "social_posts", "uq_posts_post_id", ["post_id"])
+
+        # Profile before the demographic tables for the same reason
+        for table, (name, key_columns, sum_columns) in SNAPSHOT_TABLES.items():
+            if table not in tables:
+                continue
+            add_snapshot_date(conn, table)
+            merge_duplicates(conn, table, key_columns, sum_columns)
+            add_unique_key(conn, table, name, key_columns)
+
+
+if __name__ == "__main__":
+    migrate()
+    print("Migration complete.")
@@ -1,26 +1,48 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Date, Boolean, ForeignKey, UniqueConstraint, Index, func
 from sqlalchemy.orm import relationship
 from database.database import Base
 
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+class Account(Base):
+    __tablename__ = "social_accounts"
+
+    account_id = Column(String(255), primary_key=True)  # Instagram business account id
+    name = Column(String(255))
+    access_token = Column(Text, nullable=False)
+    long_lived_token = Column(Text)
+    token_expires_at = Column(DateTime)
+    is_active = Column(Boolean, nullable=False, default=True)
+    max_concurrency = Column(Integer, nullable=False, default=10)  # concurrent Graph calls for this account
+    created_ts = Column(DateTime, default=utc_now)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
 class SocialMedia(Base):
     __tablename__ = 'social_profile'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    account_id = Column(String(255), index=True)
     username = Column(String(255))
     followers = Column(Integer)
     impressions = Column(Integer)
     reach = Column(Integer)
     accounts_engaged = Column(Integer)
     website_clicks = Column(Integer)
-    created_ts = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_ts = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
-
+    snapshot_date = Column(Date, nullable=False, default=utc_today)
+    created_ts = Column(DateTime, default=utc_now)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
 
     engaged_audience_ages = relationship("EngagedAudienceAge", back_populates="social_profile", cascade="all, delete-orphan")
     engaged_audience_genders = relationship("EngagedAudienceGender", back_populates="social_profile", cascade="all, delete-orphan")
     engaged_audience_locations = relationship("EngagedAudienceLocation", back_populates="social_profile", cascade="all, delete-orphan")
 
+    __table_args__ = (UniqueConstraint("account_id", "snapshot_date", name="uq_profile_account_day"),)
+
 class EngagedAudienceAge(Base):
     __tablename__ = "social_engaged_audience_age"
 
@@ -28,11 +50,14 @@ class EngagedAudienceAge(Base):
     socialmedia_id = Column(Integer, ForeignKey("social_profile.id"), nullable=False)
     age_group = Column(String(50), nullable=False)
     count = Column(Integer, nullable=False)
-    created_ts = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_ts = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    snapshot_date = Column(Date, nullable=False, default=utc_today)
+    created_ts = Column(DateTime, default=utc_now)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
 
     social_profile = relationship("SocialMedia", back_populates="engaged_audience_ages")
 
+    __table_args__ = (UniqueConstraint("socialmedia_id", "age_group", "snapshot_date", name="uq_audience_age_day"),)
+
 class EngagedAudienceGender(Base):
     __tablename__ = "social_engaged_audience_gender"
 
@@ -40,11 +65,14 @@ class EngagedAudienceGender(Base):
     socialmedia_id = Column(Integer, ForeignKey("social_profile.id"), nullable=False)
     gender = Column(String(10), nullable=False)
     count = Column(Integer, nullable=False)
-    created_ts = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_ts = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    snapshot_date = Column(Date, nullable=False, default=utc_today)
+    created_ts = Column(DateTime, default=utc_now)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
 
     social_profile = relationship("SocialMedia", back_populates="engaged_audience_genders")
 
+    __table_args__ = (UniqueConstraint("socialmedia_id", "gender", "snapshot_date", name="uq_audience_gender_day"),)
+
 class EngagedAudienceLocation(Base):
     __tablename__ = "social_engaged_audience_location"
 
@@ -52,25 +80,45 @@ class EngagedAudienceLocation(Base):
     socialmedia_id = Column(Integer, ForeignKey("social_profile.id"), nullable=False)
     city = Column(String(255), nullable=False)
     count = Column(Integer, nullable=False)
-    created_ts = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_ts = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    snapshot_date = Column(Date, nullable=False, default=utc_today)
+    created_ts = Column(DateTime, default=utc_now)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
 
 
     social_profile = relationship("SocialMedia", back_populates="engaged_audience_locations")
 
+    __table_args__ = (UniqueConstraint("socialmedia_id", "city", "snapshot_date", name="uq_audience_city_day"),)
+
 class Posts(Base):
     __tablename__ = "social_posts"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     post_id = Column(String(255), nullable=False)
+    account_id = Column(String(255), index=True)
     media_type = Column(String(50))
     media_url = Column(Text)
+    media_hash = Column(String(64))  # sha256 of the mirrored file in the local media cache
+    media_checked_ts = Column(DateTime)  # last mirroring attempt
+    media_failures = Column(Integer, nullable=False, default=0)  # failed mirroring attempts since media_url last changed
     post_created = Column(DateTime)
-    created_ts = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_ts = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_ts = Column(DateTime, default=utc_now)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
 
     social_postinsights = relationship("PostInsights", back_populates="social_posts", cascade="all, delete-orphan")
 
+    __table_args__ = (UniqueConstraint("post_id", name="uq_posts_post_id"),)
+
+class MediaObject(Base):
+    __tablename__ = "social_media_objects"
+
+    sha256 = Column(String(64), primary_key=True)  # content address of the file under MEDIA_CACHE_DIR
+    content_type = Column(String(100))
+    size_bytes = Column(Integer, nullable=False)
+    width = Column(Integer)
+    height = Column(Integer)
+    has_thumbnail = Column(Boolean, nullable=False, default=False)
+    created_ts = Column(DateTime, default=utc_now)
+
 class PostInsights(Base):
     __tablename__ = "social_postinsights"
 
@@ -79,7 +127,115 @@ class PostInsights(Base):
     reach = Column(Integer)
     likes = Column(Integer)
     saves = Column(Integer)
-    created_ts = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_ts = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
-
-    social_posts = relationship("Posts", back_populates="social_postinsights")
\ No newline at end of file
+    snapshot_date = Column(Date, nullable=False, default=utc_today)
+    created_ts = Column(DateTime, default=utc_now)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+    social_posts = relationship("Posts", back_populates="social_postinsights")
+
+    __table_args__ = (UniqueConstraint("posts_id", "snapshot_date", name="uq_postinsights_post_day"),)
+
+class PostRunningTotal(Base):
+    __tablename__ = "social_post_totals"
+
+    posts_id = Column(Integer, ForeignKey("social_posts.id", ondelete="CASCADE"), primary_key=True)
+    reach = Column(Integer, nullable=False, default=0)
+    likes = Column(Integer, nullable=False, default=0)
+    saves = Column(Integer, nullable=False, default=0)
+    fingerprint = Column(BigInteger)  # of (likes, reach, saves), to skip writes for unchanged posts
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class PostRefreshSchedule(Base):
+    __tablename__ = "social_post_refresh"
+
+    posts_id = Column(Integer, ForeignKey("social_posts.id", ondelete="CASCADE"), primary_key=True)
+    account_id = Column(String(255), nullable=False)
+    next_due_ts = Column(DateTime, nullable=False)  # UTC; the post's metrics are refetched once this passes
+    interval_seconds = Column(Integer, nullable=False)
+    unchanged_streak = Column(Integer, nullable=False, default=0)  # refreshes in a row that changed nothing
+    last_refreshed_ts = Column(DateTime)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+    __table_args__ = (Index("ix_post_refresh_account_due", "account_id", "next_due_ts"),)
+
+class AccountRunningTotal(Base):
+    __tablename__ = "social_profile_totals"
+
+    account_id = Column(String(255), primary_key=True)
+    followers = Column(Integer, nullable=False, default=0)
+    reach = Column(Integer, nullable=False, default=0)
+    accounts_engaged = Column(Integer, nullable=False, default=0)
+    website_clicks = Column(Integer, nullable=False, default=0)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class DemographicRunningTotal(Base):
+    __tablename__ = "social_engaged_audience_totals"
+
+    socialmedia_id = Column(Integer, ForeignKey("social_profile.id", ondelete="CASCADE"), primary_key=True)
+    breakdown = Column(String(10), primary_key=True)
+    dimension_value = Column(String(255), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class SyncState(Base):
+    __tablename__ = "social_sync_state"
+
+    account_id = Column(String(255), primary_key=True)
+    last_post_id = Column(String(255))
+    last_post_created = Column(DateTime)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class Lease(Base):
+    __tablename__ = "social_leases"
+
+    name = Column(String(255), primary_key=True)  # e.g. sync:<account_id>, token:<account_id>
+    owner = Column(String(255), nullable=False)  # host:pid:nonce of the worker holding it
+    expires_at = Column(DateTime, nullable=False)  # database clock, UTC; an expired lease can be taken over
+    acquired_ts = Column(DateTime)
+
+class SyncCheckpoint(Base):
+    __tablename__ = "social_sync_checkpoints"
+
+    account_id = Column(String(255), primary_key=True)  # one unfinished posts sync per account
+    cursor = Column(Text)  # URL of the oldest /media page not fully stored, without the access token
+    full_resync = Column(Boolean, nullable=False, default=False)
+    newest_post = Column(Text)  # JSON id/timestamp of the first post listed, the next high-water mark
+    created_ts = Column(DateTime, default=utc_now)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class SyncCheckpointPost(Base):
+    __tablename__ = "social_sync_checkpoint_posts"
+
+    account_id = Column(String(255), primary_key=True)
+    post_id = Column(String(255), primary_key=True)
+    status = Column(String(10), nullable=False)  # done, failed or parked (gave up after SYNC_MAX_POST_ATTEMPTS)
+    media = Column(Text)  # JSON /media item, so a failure is retried without re-listing
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class PostRollup(Base):
+    __tablename__ = "social_post_rollups"
+
+    posts_id = Column(Integer, ForeignKey("social_posts.id", ondelete="CASCADE"), primary_key=True)
+    period = Column(String(5), primary_key=True)  # day, week or month
+    period_start = Column(Date, primary_key=True)
+    reach = Column(Integer, nullable=False, default=0)
+    likes = Column(Integer, nullable=False, default=0)
+    saves = Column(Integer, nullable=False, default=0)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class AccountRollup(Base):
+    __tablename__ = "social_profile_rollups"
+
+    account_id = Column(String(255), primary_key=True)
+    period = Column(String(5), primary_key=True)  # day, week or month
+    period_start = Column(Date, primary_key=True)
+    post_reach = Column(Integer, nullable=False, default=0)
+    likes = Column(Integer, nullable=False, default=0)
+    saves = Column(Integer, nullable=False, default=0)
+    followers = Column(Integer, nullable=False, default=0)
+    reach = Column(Integer, nullable=False, default=0)
+    accounts_engaged = Column(Integer, nullable=False, default=0)
+    website_clicks = Column(Integer, nullable=False, default=0)
+    updated_ts = Column(DateTime, default=utc_now, onupdate=utc_now)
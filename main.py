@@ -1,12 +1,15 @@
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from routers.routers import router
-from database.database import Base, engine
+from database.database import Base, engine, async_engine
 from utilities.fetch_posts_helper import startup_event, shutdown_event
+from utilities.metrics import instrument_engine
 
 load_dotenv()
 
 app = FastAPI(title = "Instagram Insights", on_startup=[startup_event], on_shutdown=[shutdown_event])
 
 app.include_router(router, prefix='/api')
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine, "async")
 Base.metadata.create_all(bind=engine)
\ No newline at end of file
@@ -1,16 +1,27 @@
 import os
 import traceback
-from datetime import datetime, timezone
-import requests
-from sqlalchemy import func
+from datetime import date, datetime, timezone
+from typing import Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv, set_key
-from fastapi import APIRouter,HTTPException, status, Depends
-from fastapi.responses import JSONResponse
-from database.models import SocialMedia, EngagedAudienceAge, EngagedAudienceGender, EngagedAudienceLocation, PostInsights,Posts
-from utilities.access_token import refresh_access_token, is_access_token_expired, generate_new_long_lived_token
-from database.database import get_db
-from utilities.fetch_posts_helper import process_posts_async, store_posts_and_metrics, get_posts_async
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+from fastapi import APIRouter,HTTPException, status, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse, FileResponse, RedirectResponse
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from database.models import SocialMedia, Posts
+from database.database import get_db, get_async_db
+from utilities.running_totals import get_account_totals, set_account_totals
+from utilities.demographics_writer import store_demographics
+from utilities.rollups import PERIODS, add_account_deltas, get_account_rollups, get_post_rollups
+from utilities.sync_jobs import sync_jobs
+from utilities.graph_batch import graph_batch_async, GraphBatchError
+from utilities.rate_limiter import governors_state, use_account_governor
+from utilities.accounts import resolve_account_id, get_token_manager, account_concurrency
+from utilities.graph_client import current_token_manager
+from utilities.export import EXPORT_FORMATS, export_chunks, post_insights_query, demographics_query
+from utilities.running_totals import DEMOGRAPHIC_TABLES
+from utilities.media_cache import is_media_hash, media_path, get_media_object
 
 router = APIRouter()
 
@@ -21,68 +32,40 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 DB_HOST = os.getenv("DB_HOST")
 BASE_URL = os.getenv("BASE_URL")
-PKM_ACCESS_TOKEN = os.getenv("PKM_ACCESS_TOKEN")
 PKM_INSTAGRAM_ACCOUNT_ID = os.getenv("PKM_INSTAGRAM_ACCOUNT_ID")
-APP_ID = os.getenv("META_APP_ID")
-APP_SECRET = os.getenv("META_APP_SECRET")
-LONG_LIVED_TOKEN = os.getenv("LONG_LIVED_TOKEN")
 
 @router.get("/fetch_insights_pkm")
-def fetch_insights_pkm(db: Session = Depends(get_db)):
+async def fetch_insights_pkm(account_id: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     """
     Fetch a summarized version of Instagram insights, showing only important metrics.
     Automatically refreshes access token if needed.
+    Defaults to the .env account; pass `account_id` for any registered account.
     """
     try:
-        global PKM_ACCESS_TOKEN
-
-        # Refresh the short-lived token
-        if is_access_token_expired(PKM_ACCESS_TOKEN):
-            try:
-                refreshed_token = refresh_access_token(APP_ID, APP_SECRET, LONG_LIVED_TOKEN)
-                set_key('.env', 'PKM_ACCESS_TOKEN', refreshed_token)
-                load_dotenv()
-                PKM_ACCESS_TOKEN = os.getenv("PKM_ACCESS_TOKEN")
-            except Exception as e:
-                try:
-                    new_long_lived_token = generate_new_long_lived_token()
-                    set_key('.env', 'LONG_LIVED_TOKEN', new_long_lived_token)
-                    load_dotenv()
-                    new_pkm_access_token = refresh_access_token(APP_ID, APP_SECRET, new_long_lived_token)
-                    set_key('.env', 'PKM_ACCESS_TOKEN', new_pkm_access_token)
-                    load_dotenv()
-                    PKM_ACCESS_TOKEN = os.getenv("PKM_ACCESS_TOKEN")
-                except Exception as gen_error:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail=f"Failed to generate new long-lived token: {str(gen_error)}"
-                    )
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to refresh access token: {str(e)}"
-                )
-
-        # Fetch Instagram account details
-        account_url = f"{BASE_URL}{PKM_INSTAGRAM_ACCOUNT_ID}?fields=id,username,followers_count&access_token={PKM_ACCESS_TOKEN}"
-        account_response = requests.get(account_url, timeout=120)
-
-        if account_response.status_code != 200:
-            raise HTTPException(
-                status_code=account_response.status_code,
-                detail=f"Failed to fetch account details: {account_response.text}"
-            )
-        account_data = account_response.json()
+        account_id = await db.run_sync(resolve_account_id, account_id)
+        use_account_governor(account_id, await db.run_sync(account_concurrency, account_id))
 
-        # Fetch insights
-        insights_url = f"{BASE_URL}{PKM_INSTAGRAM_ACCOUNT_ID}/insights?metric=reach,accounts_engaged,website_clicks&period=day&metric_type=total_value&access_token={PKM_ACCESS_TOKEN}"
-        insights_response = requests.get(insights_url, timeout=120)
+        # Cached per-account token; only refreshes when close to expiry
+        token_manager = await db.run_sync(get_token_manager, account_id)
+        current_token_manager.set(token_manager)
+        access_token = await token_manager.get_token()
 
-        if insights_response.status_code != 200:
+        # Fetch account details and insights in one batch request
+        account_data, insights_data = await graph_batch_async([
+            f"{account_id}?fields=id,username,followers_count",
+            f"{account_id}/insights?metric=reach,accounts_engaged,website_clicks&period=day&metric_type=total_value",
+        ], access_token)
+
+        if isinstance(account_data, GraphBatchError):
+            raise HTTPException(
+                status_code=account_data.status_code,
+                detail=f"Failed to fetch account details: {account_data.detail}"
+            )
+        if isinstance(insights_data, GraphBatchError):
             raise HTTPException(
-                status_code=insights_response.status_code,
-                detail=f"Failed to fetch insights: {insights_response.text}"
+                status_code=insights_data.status_code,
+                detail=f"Failed to fetch insights: {insights_data.detail}"
             )
-        insights_data = insights_response.json()
 
         # Extract insights
         reach, accounts_engaged, website_clicks = None, None, None
@@ -103,31 +86,22 @@ def fetch_insights_pkm(db: Session = Depends(get_db)):
             "website_clicks": website_clicks,
         }
 
-        # Calculate the sum of existing records
-        existing_sums = db.query(
-            func.sum(SocialMedia.followers).label("total_followers"),
-            func.sum(SocialMedia.reach).label("total_reach"),
-            func.sum(SocialMedia.accounts_engaged).label("total_accounts_engaged"),
-            func.sum(SocialMedia.website_clicks).label("total_website_clicks"),
-        ).first()
-
-        # Extract values or default to 0
-        total_followers = existing_sums.total_followers or 0
-        total_reach = existing_sums.total_reach or 0
-        total_accounts_engaged = existing_sums.total_accounts_engaged or 0
-        total_website_clicks = existing_sums.total_website_clicks or 0
-
-        # Calculate the differences (new data - sum of existing records)
-        new_followers = result["followers_count"] - total_followers
-        new_reach = result["reach"] - total_reach
-        new_accounts_engaged = result["accounts_engaged"] - total_accounts_engaged
-        new_website_clicks = result["website_clicks"] - total_website_clicks
+        # Last known cumulative values for the account
+        totals = await db.run_sync(get_account_totals, account_id)
+
+        # Calculate the differences (new data - last known cumulative values)
+        new_followers = result["followers_count"] - totals["followers"]
+        new_reach = result["reach"] - totals["reach"]
+        new_accounts_engaged = result["accounts_engaged"] - totals["accounts_engaged"]
+        new_website_clicks = result["website_clicks"] - totals["website_clicks"]
 
         # Get today's date in UTC
         today_date = datetime.now(timezone.utc).date()
 
         # Check if a record for today already exists
-        existing_record = db.query(SocialMedia).filter(func.date(SocialMedia.created_ts) == today_date).first()
+        existing_record = (await db.execute(
+            select(SocialMedia).where(SocialMedia.account_id == account_id, SocialMedia.snapshot_date == today_date)
+        )).scalars().first()
 
         if existing_record:
             # Update today's record with calculated differences
@@ -136,237 +110,300 @@ def fetch_insights_pkm(db: Session = Depends(get_db)):
             existing_record.accounts_engaged += new_accounts_engaged
             existing_record.website_clicks += new_website_clicks
             existing_record.updated_ts = datetime.now(timezone.utc)
-            db.commit()
-            db.refresh(existing_record)
         else:
             # Insert a new record with calculated differences
             socialmedia_analytics = SocialMedia(
+                account_id=account_id,
                 username=result["username"],
                 followers=new_followers,
                 reach=new_reach,
                 accounts_engaged=new_accounts_engaged,
                 website_clicks=new_website_clicks,
+                snapshot_date=today_date,
                 created_ts=datetime.now(timezone.utc),
                 updated_ts=datetime.now(timezone.utc),
             )
             db.add(socialmedia_analytics)
-            db.commit()
-            db.refresh(socialmedia_analytics)
+
+        # Store the new cumulative values in the same transaction as the delta row
+        await db.run_sync(
+            set_account_totals,
+            account_id,
+            followers=result["followers_count"],
+            reach=result["reach"],
+            accounts_engaged=result["accounts_engaged"],
+            website_clicks=result["website_clicks"],
+        )
+        await db.run_sync(
+            add_account_deltas,
+            account_id,
+            today_date,
+            followers=new_followers,
+            reach=new_reach,
+            accounts_engaged=new_accounts_engaged,
+            website_clicks=new_website_clicks,
+        )
+        await db.commit()
 
         return JSONResponse(content=result)
 
     except HTTPException as e:
-        db.rollback()
+        await db.rollback()
         traceback.print_exc()
         return JSONResponse(status_code=e.status_code, content={"error": e.detail})
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         traceback.print_exc()
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"error": "Something went wrong."})
 
 
 @router.get("/engaged_audience_demographics")
-def engaged_audience_demographics(db: Session = Depends(get_db)):
+async def engaged_audience_demographics(account_id: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     try:
-        global PKM_ACCESS_TOKEN
-
-        # Refresh the short-lived token
-        if is_access_token_expired(PKM_ACCESS_TOKEN):
-            try:
-                refreshed_token = refresh_access_token(APP_ID, APP_SECRET, LONG_LIVED_TOKEN)
-                set_key('.env', 'PKM_ACCESS_TOKEN', refreshed_token)
-                load_dotenv()  # Reload the updated .env file
-                PKM_ACCESS_TOKEN = os.getenv("PKM_ACCESS_TOKEN")  # Get updated token
-            except Exception as e:
-                try:
-                    new_long_lived_token = generate_new_long_lived_token()
-                    set_key('.env', 'LONG_LIVED_TOKEN', new_long_lived_token)
-                    load_dotenv()  # Reload the updated .env file
-                    PKM_ACCESS_TOKEN = refresh_access_token(APP_ID, APP_SECRET, new_long_lived_token)
-                    set_key('.env', 'PKM_ACCESS_TOKEN', PKM_ACCESS_TOKEN)
-                    load_dotenv()  # Reload the updated .env file
-                except Exception as gen_error:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail=f"Failed to generate new long-lived token: {str(gen_error)}"
-                    )
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to refresh access token: {str(e)}"
-                )
-
-        # Define the API URLs
-        insights_url = f"{BASE_URL}{PKM_INSTAGRAM_ACCOUNT_ID}/insights"
-        params = {
-            "metric": "engaged_audience_demographics",
-            "period": "lifetime",
-            "timeframe": "this_week",
-            "metric_type": "total_value",
-            "access_token": PKM_ACCESS_TOKEN,
-        }
-
-        # Fetch demographic data by breakdown types
-        age_response = requests.get(insights_url, params={**params, "breakdown": "age"}, timeout=120)
-        gender_response = requests.get(insights_url, params={**params, "breakdown": "gender"}, timeout=120)
-        city_response = requests.get(insights_url, params={**params, "breakdown": "city"}, timeout=120)
+        account_id = await db.run_sync(resolve_account_id, account_id)
+        use_account_governor(account_id, await db.run_sync(account_concurrency, account_id))
+
+        # Cached per-account token; only refreshes when close to expiry
+        token_manager = await db.run_sync(get_token_manager, account_id)
+        current_token_manager.set(token_manager)
+        access_token = await token_manager.get_token()
+
+        # Fetch demographic data for every breakdown type in one batch request
+        insights_url = (
+            f"{account_id}/insights?metric=engaged_audience_demographics"
+            "&period=lifetime&timeframe=this_week&metric_type=total_value"
+        )
+        age_data, gender_data, city_data = await graph_batch_async([
+            f"{insights_url}&breakdown=age",
+            f"{insights_url}&breakdown=gender",
+            f"{insights_url}&breakdown=city",
+        ], access_token)
 
-        if age_response.status_code != 200:
+        if isinstance(age_data, GraphBatchError):
             raise HTTPException(
-                status_code=age_response.status_code,
-                detail=f"Failed to fetch engaged audience age group: {age_response.text}"
+                status_code=age_data.status_code,
+                detail=f"Failed to fetch engaged audience age group: {age_data.detail}"
             )
 
-        if gender_response.status_code != 200:
+        if isinstance(gender_data, GraphBatchError):
             raise HTTPException(
-                status_code=gender_response.status_code,
-                detail=f"Failed to fetch engaged audience gender distribution: {gender_response.text}"
+                status_code=gender_data.status_code,
+                detail=f"Failed to fetch engaged audience gender distribution: {gender_data.detail}"
             )
 
-        if city_response.status_code != 200:
+        if isinstance(city_data, GraphBatchError):
             raise HTTPException(
-                status_code=city_response.status_code,
-                detail=f"Failed to fetch engaged audience city distribution: {city_response.text}"
+                status_code=city_data.status_code,
+                detail=f"Failed to fetch engaged audience city distribution: {city_data.detail}"
             )
 
-        # Parse the response data
-        age_data = age_response.json()
-        gender_data = gender_response.json()
-        city_data = city_response.json()
-
         today_date = datetime.now(timezone.utc).date()
-        socialmedia_entry = (
-            db.query(SocialMedia)
-            .filter(func.date(SocialMedia.created_ts) == today_date)
-            .order_by(SocialMedia.created_ts.desc())
-            .first()
-        )
+        socialmedia_entry = (await db.execute(
+            select(SocialMedia).where(SocialMedia.account_id == account_id, SocialMedia.snapshot_date == today_date)
+        )).scalars().first()
         if not socialmedia_entry:
             raise HTTPException(status_code=404, detail="Social media record not found.")
 
         socialmedia_id = socialmedia_entry.id
 
-        # Helper function to process and store data
-        def process_and_store_data(data, breakdown_type, table_model, attribute_name):
-            processed_data = []
-            for item in data.get("data", []):
-                if item.get("name") == "engaged_audience_demographics" and "total_value" in item:
-                    breakdowns = item["total_value"].get("breakdowns", [])
-                    for breakdown in breakdowns:
-                        if "results" in breakdown:
-                            for result in breakdown["results"]:
-                                dimension_values = result.get("dimension_values", [])
-                                new_count = result.get("value")
-
-                                if dimension_values:
-                                    value = dimension_values[0]
-
-                                    # Fetch the sum of all existing counts for this dimension (across all records)
-                                    existing_total = db.query(func.sum(table_model.count)).filter(
-                                        table_model.socialmedia_id == socialmedia_id,
-                                        getattr(table_model, attribute_name) == value
-                                    ).scalar() or 0
-
-
-                                    # Calculate the difference: new_count - existing_total
-                                    count_difference = new_count - existing_total
-
-                                    # Fetch the existing entry for the current day
-                                    existing_entry = db.query(table_model).filter(
-                                        table_model.socialmedia_id == socialmedia_id,
-                                        getattr(table_model, attribute_name) == value,
-                                        func.date(table_model.created_ts) == func.current_date()
-                                    ).first()
-
-                                    if existing_entry:
-                                        existing_entry.count += count_difference
-                                        existing_entry.updated_ts = datetime.now(timezone.utc)  # Update timestamp
-                                        db.commit()
-                                        db.refresh(existing_entry)
-                                    else:
-                                        # Create a new record if none exists
-                                        instance = table_model(
-                                            socialmedia_id=socialmedia_id,
-                                            **{attribute_name: value},
-                                            count=count_difference,
-                                            created_ts=datetime.now(timezone.utc),
-                                            updated_ts=datetime.now(timezone.utc),
-                                        )
-                                        db.add(instance)
-
-                                    # Append the processed data
-                                    processed_data.append({
-                                        attribute_name: value,
-                                        "count": new_count
-                                    })
-            db.commit()
-            return processed_data
-
-        # Process and store age, gender, and city distributions
-        age_group = process_and_store_data(age_data, "age", EngagedAudienceAge, "age_group")
-        gender_distribution = process_and_store_data(gender_data, "gender", EngagedAudienceGender, "gender")
-        city_distribution = process_and_store_data(city_data, "city", EngagedAudienceLocation, "city")
+        # Store age, gender, and city distributions in a single transaction
+        stored, timings = await db.run_sync(store_demographics, socialmedia_id, {
+            "age": age_data,
+            "gender": gender_data,
+            "city": city_data,
+        })
 
         # Prepare the final result
         result = {
-            "age_group": age_group,
-            "gender_distribution": gender_distribution,
-            "city_distribution": city_distribution
+            "age_group": stored["age"],
+            "gender_distribution": stored["gender"],
+            "city_distribution": stored["city"],
+            "timings_ms": timings,
         }
 
         return result
 
     except HTTPException as e:
-        db.rollback()
+        await db.rollback()
         traceback.print_exc()
         return JSONResponse(status_code=e.status_code, content={"error": e.detail})
     except Exception:
-        db.rollback()
+        await db.rollback()
         traceback.print_exc()
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"error": "Something went wrong."})
 
 @router.get("/fetch_all_posts")
-async def fetch_all_posts(db: Session = Depends(get_db)):
+async def fetch_all_posts(
+    full_resync: bool = False, account_id: Optional[str] = None, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Start a background posts sync and return its job id immediately.
+    If a sync for the account is already running, the caller is attached to that job instead.
+    """
     try:
-        global PKM_ACCESS_TOKEN
-
-        # Refresh the short-lived token if expired
-        if is_access_token_expired(PKM_ACCESS_TOKEN):
-            try:
-                refreshed_token = refresh_access_token(APP_ID, APP_SECRET, LONG_LIVED_TOKEN)
-                os.environ["PKM_ACCESS_TOKEN"] = refreshed_token
-                PKM_ACCESS_TOKEN = refreshed_token
-            except Exception:
-                new_long_lived_token = generate_new_long_lived_token()
-                os.environ["LONG_LIVED_TOKEN"] = new_long_lived_token
-                PKM_ACCESS_TOKEN = refresh_access_token(APP_ID, APP_SECRET, new_long_lived_token)
-                os.environ["PKM_ACCESS_TOKEN"] = PKM_ACCESS_TOKEN
-
-        # Fetch all posts
-        all_posts = []
-        posts_url = f"{BASE_URL}{PKM_INSTAGRAM_ACCOUNT_ID}/media"
-        params = {
-            "fields": "id,media_type,media_url,timestamp",
-            "access_token": PKM_ACCESS_TOKEN,
-            "limit": 100,
-        }
-
-        MAX_PAGES = 100  # Prevent infinite loops
-        while posts_url and len(all_posts) < MAX_PAGES * params["limit"]:
-            response = await get_posts_async(posts_url, params)
-            all_posts.extend(response.get("data", []))
-            posts_url = response.get("paging", {}).get("next")
-
-        if not all_posts:
-            return JSONResponse(content={"message": "No posts found."})
+        job, created = sync_jobs.start(await db.run_sync(resolve_account_id, account_id), full_resync)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"job_id": job.job_id, "status": job.status, "attached": not created},
+        )
 
-        # Process posts asynchronously
-        metrics = await process_posts_async(all_posts, PKM_ACCESS_TOKEN)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-        # Store in database
-        store_posts_and_metrics(all_posts, metrics, db)
 
-        return JSONResponse(content={"message": "Successfully fetched all posts and metrics."})
+@router.get("/sync_all_accounts")
+async def sync_all_accounts(full_resync: bool = False, db: AsyncSession = Depends(get_async_db)):
+    """
+    Start a background posts sync for every active account.
+    Accounts beyond SYNC_MAX_CONCURRENT_ACCOUNTS stay queued until a running sync finishes.
+    """
+    try:
+        jobs = await sync_jobs.start_all(db, full_resync)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=[
+                {"account_id": job.account_id, "job_id": job.job_id, "status": job.status, "attached": not created}
+                for job, created in jobs
+            ],
+        )
 
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@router.get("/sync_jobs/{job_id}")
+async def sync_job_status(job_id: str):
+    """
+    Progress of a background posts sync.
+    """
+    job = sync_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Sync job not found.")
+    return JSONResponse(content=job.to_dict())
+
+
+@router.get("/rollups/account")
+def account_rollups(
+    period: str = "week", start: Optional[date] = None, end: Optional[date] = None,
+    account_id: Optional[str] = None, db: Session = Depends(get_db),
+):
+    """
+    Account reach, likes, saves and follower growth per day, week or month, served from the rollup table.
+    """
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(PERIODS)}")
+    return JSONResponse(content=get_account_rollups(db, resolve_account_id(db, account_id), period, start, end))
+
+
+@router.get("/rollups/posts/{post_id}")
+def post_rollups(
+    post_id: str, period: str = "week", start: Optional[date] = None, end: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Reach, likes and saves of one post per day, week or month, served from the rollup table.
+    """
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(PERIODS)}")
+    post = db.query(Posts.id).filter(Posts.post_id == post_id).first()
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found.")
+    return JSONResponse(content=get_post_rollups(db, post.id, period, start, end))
+
+
+def _export_response(statement, export_format, filename):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    return StreamingResponse(
+        export_chunks(statement, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
+
+
+@router.get("/export/post_insights")
+def export_post_insights(
+    format: str = "ndjson", account_id: Optional[str] = None, start: Optional[date] = None, end: Optional[date] = None,
+    after_id: Optional[int] = None, limit: Optional[int] = None,
+):
+    """
+    Stream daily post insights joined with their posts as NDJSON, CSV or Parquet, ordered by id.
+    Rows are read through a server-side cursor; resume an interrupted export with after_id=<last id>.
+    """
+    return _export_response(post_insights_query(account_id, start, end, after_id, limit), format, "post_insights")
+
+
+@router.get("/export/demographics/{breakdown}")
+def export_demographics(
+    breakdown: str, format: str = "ndjson", account_id: Optional[str] = None,
+    start: Optional[date] = None, end: Optional[date] = None, after_id: Optional[int] = None, limit: Optional[int] = None,
+):
+    """
+    Stream one engaged-audience breakdown (age, gender or city) as NDJSON, CSV or Parquet, ordered by id.
+    """
+    if breakdown not in DEMOGRAPHIC_TABLES:
+        raise HTTPException(status_code=400, detail=f"breakdown must be one of {', '.join(DEMOGRAPHIC_TABLES)}")
+    statement = demographics_query(breakdown, account_id, start, end, after_id, limit)
+    return _export_response(statement, format, f"demographics_{breakdown}")
+
+
+# Content-addressed: a hash always names the same bytes
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get("/media/{media_hash}")
+def cached_media(media_hash: str, request: Request, thumbnail: bool = False, db: Session = Depends(get_db)):
+    """
+    Serve a mirrored media file (or its JPEG thumbnail) from the local cache.
+    The sha256 is the ETag, so dashboards revalidate with If-None-Match and get 304s.
+    """
+    if not is_media_hash(media_hash):
+        raise HTTPException(status_code=404, detail="Media not found.")
+    etag = f'"{media_hash}{"-thumb" if thumbnail else ""}"'
+    headers = {"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    media = get_media_object(db, media_hash)
+    path = media_path(media_hash, thumbnail)
+    if not media or (thumbnail and not media.has_thumbnail) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Media not found.")
+    media_type = "image/jpeg" if thumbnail else media.content_type or "application/octet-stream"
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+@router.get("/posts/{post_id}/media")
+def post_media(post_id: str, request: Request, thumbnail: bool = False, db: Session = Depends(get_db)):
+    """
+    Redirect to a post's mirrored media, or to its Instagram URL if it has not been mirrored yet.
+    """
+    post = db.query(Posts.media_hash, Posts.media_url).filter(Posts.post_id == post_id).first()
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found.")
+    if post.media_hash:
+        suffix = "?thumbnail=true" if thumbnail else ""
+        return RedirectResponse(f"{request.url_for('cached_media', media_hash=post.media_hash)}{suffix}")
+    if post.media_url:
+        return RedirectResponse(post.media_url)
+    raise HTTPException(status_code=404, detail="Post has no media.")
+
+
+@router.get("/rate_limiter")
+async def rate_limiter_state():
+    """
+    Current state of the shared Graph API rate governor and of each account's governor.
+    """
+    return JSONResponse(content=governors_state())
+
+
+@router.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: Graph latency, retries and throttles, governor slot waits,
+    DB statements per sync stage, pool checkouts and sync throughput.
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
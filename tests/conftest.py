@@ -0,0 +1,77 @@
+import os
+import sys
+import pytest
+
+# Modules read their settings at import; these only need to exist, nothing connects to them
+os.environ.setdefault("DB_USER", "test")
+os.environ.setdefault("DB_PASSWORD", "test")
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_NAME", "test")
+os.environ.setdefault("BASE_URL", "https://graph.test/v21.0/")
+os.environ.setdefault("PKM_INSTAGRAM_ACCOUNT_ID", "17840000000000000")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, literal, literal_column, DateTime
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects.mysql.dml import OnDuplicateClause
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import ClauseElement, ColumnClause
+from database.database import Base
+import database.models  # noqa: F401  registers every table on Base
+from utilities.fingerprints import metric_fingerprints
+
+
+@compiles(OnDuplicateClause, "sqlite")
+def _on_conflict_do_update(clause, compiler, **kw):
+    """
+    The tests run on SQLite: ON DUPLICATE KEY UPDATE becomes ON CONFLICT DO UPDATE,
+    and VALUES(column) reads the excluded row.
+    """
+    def excluded(element):
+        if isinstance(element, ColumnClause) and element.table is clause.inserted_alias:
+            return literal_column(f"excluded.{compiler.preparer.quote(element.name)}")
+        return None
+
+    assignments = []
+    for key, value in clause.update.items():
+        name = getattr(key, "key", key)
+        if isinstance(value, ClauseElement):
+            value = visitors.replacement_traverse(value, {}, excluded)
+        else:
+            value = literal(value)
+        assignments.append(f"{compiler.preparer.quote(name)} = {compiler.process(value.self_group(), **kw)}")
+    return "ON CONFLICT DO UPDATE SET " + ", ".join(assignments)
+
+
+class _MySQLDateTime(sqlite.DATETIME):
+    """
+    Takes 'YYYY-MM-DD' strings the way MySQL does; post_created is written like that.
+    """
+    def bind_processor(self, dialect):
+        process = super().bind_processor(dialect)
+        return lambda value: value if isinstance(value, str) else process(value)
+
+
+def sqlite_engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    engine.dialect.colspecs = {**engine.dialect.colspecs, DateTime: _MySQLDateTime}
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def db():
+    """
+    A session on a fresh in-memory SQLite database with every table created.
+    """
+    engine = sqlite_engine()
+    # Remembers what the previous test's database held
+    metric_fingerprints.clear()
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+    engine.dispose()
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException
+from utilities import accounts
+from utilities.accounts import (
+    list_active_account_ids, resolve_account_id, get_token_manager, register_account, PKM_INSTAGRAM_ACCOUNT_ID,
+)
+from database.models import Account
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(accounts, "token_managers", {})
+    monkeypatch.setattr(accounts, "registry_tokens", {})
+
+
+def test_empty_registry_falls_back_to_the_env_account(db):
+    assert list_active_account_ids(db) == [PKM_INSTAGRAM_ACCOUNT_ID]
+    assert resolve_account_id(db) == PKM_INSTAGRAM_ACCOUNT_ID
+
+
+def test_env_account_is_registered_on_first_use(db, monkeypatch):
+    monkeypatch.setattr(accounts, "PKM_ACCESS_TOKEN", "env-token")
+    monkeypatch.setattr(accounts, "LONG_LIVED_TOKEN", "env-long")
+    manager = get_token_manager(db, PKM_INSTAGRAM_ACCOUNT_ID)
+    assert (manager.access_token, manager.long_lived_token) == ("env-token", "env-long")
+    assert manager.lease_name == f"token:{PKM_INSTAGRAM_ACCOUNT_ID}"
+    assert list_active_account_ids(db) == [PKM_INSTAGRAM_ACCOUNT_ID]
+
+
+def test_env_account_seed_keeps_a_refreshed_token(db, monkeypatch):
+    monkeypatch.setattr(accounts, "PKM_ACCESS_TOKEN", "env-token")
+    register_account(db, PKM_INSTAGRAM_ACCOUNT_ID, "refreshed-token")
+    # Another worker seeding at the same time must not put the .env token back
+    accounts._seed_env_account(db)
+    assert get_token_manager(db, PKM_INSTAGRAM_ACCOUNT_ID).access_token == "refreshed-token"
+
+
+def test_registry_lists_only_active_accounts(db):
+    register_account(db, "111", "token-a")
+    register_account(db, "222", "token-b")
+    db.query(Account).filter(Account.account_id == "222").update({"is_active": False})
+    db.commit()
+    assert list_active_account_ids(db) == ["111"]
+
+
+def test_unregistered_account_is_a_404(db):
+    with pytest.raises(HTTPException) as error:
+        resolve_account_id(db, "999")
+    assert error.value.status_code == 404
+    with pytest.raises(HTTPException) as error:
+        get_token_manager(db, "999")
+    assert error.value.status_code == 404
+
+
+def test_registered_account_gets_its_own_cached_manager(db):
+    register_account(db, "111", "token-a", "long-a")
+    assert resolve_account_id(db, "111") == "111"
+    manager = get_token_manager(db, "111")
+    assert (manager.access_token, manager.long_lived_token) == ("token-a", "long-a")
+    assert get_token_manager(db, "111") is manager
+
+
+def test_manager_is_reloaded_when_the_stored_token_changes(db):
+    register_account(db, "111", "token-a")
+    manager = get_token_manager(db, "111")
+    # Another process refreshed the token and wrote it to the registry
+    db.query(Account).filter(Account.account_id == "111").update({"access_token": "token-b"})
+    db.commit()
+    reloaded = get_token_manager(db, "111")
+    assert reloaded is not manager
+    assert reloaded.access_token == "token-b"
+    assert get_token_manager(db, "111") is reloaded
+
+
+def test_own_refresh_keeps_the_cached_manager(db, monkeypatch):
+    monkeypatch.setattr(accounts, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    register_account(db, "111", "token-a")
+    manager = get_token_manager(db, "111")
+    # What a refresh in this process writes back through persist
+    manager.persist("token-b", None, None)
+    db.expire_all()
+    assert get_token_manager(db, "111") is manager
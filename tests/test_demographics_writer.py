@@ -0,0 +1,58 @@
+from datetime import timedelta
+from database.models import SocialMedia, EngagedAudienceAge, EngagedAudienceGender
+from utilities.demographics_writer import parse_demographics, store_demographics
+
+
+def breakdown(**counts):
+    return {"data": [{
+        "name": "engaged_audience_demographics",
+        "total_value": {"breakdowns": [{"results": [
+            {"dimension_values": [value], "value": count} for value, count in counts.items()
+        ]}]},
+    }]}
+
+
+def profile(db):
+    socialmedia = SocialMedia(username="pkm")
+    db.add(socialmedia)
+    db.commit()
+    return socialmedia.id
+
+
+def age_rows(db):
+    return sorted((row.age_group, row.count) for row in db.query(EngagedAudienceAge))
+
+
+def test_parse_demographics_flattens_the_breakdowns():
+    assert parse_demographics(breakdown(**{"18-24": 5, "25-34": 7})) == {"18-24": 5, "25-34": 7}
+    assert parse_demographics({"data": []}) == {}
+
+
+def test_first_store_writes_the_counts_as_deltas(db):
+    socialmedia_id = profile(db)
+    results, timings = store_demographics(db, socialmedia_id, {
+        "age": breakdown(**{"18-24": 5, "25-34": 7}),
+        "gender": breakdown(F=4),
+    })
+    assert results["age"] == [{"age_group": "18-24", "count": 5}, {"age_group": "25-34", "count": 7}]
+    assert set(timings) == {"age", "gender", "commit"}
+    assert age_rows(db) == [("18-24", 5), ("25-34", 7)]
+    assert [(row.gender, row.count) for row in db.query(EngagedAudienceGender)] == [("F", 4)]
+
+
+def test_same_day_store_accumulates_into_todays_rows(db):
+    socialmedia_id = profile(db)
+    store_demographics(db, socialmedia_id, {"age": breakdown(**{"18-24": 5, "25-34": 7})})
+    store_demographics(db, socialmedia_id, {"age": breakdown(**{"18-24": 9, "25-34": 7, "35-44": 2})})
+    # One row per value and day, holding the day's total increase
+    assert age_rows(db) == [("18-24", 9), ("25-34", 7), ("35-44", 2)]
+
+
+def test_next_day_store_adds_only_the_increment(db):
+    socialmedia_id = profile(db)
+    store_demographics(db, socialmedia_id, {"age": breakdown(**{"18-24": 5})})
+    for row in db.query(EngagedAudienceAge):
+        row.snapshot_date -= timedelta(days=1)
+    db.commit()
+    store_demographics(db, socialmedia_id, {"age": breakdown(**{"18-24": 8})})
+    assert age_rows(db) == [("18-24", 3), ("18-24", 5)]
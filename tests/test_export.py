@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+from datetime import date
+import pytest
+import pyarrow.parquet as pq
+from utilities import export
+from utilities.export import post_insights_query, stream_partitions, export_chunks
+from database.models import Posts, PostInsights
+
+
+@pytest.fixture
+def insights(db, monkeypatch):
+    """
+    Five daily deltas of one post, 1-5 March; exports read through the test database.
+    """
+    monkeypatch.setattr(export, "engine", db.get_bind())
+    post = Posts(post_id="1", account_id="111", media_type="IMAGE")
+    db.add(post)
+    db.flush()
+    for day in range(1, 6):
+        db.add(PostInsights(posts_id=post.id, snapshot_date=date(2024, 3, day), reach=day * 10, likes=day, saves=0))
+    db.commit()
+
+
+def exported_ids(statement, batch_size):
+    return [[row[0] for row in partition] for partition in stream_partitions(statement, batch_size)]
+
+
+def test_rows_are_paged_in_id_order(insights):
+    assert exported_ids(post_insights_query(), batch_size=2) == [[1, 2], [3, 4], [5]]
+
+
+def test_after_id_resumes_after_the_last_exported_row(insights):
+    assert exported_ids(post_insights_query(after_id=3), batch_size=2) == [[4, 5]]
+    assert exported_ids(post_insights_query(after_id=5), batch_size=2) == []
+
+
+def test_filters_combine_with_after_id(insights):
+    statement = post_insights_query(account_id="111", end=date(2024, 3, 4), after_id=1, limit=2)
+    assert exported_ids(statement, batch_size=10) == [[2, 3]]
+    assert exported_ids(post_insights_query(account_id="222"), batch_size=10) == []
+
+
+def test_ndjson_export(insights):
+    lines = b"".join(export_chunks(post_insights_query(after_id=3), "ndjson")).decode().splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [(row["id"], row["post_id"], row["snapshot_date"], row["reach"]) for row in rows] == [
+        (4, "1", "2024-03-04", 40),
+        (5, "1", "2024-03-05", 50),
+    ]
+
+
+def test_csv_export_has_one_header(insights):
+    body = b"".join(export_chunks(post_insights_query(), "csv")).decode()
+    rows = list(csv.reader(io.StringIO(body)))
+    assert rows[0][:3] == ["id", "post_id", "account_id"]
+    assert [row[0] for row in rows[1:]] == ["1", "2", "3", "4", "5"]
+
+
+def test_parquet_export_reads_back(insights):
+    body = b"".join(export_chunks(post_insights_query(after_id=1), "parquet"))
+    table = pq.read_table(io.BytesIO(body))
+    assert table.column("id").to_pylist() == [2, 3, 4, 5]
+    assert table.column("snapshot_date").to_pylist()[0] == date(2024, 3, 2)
@@ -0,0 +1,64 @@
+import json
+import pytest
+from utilities.graph_batch import unpack_batch_response, GraphBatchError
+from utilities.rate_limiter import RateGovernor, current_rate_governor
+
+
+@pytest.fixture
+def governor():
+    governor = RateGovernor(max_rate=50, min_rate=1, max_concurrency=50, min_concurrency=2)
+    token = current_rate_governor.set(governor)
+    yield governor
+    current_rate_governor.reset(token)
+
+
+def sub_response(code, body):
+    return {"code": code, "body": json.dumps(body)}
+
+
+def test_successful_sub_requests_are_decoded_in_order(governor):
+    results = unpack_batch_response(
+        ["1?fields=like_count", "2?fields=like_count"],
+        [sub_response(200, {"like_count": 4}), sub_response(200, {"like_count": 7})],
+    )
+    assert results == [{"like_count": 4}, {"like_count": 7}]
+
+
+def test_null_sub_response_is_a_timeout(governor):
+    (result,) = unpack_batch_response(["1/insights"], [None])
+    assert isinstance(result, GraphBatchError)
+    assert result.status_code == 504
+
+
+def test_failed_sub_request_keeps_status_and_graph_code(governor):
+    (result,) = unpack_batch_response(
+        ["1/insights"],
+        [sub_response(400, {"error": {"message": "Invalid OAuth access token", "code": 190}})],
+    )
+    assert isinstance(result, GraphBatchError)
+    assert result.status_code == 400
+    assert result.code == 190
+    assert "Invalid OAuth access token" in result.detail
+
+
+def test_error_body_with_200_is_still_a_failure(governor):
+    (result,) = unpack_batch_response(["1"], [sub_response(200, {"error": {"message": "nope", "code": 100}})])
+    assert isinstance(result, GraphBatchError)
+    assert result.code == 100
+
+
+def test_undecodable_body_is_reported(governor):
+    (result,) = unpack_batch_response(["1"], [{"code": 500, "body": "<html>"}])
+    assert isinstance(result, GraphBatchError)
+    assert result.status_code == 500
+    assert "<html>" in result.detail
+
+
+def test_throttled_sub_request_pauses_the_governor(governor):
+    (result,) = unpack_batch_response(
+        ["1"], [sub_response(400, {"error": {"message": "Application request limit reached", "code": 4}})]
+    )
+    assert isinstance(result, GraphBatchError)
+    assert governor.throttle_count == 1
+    assert governor.last_throttle_code == 4
+    assert governor.rate == governor.min_rate
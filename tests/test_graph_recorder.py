@@ -0,0 +1,48 @@
+import os
+import gzip
+import json
+from utilities.graph_recorder import GraphRecorder, read_records, segment_paths, SEGMENT_SUFFIX
+
+
+def write_segment(directory, name, records, truncate=False):
+    path = os.path.join(directory, name + SEGMENT_SUFFIX)
+    with gzip.open(path, "wb") as segment:
+        for record in records:
+            segment.write(json.dumps(record).encode() + b"\n")
+    if truncate:
+        with open(path, "rb+") as segment:
+            segment.truncate(os.path.getsize(path) - 12)
+    return path
+
+
+def test_recorder_rolls_segments_and_reads_back(tmp_path):
+    recorder = GraphRecorder(str(tmp_path), segment_bytes=200)
+    for post_id in range(10):
+        recorder.record("post_metrics", f"{post_id}?fields=like_count", 200, {"like_count": post_id})
+    recorder.close()
+
+    assert len(segment_paths([str(tmp_path)])) > 1
+    records = list(read_records([str(tmp_path)]))
+    assert [record["body"]["like_count"] for record in records] == list(range(10))
+
+
+def test_disabled_recorder_writes_nothing(tmp_path):
+    recorder = GraphRecorder(None)
+    recorder.record("media_page", "x", 200, {})
+    recorder.close()
+    assert not recorder.enabled
+
+
+def test_segments_of_several_workers_are_merged_by_time(tmp_path):
+    # Worker A's segment started first but spans past worker B's records
+    write_segment(str(tmp_path), "graph-20240301T000000-100-0001", [{"ts": 1}, {"ts": 5}, {"ts": 9}])
+    write_segment(str(tmp_path), "graph-20240302T000000-200-0001", [{"ts": 3}, {"ts": 4}, {"ts": 10}])
+    assert [record["ts"] for record in read_records([str(tmp_path)])] == [1, 3, 4, 5, 9, 10]
+
+
+def test_truncated_segment_yields_what_it_holds(tmp_path):
+    write_segment(str(tmp_path), "graph-a", [{"ts": index} for index in range(0, 2000, 2)], truncate=True)
+    write_segment(str(tmp_path), "graph-b", [{"ts": 1}, {"ts": 3}])
+    timestamps = [record["ts"] for record in read_records([str(tmp_path)])]
+    assert timestamps[:4] == [0, 1, 2, 3]
+    assert timestamps == sorted(timestamps)
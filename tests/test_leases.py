@@ -0,0 +1,112 @@
+import asyncio
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from database.database import Base
+from database.models import Lease
+from utilities import leases
+from utilities.leases import lease, acquire_lease, release_lease, LeaseUnavailable, LeaseLost, LEASE_OWNER
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """
+    Lease sessions on a fresh in-memory SQLite database, through aiosqlite.
+    """
+    engine = create_async_engine("sqlite+aiosqlite://")
+
+    async def create_tables():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_tables())
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(leases, "AsyncSessionLocal", session_factory)
+    yield session_factory
+    asyncio.run(engine.dispose())
+
+
+def attempt(sessions, name, ttl, owner):
+    async def run():
+        async with sessions() as db:
+            return await db.run_sync(acquire_lease, name, ttl, owner)
+    return asyncio.run(run())
+
+
+def test_first_worker_gets_the_lease(sessions):
+    assert attempt(sessions, "sync:111", 60, "a") == "a"
+    assert attempt(sessions, "sync:111", 60, "b") == "a"
+    assert attempt(sessions, "sync:222", 60, "b") == "b"
+
+
+def test_holder_renews_its_lease(sessions):
+    attempt(sessions, "sync:111", 60, "a")
+
+    async def row():
+        async with sessions() as db:
+            return (await db.execute(select(Lease))).scalar_one()
+
+    first = asyncio.run(row())
+    assert attempt(sessions, "sync:111", 600, "a") == "a"
+    renewed = asyncio.run(row())
+    assert renewed.expires_at > first.expires_at
+    assert renewed.acquired_ts == first.acquired_ts
+
+
+def test_expired_lease_is_taken_over(sessions):
+    attempt(sessions, "sync:111", -1, "a")
+    assert attempt(sessions, "sync:111", 60, "b") == "b"
+    assert attempt(sessions, "sync:111", 60, "a") == "b"
+
+
+def test_released_lease_is_free_again(sessions):
+    attempt(sessions, "sync:111", 60, "a")
+
+    async def release(owner):
+        async with sessions() as db:
+            await db.run_sync(release_lease, "sync:111", owner)
+
+    # Only the holder can release it
+    asyncio.run(release("b"))
+    assert attempt(sessions, "sync:111", 60, "b") == "a"
+    asyncio.run(release("a"))
+    assert attempt(sessions, "sync:111", 60, "b") == "b"
+
+
+def test_lease_is_held_for_the_block(sessions):
+    async def other_worker():
+        async with sessions() as db:
+            return await db.run_sync(acquire_lease, "sync:111", 60, "other")
+
+    async def run():
+        async with lease("sync:111", 60):
+            assert await other_worker() == LEASE_OWNER
+        return await other_worker()
+
+    assert asyncio.run(run()) == "other"
+
+
+def test_lease_held_elsewhere_is_unavailable(sessions):
+    attempt(sessions, "sync:111", 60, "other")
+
+    async def run():
+        async with lease("sync:111", 60):
+            pass
+
+    with pytest.raises(LeaseUnavailable) as error:
+        asyncio.run(run())
+    assert error.value.owner == "other"
+
+
+def test_block_is_stopped_when_the_lease_is_taken_over(sessions):
+    async def run():
+        async with lease("sync:111", 0.3):
+            # Another worker takes the lease over as if this one had stalled past its ttl
+            async with sessions() as db:
+                await db.run_sync(release_lease, "sync:111", LEASE_OWNER)
+                await db.run_sync(acquire_lease, "sync:111", 60, "other")
+            await asyncio.sleep(5)
+
+    with pytest.raises(LeaseLost) as error:
+        asyncio.run(run())
+    assert error.value.owner == "other"
@@ -0,0 +1,119 @@
+import io
+import os
+import asyncio
+import hashlib
+import pytest
+from PIL import Image
+from utilities import media_cache
+from utilities.media_cache import fetch_media, media_path, mirror_account_media
+from database.models import Posts, MediaObject
+
+
+def png(width=640, height=480):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class FakeCDN:
+    """
+    Stands in for graph_client.download: url -> (status, content type, body), streamed in small chunks.
+    """
+    def __init__(self, files):
+        self.files = files
+
+    async def download(self, url, sink, max_bytes, timeout=None):
+        response_status, content_type, body = self.files[url]
+        if response_status != 200:
+            return response_status, None
+        if len(body) > max_bytes:
+            raise ValueError("Download is over the byte limit")
+        for start in range(0, len(body), 1000):
+            sink.write(body[start:start + 1000])
+        return response_status, content_type
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_cache, "MEDIA_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def install(monkeypatch, files):
+    monkeypatch.setattr(media_cache.graph_client, "download", FakeCDN(files).download)
+
+
+def leftovers(cache_dir):
+    return [name for name in os.listdir(cache_dir) if name.startswith(".tmp-")]
+
+
+def test_download_is_stored_under_its_hash(cache_dir, monkeypatch):
+    body = b"not an image" * 500
+    install(monkeypatch, {"https://cdn.test/a.mp4": (200, "video/mp4", body)})
+    response_status, row, existed = asyncio.run(fetch_media("https://cdn.test/a.mp4"))
+
+    media_hash = hashlib.sha256(body).hexdigest()
+    assert response_status == 200 and not existed
+    assert row["sha256"] == media_hash
+    assert row["size_bytes"] == len(body)
+    with open(media_path(media_hash), "rb") as cached:
+        assert cached.read() == body
+    assert not row["has_thumbnail"]
+    assert leftovers(cache_dir) == []
+
+
+def test_identical_content_is_stored_once(cache_dir, monkeypatch):
+    body = png()
+    install(monkeypatch, {
+        "https://cdn.test/a.png": (200, "image/png", body),
+        "https://cdn.test/b.png": (200, "image/png", body),
+    })
+    _, first, first_existed = asyncio.run(fetch_media("https://cdn.test/a.png"))
+    _, second, second_existed = asyncio.run(fetch_media("https://cdn.test/b.png"))
+    assert first["sha256"] == second["sha256"]
+    assert (first_existed, second_existed) == (False, True)
+    assert second["has_thumbnail"]
+    assert leftovers(cache_dir) == []
+
+
+def test_images_get_a_thumbnail(cache_dir, monkeypatch):
+    install(monkeypatch, {"https://cdn.test/a.png": (200, "image/png", png(640, 480))})
+    _, row, _ = asyncio.run(fetch_media("https://cdn.test/a.png"))
+    assert (row["width"], row["height"]) == (640, 480)
+    with Image.open(media_path(row["sha256"], thumbnail=True)) as thumbnail:
+        assert max(thumbnail.size) == media_cache.MEDIA_THUMBNAIL_SIZE
+
+
+def test_failed_downloads_leave_nothing_behind(cache_dir, monkeypatch):
+    monkeypatch.setattr(media_cache, "MEDIA_MAX_BYTES", 100)
+    install(monkeypatch, {
+        "https://cdn.test/gone.jpg": (403, None, None),
+        "https://cdn.test/big.jpg": (200, "image/jpeg", b"x" * 101),
+    })
+    assert asyncio.run(fetch_media("https://cdn.test/gone.jpg")) == (403, None, False)
+    with pytest.raises(ValueError):
+        asyncio.run(fetch_media("https://cdn.test/big.jpg"))
+    assert os.listdir(cache_dir) == []
+
+
+def test_mirror_links_posts_and_counts_failures(cache_dir, monkeypatch, db):
+    # One download at a time, so the second copy of the same bytes is always the duplicate
+    monkeypatch.setattr(media_cache, "MEDIA_MIRROR_CONCURRENCY", 1)
+    body = png()
+    install(monkeypatch, {
+        "https://cdn.test/1.png": (200, "image/png", body),
+        "https://cdn.test/2.png": (200, "image/png", body),
+        "https://cdn.test/3.png": (403, None, None),
+    })
+    for post_id in ("1", "2", "3"):
+        db.add(Posts(post_id=post_id, account_id="111", media_url=f"https://cdn.test/{post_id}.png"))
+    db.commit()
+
+    summary = asyncio.run(mirror_account_media("111", db))
+    assert summary == {"media_mirrored": 2, "media_deduplicated": 1, "media_failed": 1}
+
+    db.expire_all()
+    posts = {post.post_id: post for post in db.query(Posts)}
+    assert posts["1"].media_hash == posts["2"].media_hash == hashlib.sha256(body).hexdigest()
+    assert posts["3"].media_hash is None and posts["3"].media_failures == 1
+    assert db.query(MediaObject).count() == 1
@@ -0,0 +1,56 @@
+import numpy as np
+from utilities.post_columns import PostColumns
+
+
+def insights(reach, saved):
+    return {"data": [{"name": "reach", "values": [{"value": reach}]}, {"name": "saved", "values": [{"value": saved}]}]}
+
+
+def columns(rows):
+    """
+    rows: (post_id, likes, reach, saves)
+    """
+    posts = [{"id": post_id, "media_type": "IMAGE", "timestamp": "2024-03-01T10:00:00+0000"} for post_id, *_ in rows]
+    metrics = [({"like_count": likes}, insights(reach, saves)) for _, likes, reach, saves in rows]
+    return PostColumns.from_posts(posts, metrics)
+
+
+def test_from_posts_reads_counters():
+    batch = columns([("1", 5, 100, 2), ("2", 0, 7, 0)])
+    assert batch.post_ids.tolist() == ["1", "2"]
+    assert batch.counters().tolist() == [[5, 100, 2], [0, 7, 0]]
+    assert batch.post_created.tolist() == ["2024-03-01", "2024-03-01"]
+
+
+def test_missing_metrics_count_as_zero():
+    batch = PostColumns.from_posts([{"id": "1"}], [({}, {"data": []})])
+    assert batch.counters().tolist() == [[0, 0, 0]]
+    assert batch.post_created.tolist() == [""]
+
+
+def test_dedupe_without_duplicates_returns_same_batch():
+    batch = columns([("1", 1, 1, 1), ("2", 2, 2, 2)])
+    assert batch.dedupe() is batch
+
+
+def test_dedupe_keeps_last_occurrence_in_listing_order():
+    batch = columns([("1", 1, 10, 0), ("2", 2, 20, 0), ("1", 3, 30, 0), ("3", 4, 40, 0), ("2", 5, 50, 0)])
+    deduped = batch.dedupe()
+    assert deduped.post_ids.tolist() == ["1", "3", "2"]
+    assert deduped.likes.tolist() == [3, 4, 5]
+
+
+def test_take_and_concat_round_trip():
+    batch = columns([("1", 1, 1, 1), ("2", 2, 2, 2), ("3", 3, 3, 3)])
+    parts = [batch.take(slice(0, 1)), batch.take(np.array([False, True, True]))]
+    joined = PostColumns.concat(parts)
+    assert joined.post_ids.tolist() == ["1", "2", "3"]
+    assert joined.counters().tolist() == batch.counters().tolist()
+
+
+def test_fingerprints_follow_counters():
+    batch = columns([("1", 5, 100, 2), ("2", 5, 100, 2), ("3", 100, 5, 2), ("4", 5, 100, 3)])
+    first, same, swapped, changed = batch.fingerprints().tolist()
+    assert first == same
+    assert first != swapped
+    assert first != changed
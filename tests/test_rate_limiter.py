@@ -0,0 +1,98 @@
+import json
+import time
+import asyncio
+import pytest
+from utilities.rate_limiter import (
+    RateGovernor, parse_usage_headers, throttle_error_code, GRAPH_BACKOFF_BASE, GRAPH_BACKOFF_MAX,
+)
+
+
+def governor():
+    return RateGovernor(max_rate=50, min_rate=1, max_concurrency=40, min_concurrency=2)
+
+
+def test_throttle_error_code():
+    assert throttle_error_code({"error": {"code": 4}}) == 4
+    assert throttle_error_code({"error": {"code": 613}}) == 613
+    assert throttle_error_code({"error": {"code": 190}}) is None
+    assert throttle_error_code({"data": []}) is None
+    assert throttle_error_code(None) is None
+
+
+def test_no_usage_headers():
+    assert parse_usage_headers({}) == (0, 0)
+
+
+def test_app_usage_takes_the_highest_counter():
+    headers = {"X-App-Usage": json.dumps({"call_count": 12, "total_cputime": 40, "total_time": 31})}
+    assert parse_usage_headers(headers) == (40, 0)
+
+
+def test_business_use_case_usage_and_regain_minutes():
+    headers = {
+        "X-App-Usage": json.dumps({"call_count": 10}),
+        "X-Business-Use-Case-Usage": json.dumps({
+            "1784": [
+                {"call_count": 72, "total_cputime": 5, "total_time": 8, "estimated_time_to_regain_access": 0},
+                {"call_count": 3, "total_cputime": 90, "total_time": 2, "estimated_time_to_regain_access": 4},
+            ],
+        }),
+    }
+    assert parse_usage_headers(headers) == (90, 240)
+
+
+def test_malformed_usage_headers_are_ignored():
+    headers = {"X-App-Usage": "not json", "X-Business-Use-Case-Usage": json.dumps({"1784": "oops"})}
+    assert parse_usage_headers(headers) == (0, 0)
+
+
+def test_full_speed_below_soft_limit():
+    rate_governor = governor()
+    rate_governor.observe({"X-App-Usage": json.dumps({"call_count": 30})})
+    assert rate_governor.rate == 50
+    assert rate_governor.concurrency == 40
+
+
+def test_speed_scales_with_remaining_headroom():
+    rate_governor = governor()
+    rate_governor.observe({"X-App-Usage": json.dumps({"call_count": 75})})
+    assert rate_governor.rate == pytest.approx(25)
+    assert rate_governor.concurrency == 20
+
+
+def test_speed_never_drops_below_minimum():
+    rate_governor = governor()
+    rate_governor.observe({"X-App-Usage": json.dumps({"call_count": 100})})
+    assert rate_governor.rate == 1
+    assert rate_governor.concurrency == 2
+
+
+def test_throttle_drops_to_minimum_and_pauses():
+    rate_governor = governor()
+    delay = rate_governor.throttled(4, attempt=2)
+    backoff = min(GRAPH_BACKOFF_MAX, GRAPH_BACKOFF_BASE * 2 ** 2)
+    assert backoff * 0.5 <= delay <= backoff * 1.5
+    assert rate_governor.rate == 1
+    assert rate_governor.concurrency == 2
+    assert rate_governor.tokens == 0
+    assert rate_governor.paused_until > time.monotonic()
+
+
+def test_throttle_waits_at_least_the_regain_time():
+    rate_governor = governor()
+    rate_governor.regain_seconds = 600
+    assert rate_governor.throttled(17, attempt=0) == 600
+
+
+def test_recovers_gradually_without_usage_headers():
+    async def run():
+        # A wider window wakes waiters on the running loop
+        rate_governor = governor()
+        rate_governor.throttled(4, attempt=0)
+        rate_governor.observe({})
+        await asyncio.sleep(0)
+        return rate_governor
+
+    rate_governor = asyncio.run(run())
+    assert rate_governor.rate == pytest.approx(1.1)
+    assert rate_governor.concurrency == 3
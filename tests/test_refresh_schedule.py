@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+import pytest
+from utilities.refresh_schedule import (
+    parse_duration, parse_rules, refresh_interval, REFRESH_HOT_RATE, REFRESH_MAX_BACKOFF,
+)
+
+NOW = datetime(2024, 3, 31, 12, 0, 0)
+RULES = parse_rules("2d:1h,30d:1d,*:7d")
+
+
+def test_parse_duration_units():
+    assert parse_duration("90m") == timedelta(minutes=90)
+    assert parse_duration(" 1h ") == timedelta(hours=1)
+    assert parse_duration("2d") == timedelta(days=2)
+    assert parse_duration("1.5w") == timedelta(weeks=1.5)
+
+
+def test_parse_duration_rejects_unknown_unit():
+    with pytest.raises(ValueError):
+        parse_duration("10s")
+
+
+def test_parse_rules_sorts_youngest_first():
+    assert parse_rules("*:7d,30d:1d,2d:1h") == RULES
+    assert RULES == [
+        (timedelta(days=2), timedelta(hours=1)),
+        (timedelta(days=30), timedelta(days=1)),
+        (None, timedelta(days=7)),
+    ]
+
+
+def test_parse_rules_needs_catch_all_tier():
+    with pytest.raises(ValueError):
+        parse_rules("2d:1h,30d:1d")
+
+
+def test_tier_follows_post_age():
+    assert refresh_interval(NOW - timedelta(hours=5), NOW, rules=RULES) == timedelta(hours=1)
+    assert refresh_interval(NOW - timedelta(days=10), NOW, rules=RULES) == timedelta(days=1)
+    assert refresh_interval(NOW - timedelta(days=300), NOW, rules=RULES) == timedelta(days=7)
+
+
+def test_tier_boundary_belongs_to_older_tier():
+    assert refresh_interval(NOW - timedelta(days=2), NOW, rules=RULES) == timedelta(days=1)
+
+
+def test_unknown_creation_date_uses_catch_all():
+    assert refresh_interval(None, NOW, rules=RULES) == timedelta(days=7)
+
+
+def test_unchanged_posts_back_off_up_to_the_cap():
+    created = NOW - timedelta(days=10)
+    assert refresh_interval(created, NOW, unchanged_streak=1, rules=RULES) == timedelta(days=2 ** min(1, REFRESH_MAX_BACKOFF))
+    capped = refresh_interval(created, NOW, unchanged_streak=REFRESH_MAX_BACKOFF + 5, rules=RULES)
+    assert capped == timedelta(days=2 ** REFRESH_MAX_BACKOFF)
+
+
+def test_fast_moving_posts_stay_on_fastest_tier():
+    created = NOW - timedelta(days=300)
+    assert refresh_interval(created, NOW, change_rate=REFRESH_HOT_RATE, rules=RULES) == timedelta(hours=1)
+    assert refresh_interval(created, NOW, change_rate=REFRESH_HOT_RATE - 1, rules=RULES) == timedelta(days=7)
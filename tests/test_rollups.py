@@ -0,0 +1,48 @@
+from datetime import date
+from utilities.rollups import period_starts, add_post_deltas, add_account_deltas, get_post_rollups, get_account_rollups
+
+ACCOUNT_ID = "17840000000000000"
+
+
+def delta(posts_id, snapshot_date, reach, likes, saves):
+    return {"posts_id": posts_id, "snapshot_date": snapshot_date, "reach": reach, "likes": likes, "saves": saves}
+
+
+def test_period_starts_weeks_begin_on_monday():
+    assert period_starts(date(2024, 3, 14)) == {
+        "day": date(2024, 3, 14),
+        "week": date(2024, 3, 11),
+        "month": date(2024, 3, 1),
+    }
+
+
+def test_post_deltas_accumulate_into_every_period(db):
+    # Thursday and Friday of the same week, then the Monday after
+    add_post_deltas(db, ACCOUNT_ID, [delta(1, date(2024, 3, 14), 100, 5, 1), delta(2, date(2024, 3, 14), 10, 1, 0)])
+    add_post_deltas(db, ACCOUNT_ID, [delta(1, date(2024, 3, 15), 50, 2, 0)])
+    add_post_deltas(db, ACCOUNT_ID, [delta(1, date(2024, 3, 18), 20, 1, 1)])
+    db.commit()
+
+    assert [row["reach"] for row in get_post_rollups(db, 1, "day")] == [100, 50, 20]
+    assert get_post_rollups(db, 1, "week") == [
+        {"period_start": "2024-03-11", "reach": 150, "likes": 7, "saves": 1},
+        {"period_start": "2024-03-18", "reach": 20, "likes": 1, "saves": 1},
+    ]
+    assert get_post_rollups(db, 1, "month") == [{"period_start": "2024-03-01", "reach": 170, "likes": 8, "saves": 2}]
+
+    # The account buckets sum every post
+    week = get_account_rollups(db, ACCOUNT_ID, "week", end=date(2024, 3, 11))
+    assert [(row["post_reach"], row["likes"], row["saves"]) for row in week] == [(160, 8, 1)]
+
+
+def test_account_deltas_leave_the_post_totals_alone(db):
+    add_post_deltas(db, ACCOUNT_ID, [delta(1, date(2024, 3, 14), 100, 5, 1)])
+    add_account_deltas(db, ACCOUNT_ID, date(2024, 3, 14), followers=3, reach=40, accounts_engaged=2, website_clicks=1)
+    add_account_deltas(db, ACCOUNT_ID, date(2024, 3, 15), followers=-1, reach=10, accounts_engaged=0, website_clicks=0)
+    db.commit()
+
+    assert get_account_rollups(db, ACCOUNT_ID, "month") == [{
+        "period_start": "2024-03-01", "post_reach": 100, "likes": 5, "saves": 1,
+        "followers": 2, "reach": 50, "accounts_engaged": 2, "website_clicks": 1,
+    }]
+    assert [row["followers"] for row in get_account_rollups(db, ACCOUNT_ID, "day")] == [3, -1]
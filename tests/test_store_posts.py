@@ -0,0 +1,89 @@
+from datetime import timedelta
+from database.models import Posts, PostInsights, PostRunningTotal
+from utilities.fetch_posts_helper import store_posts_and_metrics
+from utilities.fingerprints import metric_fingerprints
+
+
+def post(post_id):
+    return {"id": post_id, "media_type": "IMAGE", "media_url": f"https://cdn.test/{post_id}.jpg",
+            "timestamp": "2024-03-01T10:00:00+0000"}
+
+
+def metrics(likes, reach, saves):
+    return {"like_count": likes}, {"data": [
+        {"name": "reach", "values": [{"value": reach}]},
+        {"name": "saved", "values": [{"value": saves}]},
+    ]}
+
+
+def insight_rows(db, post_id):
+    return [
+        (row.likes, row.reach, row.saves)
+        for row in db.query(PostInsights).join(Posts).filter(Posts.post_id == post_id).order_by(PostInsights.id)
+    ]
+
+
+def running_total(db, post_id):
+    row = db.query(PostRunningTotal).join(Posts, Posts.id == PostRunningTotal.posts_id).filter(
+        Posts.post_id == post_id
+    ).one()
+    return row.likes, row.reach, row.saves
+
+
+def move_history_back_a_day(db):
+    for row in db.query(PostInsights):
+        row.snapshot_date -= timedelta(days=1)
+    db.commit()
+
+
+def test_first_sync_stores_the_counters_as_the_first_delta(db):
+    summary = store_posts_and_metrics([post("1"), post("2")], [metrics(5, 100, 2), metrics(0, 7, 0)], db)
+    assert summary == {"inserted": 4, "updated": 0, "skipped": 0}
+    assert insight_rows(db, "1") == [(5, 100, 2)]
+    assert insight_rows(db, "2") == [(0, 7, 0)]
+    assert running_total(db, "1") == (5, 100, 2)
+
+
+def test_same_day_resync_adds_only_the_increment(db):
+    store_posts_and_metrics([post("1")], [metrics(5, 100, 2)], db)
+    summary = store_posts_and_metrics([post("1")], [metrics(8, 150, 2)], db)
+    assert summary == {"inserted": 0, "updated": 1, "skipped": 0}
+    assert insight_rows(db, "1") == [(8, 150, 2)]
+    assert running_total(db, "1") == (8, 150, 2)
+
+
+def test_next_day_stores_the_increment_as_a_new_row(db):
+    store_posts_and_metrics([post("1")], [metrics(5, 100, 2)], db)
+    move_history_back_a_day(db)
+    store_posts_and_metrics([post("1")], [metrics(8, 150, 3)], db)
+    assert insight_rows(db, "1") == [(5, 100, 2), (3, 50, 1)]
+    assert running_total(db, "1") == (8, 150, 3)
+
+
+def test_missing_running_total_falls_back_to_the_history(db):
+    store_posts_and_metrics([post("1")], [metrics(5, 100, 2)], db)
+    move_history_back_a_day(db)
+    db.query(PostRunningTotal).delete()
+    db.commit()
+    store_posts_and_metrics([post("1")], [metrics(6, 100, 2)], db)
+    assert insight_rows(db, "1") == [(5, 100, 2), (1, 0, 0)]
+    assert running_total(db, "1") == (6, 100, 2)
+
+
+def test_unchanged_counters_skip_the_write(db):
+    store_posts_and_metrics([post("1"), post("2")], [metrics(5, 100, 2), metrics(0, 7, 0)], db)
+    summary = store_posts_and_metrics([post("1"), post("2")], [metrics(5, 100, 2), metrics(1, 7, 0)], db)
+    assert summary == {"inserted": 0, "updated": 1, "skipped": 1}
+    assert insight_rows(db, "1") == [(5, 100, 2)]
+    assert insight_rows(db, "2") == [(1, 7, 0)]
+
+
+def test_stored_fingerprint_skips_after_the_cache_forgets(db):
+    store_posts_and_metrics([post("1")], [metrics(5, 100, 2)], db)
+    # A restarted worker, or a post evicted from the LRU
+    metric_fingerprints.clear()
+    summary = store_posts_and_metrics([post("1")], [metrics(5, 100, 2)], db)
+    assert summary == {"inserted": 0, "updated": 0, "skipped": 1}
+    # The stored fingerprint refills the cache for the next sync
+    assert metric_fingerprints.get_many(["1"]) != [None]
+    assert insight_rows(db, "1") == [(5, 100, 2)]
@@ -0,0 +1,139 @@
+import asyncio
+import pytest
+from utilities import sync_pipeline
+from utilities.sync_checkpoint import SYNC_MAX_POST_ATTEMPTS
+
+# Three /media pages of two posts each: (cursor that re-reads the page, post ids)
+PAGES = [(None, ["6", "5"]), ("c1", ["4", "3"]), ("c2", ["2", "1"])]
+
+
+def media(post_id):
+    return {"id": post_id, "media_type": "IMAGE", "media_url": f"https://cdn.test/{post_id}.jpg",
+            "timestamp": f"2024-03-0{post_id}T10:00:00+0000"}
+
+
+def metrics(post_id):
+    return {"like_count": int(post_id)}, {"data": [{"name": "reach", "values": [{"value": 10}]}]}
+
+
+class FakeSync:
+    """
+    Stands in for the Graph listing, metric fetches and DB helpers the pipeline calls.
+    """
+    def __init__(self, checkpoint=None, failing=()):
+        self.checkpoint = {
+            "in_progress": False, "cursor": None, "full_resync": False, "newest_post": None,
+            "done": set(), "failed": {}, "attempts": {}, **(checkpoint or {}),
+        }
+        self.failing = set(failing)
+        self.listed_from = None
+        self.fetched = []
+        self.stored = []
+        self.saves = []  # (cursor, done ids, failed ids) per save_checkpoint call
+
+    async def iter_post_pages(self, account_id, token, high_water_mark, cursor=None, with_cursor=False):
+        self.listed_from = cursor
+        start = [page_cursor for page_cursor, _ in PAGES].index(cursor)
+        for page_cursor, post_ids in PAGES[start:]:
+            yield page_cursor, [media(post_id) for post_id in post_ids]
+
+    async def collect_post_metrics(self, posts, token, failures=None):
+        self.fetched.extend(post["id"] for post in posts)
+        results = []
+        for post in posts:
+            if post["id"] in self.failing:
+                failures[post["id"]] = "unsupported"
+                results.append(None)
+            else:
+                results.append(metrics(post["id"]))
+        return results
+
+    def store_and_reschedule(self, db, account_id, columns, now, chunk_size=None):
+        self.stored.extend(columns.post_ids.tolist())
+        return {"inserted": len(columns), "updated": 0, "skipped": 0}
+
+    def save_checkpoint(self, db, account_id, cursor, full_resync, newest_post, done_ids, failures):
+        self.saves.append((cursor, list(done_ids), [post["id"] for post, _ in failures]))
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(sync_pipeline, "get_checkpoint", lambda db, account_id: self.checkpoint)
+        monkeypatch.setattr(sync_pipeline, "get_high_water_mark", lambda db, account_id: (None, None))
+        monkeypatch.setattr(sync_pipeline, "iter_post_pages", self.iter_post_pages)
+        monkeypatch.setattr(sync_pipeline, "collect_post_metrics", self.collect_post_metrics)
+        monkeypatch.setattr(sync_pipeline, "store_and_reschedule", self.store_and_reschedule)
+        monkeypatch.setattr(sync_pipeline, "save_checkpoint", self.save_checkpoint)
+        return self
+
+
+def run(fake, chunk_size=2, metric_workers=1):
+    return asyncio.run(sync_pipeline.run_sync_pipeline(
+        "acct", "token", object(), chunk_size=chunk_size, metric_workers=metric_workers,
+    ))
+
+
+def test_fresh_sync_stores_every_post(monkeypatch):
+    fake = FakeSync().install(monkeypatch)
+    summary = run(fake)
+    assert fake.listed_from is None
+    assert sorted(fake.stored) == ["1", "2", "3", "4", "5", "6"]
+    assert summary["pages_listed"] == 3
+    assert summary["inserted"] == 6
+    assert summary["newest_post"]["id"] == "6"
+    assert not summary["resumed"]
+
+
+@pytest.mark.parametrize("chunk_size, metric_workers", [(2, 1), (2, 3), (5, 2), (100, 1)])
+def test_checkpoint_cursor_never_skips_an_unstored_page(monkeypatch, chunk_size, metric_workers):
+    fake = FakeSync().install(monkeypatch)
+    run(fake, chunk_size, metric_workers)
+
+    page_of_cursor = {page_cursor: index for index, (page_cursor, _) in enumerate(PAGES)}
+    stored = set()
+    for cursor, done_ids, _ in fake.saves:
+        stored.update(done_ids)
+        # Every page before the one the cursor re-reads must be fully stored
+        for _, post_ids in PAGES[:page_of_cursor[cursor]]:
+            assert set(post_ids) <= stored
+    # Once everything is stored the cursor rests on the last page listed
+    assert fake.saves[-1][0] == "c2"
+
+
+def test_resume_starts_from_cursor_and_skips_stored_posts(monkeypatch):
+    fake = FakeSync(checkpoint={
+        "in_progress": True, "cursor": "c1", "newest_post": media("6"), "done": {"4"},
+    }).install(monkeypatch)
+    summary = run(fake)
+    assert fake.listed_from == "c1"
+    assert sorted(fake.fetched) == ["1", "2", "3"]
+    assert summary["resumed"]
+    # The high-water mark still comes from the interrupted walk's first page
+    assert summary["newest_post"]["id"] == "6"
+
+
+def test_earlier_failures_are_retried_first(monkeypatch):
+    fake = FakeSync(checkpoint={"failed": {"9": media("9")}, "attempts": {"9": 1}}).install(monkeypatch)
+    summary = run(fake)
+    assert fake.fetched[0] == "9"
+    assert "9" in fake.stored
+    assert summary["retried"] == 1
+    # The retry page sits outside the cursor bookkeeping
+    assert all(cursor in ("c1", "c2", None) for cursor, _, _ in fake.saves)
+
+
+def test_failed_posts_are_recorded_not_raised(monkeypatch):
+    fake = FakeSync(failing={"3"}).install(monkeypatch)
+    summary = run(fake)
+    assert summary["failed"] == 1
+    assert summary["parked"] == 0
+    assert "3" not in fake.stored
+    assert ["3"] in [failed for _, _, failed in fake.saves]
+
+
+def test_last_allowed_failure_is_counted_as_parked(monkeypatch):
+    fake = FakeSync(
+        checkpoint={"failed": {"3": media("3")}, "attempts": {"3": SYNC_MAX_POST_ATTEMPTS - 1}}, failing={"3"},
+    ).install(monkeypatch)
+    summary = run(fake)
+    assert summary["retried"] == 1
+    assert summary["failed"] == 1
+    assert summary["parked"] == 1
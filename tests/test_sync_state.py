@@ -0,0 +1,46 @@
+from datetime import datetime
+from utilities.sync_state import parse_post_timestamp, page_reaches_high_water_mark
+
+
+def post(post_id, timestamp):
+    return {"id": post_id, "timestamp": timestamp}
+
+
+PAGE = [
+    post("3", "2024-03-03T10:00:00+0000"),
+    post("2", "2024-03-02T10:00:00+0000"),
+    post("1", "2024-03-01T10:00:00+0000"),
+]
+
+
+def test_parse_post_timestamp_converts_to_naive_utc():
+    assert parse_post_timestamp("2024-03-01T12:00:00+0200") == datetime(2024, 3, 1, 10, 0, 0)
+    assert parse_post_timestamp(None) is None
+    assert parse_post_timestamp("") is None
+
+
+def test_no_high_water_mark_never_stops():
+    assert not page_reaches_high_water_mark(PAGE, None, None)
+
+
+def test_stops_on_known_post_id():
+    assert page_reaches_high_water_mark(PAGE, "2", None)
+
+
+def test_stops_on_post_created_at_or_before_mark():
+    assert page_reaches_high_water_mark(PAGE, None, datetime(2024, 3, 1, 10, 0, 0))
+    assert page_reaches_high_water_mark(PAGE, "deleted", datetime(2024, 3, 2, 12, 0, 0))
+
+
+def test_page_newer_than_mark_continues():
+    assert not page_reaches_high_water_mark(PAGE, "0", datetime(2024, 2, 28))
+
+
+def test_posts_without_timestamp_only_match_by_id():
+    page = [{"id": "5"}, {"id": "4", "timestamp": None}]
+    assert not page_reaches_high_water_mark(page, "1", datetime(2024, 3, 1))
+    assert page_reaches_high_water_mark(page, "4", datetime(2024, 3, 1))
+
+
+def test_empty_page():
+    assert not page_reaches_high_water_mark([], "1", datetime(2024, 3, 1))
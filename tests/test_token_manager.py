@@ -0,0 +1,245 @@
+import time
+import asyncio
+import pytest
+from fastapi import HTTPException
+from utilities import token_manager as token_manager_module
+from utilities.token_manager import TokenManager, TOKEN_REFRESH_MARGIN
+from utilities.graph_client import GraphClient, current_token_manager, token_rejected
+
+FAR_FUTURE = 10 * 365 * 24 * 3600
+
+
+class FakeGraph:
+    """
+    Stands in for debug_token and refresh_access_token; refreshes hand out token-1, token-2, ...
+    """
+    def __init__(self, expires_at=None, expires_in=60 * 24 * 3600, debug_error=None):
+        self.expires_at = expires_at
+        self.expires_in = expires_in
+        self.debug_error = debug_error
+        self.debugged = []
+        self.refreshes = 0
+
+    async def debug_token(self, access_token):
+        self.debugged.append(access_token)
+        if self.debug_error:
+            raise self.debug_error
+        return self.expires_at
+
+    async def refresh_access_token(self, app_id, app_secret, long_lived_token, with_expiry=False):
+        self.refreshes += 1
+        await asyncio.sleep(0.05)  # long enough for every concurrent caller to queue up behind it
+        return f"token-{self.refreshes}", self.expires_in
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(token_manager_module, "debug_token", self.debug_token)
+        monkeypatch.setattr(token_manager_module, "refresh_access_token", self.refresh_access_token)
+        return self
+
+
+def manager(expires_at=None):
+    token_manager = TokenManager("token-0", "long-lived")
+    token_manager.expires_at = expires_at
+    return token_manager
+
+
+def test_token_rejected():
+    assert token_rejected({"error": {"code": 190, "message": "Error validating access token"}})
+    assert not token_rejected({"error": {"code": 4}})
+    assert not token_rejected({"data": []})
+    assert not token_rejected(None)
+
+
+def test_fresh_token_needs_no_graph_call(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    assert asyncio.run(manager(time.time() + FAR_FUTURE).get_token()) == "token-0"
+    assert graph.debugged == [] and graph.refreshes == 0
+
+
+def test_first_use_learns_the_expiry_without_refreshing(monkeypatch):
+    graph = FakeGraph(expires_at=time.time() + FAR_FUTURE).install(monkeypatch)
+    assert asyncio.run(manager().get_token()) == "token-0"
+    assert graph.debugged == ["token-0"]
+    assert graph.refreshes == 0
+
+
+def test_failed_expiry_check_falls_through_to_a_refresh(monkeypatch):
+    graph = FakeGraph(debug_error=Exception("Failed to debug token")).install(monkeypatch)
+    assert asyncio.run(manager().get_token()) == "token-1"
+    assert graph.refreshes == 1
+
+
+def test_unknown_expiry_after_refresh_is_checked_again_later(monkeypatch):
+    FakeGraph(expires_in=None, debug_error=Exception("Failed to debug token")).install(monkeypatch)
+    token_manager = manager(expires_at=0)
+    assert asyncio.run(token_manager.get_token()) == "token-1"
+    assert token_manager.expires_at == pytest.approx(time.time() + 2 * TOKEN_REFRESH_MARGIN, abs=60)
+
+
+def test_concurrent_callers_share_one_refresh(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    token_manager = manager(expires_at=time.time())
+
+    async def run():
+        return await asyncio.gather(*(token_manager.get_token() for _ in range(10)))
+
+    assert asyncio.run(run()) == ["token-1"] * 10
+    assert graph.refreshes == 1
+
+
+def test_rejected_token_is_replaced_once_for_every_caller(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    token_manager = manager(time.time() + FAR_FUTURE)
+
+    async def run():
+        # Several calls were in flight with the token Graph just refused
+        return await asyncio.gather(*(token_manager.refreshed_token("token-0") for _ in range(5)))
+
+    assert asyncio.run(run()) == ["token-1"] * 5
+    assert graph.refreshes == 1
+    assert token_manager.issued("token-0")
+    assert asyncio.run(token_manager.current_for("token-0")) == "token-1"
+
+
+def test_rejections_are_forgotten_once_replaced(monkeypatch):
+    FakeGraph().install(monkeypatch)
+    token_manager = manager(time.time() + FAR_FUTURE)
+    asyncio.run(token_manager.refreshed_token("token-0"))
+    asyncio.run(token_manager.refreshed_token("token-1"))
+    # Only the token replaced last can still be in flight
+    assert token_manager.rejected_tokens == {"token-1"}
+    assert asyncio.run(token_manager.get_token()) == "token-2"
+
+
+def test_token_it_did_not_issue_is_left_alone(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    token_manager = manager(time.time() + FAR_FUTURE)
+    assert asyncio.run(token_manager.refreshed_token("someone-else")) is None
+    assert graph.refreshes == 0
+    assert asyncio.run(token_manager.get_token()) == "token-0"
+
+
+class FakeStore:
+    """
+    The shared token row plus the lease on it, as seen by every worker.
+    """
+    def __init__(self, stored, holder=None):
+        self.stored = stored
+        self.holder = holder
+        self.released = []
+
+    def load(self):
+        return self.stored
+
+    def persist(self, access_token, long_lived_token, expires_at):
+        self.stored = (access_token, long_lived_token, expires_at)
+
+    async def try_acquire_lease(self, name, ttl):
+        if self.holder is None:
+            self.holder = "us"
+        return self.holder == "us"
+
+    async def give_up_lease(self, name):
+        self.released.append(name)
+        self.holder = None
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(token_manager_module, "try_acquire_lease", self.try_acquire_lease)
+        monkeypatch.setattr(token_manager_module, "give_up_lease", self.give_up_lease)
+        monkeypatch.setattr(token_manager_module, "TOKEN_LEASE_POLL", 0.01)
+        return self
+
+
+def shared_manager(store, expires_at):
+    return TokenManager(
+        "token-0", "long-lived", expires_at=expires_at, persist=store.persist, load=store.load, lease_name="token:111",
+    )
+
+
+def test_lease_holder_refreshes_and_stores_the_token(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    store = FakeStore(("token-0", "long-lived", time.time())).install(monkeypatch)
+    assert asyncio.run(shared_manager(store, time.time()).get_token()) == "token-1"
+    assert graph.refreshes == 1
+    assert store.stored[0] == "token-1"
+    assert store.released == ["token:111"] and store.holder is None
+
+
+def test_token_refreshed_by_another_worker_is_reloaded(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    store = FakeStore(("token-9", "long-lived", time.time() + FAR_FUTURE)).install(monkeypatch)
+    assert asyncio.run(shared_manager(store, time.time()).get_token()) == "token-9"
+    assert graph.refreshes == 0 and store.released == []
+
+
+def test_waits_for_the_worker_holding_the_lease(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    store = FakeStore(("token-0", "long-lived", time.time()), holder="other").install(monkeypatch)
+    token_manager = shared_manager(store, time.time())
+
+    async def run():
+        waiting = asyncio.create_task(token_manager.get_token())
+        await asyncio.sleep(0.05)
+        # The other worker finishes its refresh and stores the new token
+        store.persist("token-9", "long-lived", time.time() + FAR_FUTURE)
+        return await waiting
+
+    assert asyncio.run(run()) == "token-9"
+    assert graph.refreshes == 0
+
+
+def test_gives_up_waiting_for_a_stuck_refresh(monkeypatch):
+    FakeGraph().install(monkeypatch)
+    store = FakeStore(("token-0", "long-lived", time.time()), holder="other").install(monkeypatch)
+    monkeypatch.setattr(token_manager_module, "TOKEN_LEASE_WAIT", 0.05)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(shared_manager(store, time.time()).get_token())
+    assert error.value.status_code == 503
+
+
+class FakeTransport:
+    """
+    Answers like Graph once token-0 has been revoked.
+    """
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, method, url, params, data, timeout):
+        self.sent.append(params["access_token"])
+        if params["access_token"] == "token-0":
+            return 400, {"error": {"message": "Error validating access token", "code": 190}}
+        return 200, {"id": "1"}
+
+
+def graph_client(monkeypatch):
+    client = GraphClient()
+    client.session = object()  # never used: _send is replaced
+    transport = FakeTransport()
+    monkeypatch.setattr(client, "_send", transport.send)
+    return client, transport
+
+
+def test_rejected_call_is_sent_again_with_the_refreshed_token(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    client, transport = graph_client(monkeypatch)
+    token_manager = manager(time.time() + FAR_FUTURE)
+
+    async def run():
+        current_token_manager.set(token_manager)
+        first = await client.get("https://graph.test/1", params={"access_token": "token-0"})
+        # A call prepared with the old token before the refresh
+        second = await client.get("https://graph.test/2", params={"access_token": "token-0"})
+        return first, second
+
+    assert asyncio.run(run()) == ((200, {"id": "1"}), (200, {"id": "1"}))
+    assert transport.sent == ["token-0", "token-1", "token-1"]
+    assert graph.refreshes == 1
+
+
+def test_rejection_without_token_manager_is_returned(monkeypatch):
+    graph = FakeGraph().install(monkeypatch)
+    client, transport = graph_client(monkeypatch)
+    response_status, body = asyncio.run(client.get("https://graph.test/1", params={"access_token": "token-0"}))
+    assert response_status == 400 and token_rejected(body)
+    assert transport.sent == ["token-0"]
+    assert graph.refreshes == 0
@@ -1,7 +1,7 @@
 import os
-import requests
-from dotenv import load_dotenv, set_key
+from dotenv import load_dotenv
 from fastapi import HTTPException, status
+from utilities.graph_client import graph_client
 
 load_dotenv()
 
@@ -12,62 +12,63 @@ PKM_ACCESS_TOKEN = os.getenv("PKM_ACCESS_TOKEN")
 PKM_INSTAGRAM_ACCOUNT_ID = os.getenv("PKM_INSTAGRAM_ACCOUNT_ID")
 LONG_LIVED_TOKEN = os.getenv("LONG_LIVED_TOKEN")
 
-def refresh_access_token(app_id: str, app_secret: str, long_lived_token: str):
+async def debug_token(access_token: str):
+    """
+    Return the token's expiry as a unix timestamp using Graph's debug_token endpoint.
+    0 means the token does not expire; None means the token is not valid.
+    """
+    url = f"{BASE_URL}debug_token"
+    params = {
+        "input_token": access_token,
+        "access_token": f"{APP_ID}|{APP_SECRET}",
+    }
+    response_status, body = await graph_client.get(url, params=params, timeout=30)
+
+    if response_status != 200:
+        raise Exception(f"Failed to debug token: {body}")
+
+    data = body.get("data", {})
+    if not data.get("is_valid"):
+        return None
+    return data.get("expires_at", 0)
+
+
+async def refresh_access_token(app_id: str, app_secret: str, long_lived_token: str, with_expiry: bool = False):
     """
     Refresh the long-lived access token using Meta's Graph API.
+    With `with_expiry`, returns (access_token, expires_in seconds or None).
     """
-    url = "https://graph.facebook.com/v21.0/oauth/access_token"
+    url = f"{BASE_URL}oauth/access_token"
     params = {
         "grant_type": "fb_exchange_token",
         "client_id": app_id,
         "client_secret": app_secret,
         "fb_exchange_token": long_lived_token,
     }
-    response = requests.get(url, params=params)
+    response_status, data = await graph_client.get(url, params=params, timeout=30)
 
-    if response.status_code != 200:
-        raise Exception(f"Failed to refresh token: {response.text}")
-    
-    data = response.json()
-    return data.get("access_token")
+    if response_status != 200:
+        raise Exception(f"Failed to refresh token: {data}")
 
-def is_access_token_expired(access_token: str) -> bool:
-    """
-    Check if the access token has expired by making a test request to the Instagram API.
-    Returns True if expired, False if valid.
-    """
-    test_url = f"{BASE_URL}{PKM_INSTAGRAM_ACCOUNT_ID}?fields=id&access_token={PKM_ACCESS_TOKEN}"
-    response = requests.get(test_url)
-   # Check for 401 Unauthorized (token expired)
-    if response.status_code == 401:
-        return True
-    
-    # Check for 400 Bad Request with expired token message
-    if response.status_code == 400:
-        try:
-            error_data = response.json()
-            error_message = error_data.get("error", {}).get("message", "")
-            # If the error message indicates token expiration
-            if "expired" in error_message.lower():
-                return True
-        except ValueError:
-            pass  # In case response is not in JSON format or doesn't contain error info
-    
-    return False
+    if with_expiry:
+        return data.get("access_token"), data.get("expires_in")
+    return data.get("access_token")
 
-def generate_new_long_lived_token() -> str:
+async def generate_new_long_lived_token(short_lived_token: str = None) -> str:
     """
     Generate a new long-lived token using the current short-lived token.
+    Defaults to PKM_ACCESS_TOKEN from .env; the caller stores the result.
     Returns the new long-lived token.
     """
     try:
-        load_dotenv()
-        short_lived_token = os.getenv("PKM_ACCESS_TOKEN")
+        if not short_lived_token:
+            load_dotenv()
+            short_lived_token = os.getenv("PKM_ACCESS_TOKEN")
 
         if not short_lived_token:
             raise Exception("Short-lived token not found in .env file.")
         
-        url = f"https://graph.facebook.com/v21.0/oauth/access_token"
+        url = f"{BASE_URL}oauth/access_token"
         params = {
             'grant_type': 'fb_exchange_token',
             'client_id': APP_ID,
@@ -75,21 +76,17 @@ def generate_new_long_lived_token() -> str:
             'fb_exchange_token': short_lived_token,  # The old short lived access token
         }
 
-        response = requests.get(url, params=params)
-        
-        if response.status_code == 200:
-            new_token_data = response.json()
+        response_status, new_token_data = await graph_client.get(url, params=params, timeout=30)
+
+        if response_status == 200:
             new_long_lived_token = new_token_data.get("access_token")
             
             if new_long_lived_token:
-                # Update the .env file with the new token
-                set_key('.env', 'LONG_LIVED_TOKEN', new_long_lived_token)
-                load_dotenv()  # Reload the environment after updating
                 return new_long_lived_token
             else:
                 raise Exception("Failed to generate a new long-lived token.")
         else:
-            raise Exception(f"Error generating new long-lived token: {response.text}")
+            raise Exception(f"Error generating new long-lived token: {new_token_data}")
     
     except Exception as e:
         raise HTTPException(
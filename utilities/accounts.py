@@ -0,0 +1,182 @@
+import os
+import sys
+from datetime import datetime, timezone
+from functools import partial
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from sqlalchemy.dialects.mysql import insert
+from database.database import SessionLocal
+from database.models import Account
+from utilities.token_manager import TokenManager
+
+load_dotenv()
+
+PKM_INSTAGRAM_ACCOUNT_ID = os.getenv("PKM_INSTAGRAM_ACCOUNT_ID")
+PKM_ACCESS_TOKEN = os.getenv("PKM_ACCESS_TOKEN")
+LONG_LIVED_TOKEN = os.getenv("LONG_LIVED_TOKEN")
+
+# account_id -> TokenManager, one per process
+token_managers = {}
+# account_id -> access token in social_accounts when this process last read or wrote it
+registry_tokens = {}
+
+
+def get_account(db, account_id):
+    return db.query(Account).filter(Account.account_id == account_id).first()
+
+
+def list_active_account_ids(db):
+    """
+    Ids of every active registered account.
+    Falls back to the .env account when the registry is empty.
+    """
+    account_ids = [account_id for (account_id,) in db.query(Account.account_id).filter(Account.is_active.is_(True))]
+    if not account_ids and PKM_INSTAGRAM_ACCOUNT_ID:
+        return [PKM_INSTAGRAM_ACCOUNT_ID]
+    return account_ids
+
+
+def resolve_account_id(db, account_id=None):
+    """
+    Return the account to act on: the one requested, or the .env account by default.
+    """
+    account_id = account_id or PKM_INSTAGRAM_ACCOUNT_ID
+    if account_id != PKM_INSTAGRAM_ACCOUNT_ID and not get_account(db, account_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Account {account_id} is not registered.")
+    return account_id
+
+
+def account_concurrency(db, account_id):
+    """
+    Per-account cap on concurrent Graph calls, or None for the default.
+    """
+    account = get_account(db, account_id)
+    return account.max_concurrency if account else None
+
+
+def _persist_to_registry(account_id, access_token, long_lived_token, expires_at):
+    db = SessionLocal()
+    try:
+        account = get_account(db, account_id)
+        account.access_token = access_token
+        account.long_lived_token = long_lived_token
+        account.token_expires_at = (
+            datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None)
+            if expires_at not in (None, float("inf")) else None
+        )
+        db.commit()
+        registry_tokens[account_id] = access_token
+    finally:
+        db.close()
+
+
+def _expiry_timestamp(token_expires_at):
+    return token_expires_at.replace(tzinfo=timezone.utc).timestamp() if token_expires_at else None
+
+
+def _load_from_registry(account_id):
+    """
+    (access_token, long_lived_token, expires_at) as currently stored, e.g. after another worker refreshed.
+    """
+    db = SessionLocal()
+    try:
+        account = get_account(db, account_id)
+        if account is None:
+            return None
+        registry_tokens[account_id] = account.access_token
+        return account.access_token, account.long_lived_token, _expiry_timestamp(account.token_expires_at)
+    finally:
+        db.close()
+
+
+def _seed_env_account(db):
+    """
+    Register the .env account once. A row that already exists (refreshed by any worker) is left alone.
+    """
+    now = datetime.now(timezone.utc)
+    stmt = insert(Account).values(
+        account_id=PKM_INSTAGRAM_ACCOUNT_ID,
+        access_token=PKM_ACCESS_TOKEN,
+        long_lived_token=LONG_LIVED_TOKEN,
+        is_active=True,
+        max_concurrency=10,
+        created_ts=now,
+        updated_ts=now,
+    )
+    # A no-op update rather than INSERT IGNORE, which would also swallow errors other than the duplicate key
+    db.execute(stmt.on_duplicate_key_update(account_id=stmt.inserted.account_id))
+    db.commit()
+
+
+def get_token_manager(db, account_id):
+    """
+    Return the account's token manager. Tokens live in social_accounts, shared by every worker;
+    the .env account is registered from PKM_ACCESS_TOKEN/LONG_LIVED_TOKEN on first use.
+    A cached manager is replaced once the stored token no longer matches the one it was built from.
+    """
+    account = get_account(db, account_id)
+    if account is None and account_id == PKM_INSTAGRAM_ACCOUNT_ID and PKM_ACCESS_TOKEN:
+        _seed_env_account(db)
+        account = get_account(db, account_id)
+    if account is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Account {account_id} is not registered.")
+
+    # Reused until the row changes under it, e.g. register_account or a refresh by another process
+    manager = token_managers.get(account_id)
+    if manager and registry_tokens.get(account_id) == account.access_token:
+        return manager
+
+    manager = TokenManager(
+        account.access_token,
+        account.long_lived_token,
+        expires_at=_expiry_timestamp(account.token_expires_at),
+        persist=partial(_persist_to_registry, account_id),
+        load=partial(_load_from_registry, account_id),
+        lease_name=f"token:{account_id}",
+    )
+    token_managers[account_id] = manager
+    registry_tokens[account_id] = account.access_token
+    return manager
+
+
+def register_account(db, account_id, access_token, long_lived_token=None, name=None, max_concurrency=None):
+    """
+    Add an account to the registry, or replace its tokens if it is already there.
+    """
+    now = datetime.now(timezone.utc)
+    values = {
+        "account_id": account_id,
+        "name": name,
+        "access_token": access_token,
+        "long_lived_token": long_lived_token,
+        "token_expires_at": None,
+        "is_active": True,
+        "max_concurrency": max_concurrency or 10,
+        "created_ts": now,
+        "updated_ts": now,
+    }
+    stmt = insert(Account).values(**values)
+    db.execute(stmt.on_duplicate_key_update(
+        name=stmt.inserted.name,
+        access_token=stmt.inserted.access_token,
+        long_lived_token=stmt.inserted.long_lived_token,
+        token_expires_at=stmt.inserted.token_expires_at,
+        is_active=stmt.inserted.is_active,
+        max_concurrency=stmt.inserted.max_concurrency,
+        updated_ts=stmt.inserted.updated_ts,
+    ))
+    db.commit()
+    token_managers.pop(account_id, None)
+
+
+if __name__ == "__main__":
+    # python -m utilities.accounts <account_id> <access_token> [long_lived_token] [name]
+    if len(sys.argv) < 3:
+        raise SystemExit("usage: python -m utilities.accounts <account_id> <access_token> [long_lived_token] [name]")
+
+    db = SessionLocal()
+    try:
+        register_account(db, *sys.argv[1:5])
+        print(f"Account {sys.argv[1]} registered.")
+    finally:
+        db.close()
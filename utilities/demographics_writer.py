@@ -0,0 +1,82 @@
+import time
+from datetime import datetime, timezone
+from sqlalchemy.dialects.mysql import insert
+from utilities.running_totals import DEMOGRAPHIC_TABLES, get_demographic_totals, set_demographic_totals
+
+
+def parse_demographics(data):
+    """
+    Flatten an engaged_audience_demographics response into {dimension_value: count}.
+    """
+    counts = {}
+    for item in data.get("data", []):
+        if item.get("name") == "engaged_audience_demographics" and "total_value" in item:
+            for breakdown in item["total_value"].get("breakdowns", []):
+                for result in breakdown.get("results", []):
+                    dimension_values = result.get("dimension_values", [])
+                    if dimension_values:
+                        counts[dimension_values[0]] = result.get("value")
+    return counts
+
+
+def store_breakdown(db, socialmedia_id, breakdown, counts, today_date, now):
+    """
+    Write one breakdown with a single grouped prefetch and a single upsert.
+    Returns the processed rows for the API response.
+    """
+    table_model, attribute_name = DEMOGRAPHIC_TABLES[breakdown]
+    if not counts:
+        return []
+
+    # Last known cumulative count for every dimension value in this breakdown
+    totals = get_demographic_totals(db, socialmedia_id, breakdown, counts.keys())
+
+    rows = [
+        {
+            "socialmedia_id": socialmedia_id,
+            attribute_name: value,
+            "count": new_count - totals.get(value, 0),
+            "snapshot_date": today_date,
+            "created_ts": now,
+            "updated_ts": now,
+        }
+        for value, new_count in counts.items()
+    ]
+
+    # New values insert today's row, values seen earlier today accumulate the delta
+    stmt = insert(table_model).values(rows)
+    db.execute(stmt.on_duplicate_key_update(
+        count=table_model.count + stmt.inserted.count,
+        updated_ts=stmt.inserted.updated_ts,
+    ))
+
+    set_demographic_totals(db, socialmedia_id, breakdown, counts)
+
+    return [{attribute_name: value, "count": new_count} for value, new_count in counts.items()]
+
+
+def store_demographics(db, socialmedia_id, breakdown_data):
+    """
+    Store every breakdown ({"age": response, "gender": response, ...}) in one transaction.
+    Returns ({breakdown: processed rows}, {breakdown: milliseconds spent}).
+    """
+    today_date = datetime.now(timezone.utc).date()
+    now = datetime.now(timezone.utc)
+    results, timings = {}, {}
+
+    try:
+        for breakdown, data in breakdown_data.items():
+            start = time.perf_counter()
+            results[breakdown] = store_breakdown(
+                db, socialmedia_id, breakdown, parse_demographics(data), today_date, now
+            )
+            timings[breakdown] = round((time.perf_counter() - start) * 1000, 2)
+
+        start = time.perf_counter()
+        db.commit()
+        timings["commit"] = round((time.perf_counter() - start) * 1000, 2)
+    except Exception:
+        db.rollback()
+        raise
+
+    return results, timings
@@ -0,0 +1,190 @@
+import io
+import os
+import csv
+import json
+from datetime import date, datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sqlalchemy import select
+from database.database import engine
+from database.models import PostInsights, Posts, SocialMedia
+from utilities.running_totals import DEMOGRAPHIC_TABLES
+
+load_dotenv()
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))  # rows fetched per server-side cursor round trip
+
+
+def post_insights_query(account_id=None, start=None, end=None, after_id=None, limit=None):
+    """
+    Daily post insight deltas joined with their post, in id order.
+    Resume an interrupted export by passing the last exported `id` as `after_id`.
+    """
+    statement = (
+        select(
+            PostInsights.id,
+            Posts.post_id,
+            Posts.account_id,
+            Posts.media_type,
+            Posts.post_created,
+            PostInsights.snapshot_date,
+            PostInsights.reach,
+            PostInsights.likes,
+            PostInsights.saves,
+            PostInsights.updated_ts,
+        )
+        .join(Posts, Posts.id == PostInsights.posts_id)
+        .order_by(PostInsights.id)
+    )
+    if account_id:
+        statement = statement.where(Posts.account_id == account_id)
+    return _filter(statement, PostInsights, start, end, after_id, limit)
+
+
+def demographics_query(breakdown, account_id=None, start=None, end=None, after_id=None, limit=None):
+    """
+    Daily engaged-audience deltas for one breakdown (age, gender or city), in id order.
+    """
+    table_model, attribute_name = DEMOGRAPHIC_TABLES[breakdown]
+    statement = (
+        select(
+            table_model.id,
+            SocialMedia.account_id,
+            table_model.socialmedia_id,
+            getattr(table_model, attribute_name).label("dimension_value"),
+            table_model.count,
+            table_model.snapshot_date,
+            table_model.updated_ts,
+        )
+        .join(SocialMedia, SocialMedia.id == table_model.socialmedia_id)
+        .order_by(table_model.id)
+    )
+    if account_id:
+        statement = statement.where(SocialMedia.account_id == account_id)
+    return _filter(statement, table_model, start, end, after_id, limit)
+
+
+def _filter(statement, table_model, start, end, after_id, limit):
+    if start:
+        statement = statement.where(table_model.snapshot_date >= start)
+    if end:
+        statement = statement.where(table_model.snapshot_date <= end)
+    if after_id:
+        statement = statement.where(table_model.id > after_id)
+    if limit:
+        statement = statement.limit(limit)
+    return statement
+
+
+def stream_partitions(statement, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield the result as lists of plain row tuples, `batch_size` rows at a time,
+    through a server-side cursor so memory stays flat whatever the row count.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def ndjson_chunks(columns, partitions):
+    for partition in partitions:
+        yield "".join(
+            json.dumps({name: _json_value(value) for name, value in zip(columns, row)}) + "\n" for row in partition
+        ).encode()
+
+
+def csv_chunks(columns, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for partition in partitions:
+        writer.writerows(partition)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that hands back what was written since the last drain().
+    tell() keeps counting across drains, so Parquet footer offsets stay right.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_schema(statement):
+    fields = []
+    for column in statement.selected_columns:
+        python_type = column.type.python_type
+        if issubclass(python_type, datetime):
+            arrow_type = pa.timestamp("us")
+        elif issubclass(python_type, date):
+            arrow_type = pa.date32()
+        elif issubclass(python_type, int):
+            arrow_type = pa.int64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def parquet_chunks(statement, partitions):
+    """
+    One Parquet row group per partition, streamed as it is written.
+    """
+    schema = _arrow_schema(statement)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="snappy") as writer:
+        for partition in partitions:
+            arrays = [list(values) for values in zip(*partition)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def export_chunks(statement, export_format):
+    """
+    Encoded bytes of the whole export in `export_format`, produced one partition at a time.
+    """
+    columns = [column.name for column in statement.selected_columns]
+    partitions = stream_partitions(statement)
+    if export_format == "csv":
+        return csv_chunks(columns, partitions)
+    if export_format == "parquet":
+        return parquet_chunks(statement, partitions)
+    return ndjson_chunks(columns, partitions)
@@ -2,180 +2,456 @@ import os
 from datetime import datetime, timezone
 import traceback
 import asyncio
-from asyncio import Semaphore
-from aiohttp import ClientSession, ClientConnectorError
+import numpy as np
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from aiohttp import ClientConnectorError
 from dotenv import load_dotenv
-from sqlalchemy import func
+from sqlalchemy import update
+from sqlalchemy.dialects.mysql import insert
 from fastapi import HTTPException, status
-from database.models import PostInsights, Posts
+from database.models import PostInsights, Posts, PostRunningTotal
+from database.database import async_engine
+from utilities.post_columns import PostColumns
+from utilities.fingerprints import metric_fingerprints
+from utilities.running_totals import get_post_totals, set_post_totals
+from utilities.rollups import add_post_deltas
+from utilities.graph_client import graph_client
+from utilities.graph_batch import graph_batch_async, GraphBatchError, MAX_BATCH_SIZE
+from utilities.graph_recorder import graph_recorder
+from utilities.sync_state import page_reaches_high_water_mark
+from utilities.metrics import GRAPH_RETRIES
 
 load_dotenv()
 
 BASE_URL = os.getenv("BASE_URL")
+PKM_INSTAGRAM_ACCOUNT_ID = os.getenv("PKM_INSTAGRAM_ACCOUNT_ID")
+STORE_CHUNK_SIZE = int(os.getenv("STORE_CHUNK_SIZE", 500))
+SYNC_MAX_PAGES = int(os.getenv("SYNC_MAX_PAGES", 100))  # media pages walked per sync at most
 
-shared_session = None
+MEDIA_FIELDS = "id,media_type,media_url,timestamp"
+INLINE_METRIC_FIELDS = "like_count,insights.metric(reach,saved)"
 
 #To prevent socket exhaustion in http methods
-async def startup_event(): 
-    global shared_session
-    shared_session = ClientSession()
+async def startup_event():
+    await graph_client.start()
 
 async def shutdown_event():
-    global shared_session
-    if shared_session:
-        await shared_session.close()
+    await graph_client.close()
+    await async_engine.dispose()
+    graph_recorder.close()
 
 async def fetch_post_metrics(post_id, token):
-    global shared_session
-    async with shared_session.get(f"{BASE_URL}{post_id}?fields=like_count&access_token={token}") as response:
-        likes_data = await response.json()
+    likes_status, likes_data = await graph_client.get(f"{BASE_URL}{post_id}?fields=like_count&access_token={token}")
+    insights_status, insights_data = await graph_client.get(f"{BASE_URL}{post_id}/insights?metric=reach,saved&access_token={token}")
+    # Same relative urls as the batch path, so replay reads both alike
+    graph_recorder.record("post_metrics", f"{post_id}?fields=like_count", likes_status, likes_data)
+    graph_recorder.record("post_metrics", f"{post_id}/insights?metric=reach,saved", insights_status, insights_data)
+    return likes_data, insights_data
 
-    async with shared_session.get(f"{BASE_URL}{post_id}/insights?metric=reach,saved&access_token={token}") as response:
-        insights_data = await response.json()
 
-    return likes_data, insights_data
+async def fetch_post_metrics_batch(post_ids, token):
+    """
+    Fetch likes and insights for up to 25 posts in a single Graph API batch request.
+    Returns one (likes_data, insights_data) pair per post; either side may be a GraphBatchError.
+    """
+    relative_urls = []
+    for post_id in post_ids:
+        relative_urls.append(f"{post_id}?fields=like_count")
+        relative_urls.append(f"{post_id}/insights?metric=reach,saved")
+
+    results = await graph_batch_async(relative_urls, token)
+    return [(results[2 * i], results[2 * i + 1]) for i in range(len(post_ids))]
 
 
-async def process_posts_async(posts, token, concurrency=50, retries=3, delay=2):
-    semaphore = Semaphore(concurrency)  # Limit to 50 concurrent tasks
-    tasks = []
+async def process_posts_async(posts, token, retries=3, delay=2, failures=None):
+    # Concurrency and pacing come from the shared rate governor in the Graph client
+    # With a `failures` dict, posts that still fail after retries are recorded there (post id -> error)
+    # and get None instead of a metrics pair; without one the first failure propagates
+    batch_size = MAX_BATCH_SIZE // 2  # Two sub-requests per post
 
     async def safe_fetch(post_id, attempt=1):
-        async with semaphore:
-            try:
-                return await fetch_post_metrics(post_id, token)
-            except ClientConnectorError as e:
-                # Retry logic for transient errors
-                if attempt <= retries:
-                    print(f"Retrying post {post_id} (Attempt {attempt}/{retries}) due to: {e}")
-                    await asyncio.sleep(delay * attempt)  # Exponential backoff
-                    return await safe_fetch(post_id, attempt + 1)
-                else:
-                    print(f"Failed to fetch post {post_id} after {retries} attempts: {e}")
-                    raise e
-            except Exception as e:
-                # Handle other exceptions and log them
-                print(f"Error fetching metrics for post {post_id}: {e}")
+        try:
+            return await fetch_post_metrics(post_id, token)
+        except ClientConnectorError as e:
+            # Retry logic for transient errors
+            if attempt <= retries:
+                print(f"Retrying post {post_id} (Attempt {attempt}/{retries}) due to: {e}")
+                GRAPH_RETRIES.labels(reason="connection").inc()
+                await asyncio.sleep(delay * attempt)  # Exponential backoff
+                return await safe_fetch(post_id, attempt + 1)
+            else:
+                print(f"Failed to fetch post {post_id} after {retries} attempts: {e}")
                 raise e
+        except Exception as e:
+            # Handle other exceptions and log them
+            print(f"Error fetching metrics for post {post_id}: {e}")
+            raise e
+
+    async def safe_fetch_batch(post_ids, attempt=1):
+        try:
+            pairs = await fetch_post_metrics_batch(post_ids, token)
+        except ClientConnectorError as e:
+            if attempt <= retries:
+                print(f"Retrying batch of {len(post_ids)} posts (Attempt {attempt}/{retries}) due to: {e}")
+                GRAPH_RETRIES.labels(reason="connection").inc()
+                await asyncio.sleep(delay * attempt)
+                return await safe_fetch_batch(post_ids, attempt + 1)
+            else:
+                print(f"Failed to fetch batch of {len(post_ids)} posts after {retries} attempts: {e}")
+                raise e
+
+        # Sub-requests that failed inside the batch fall back to the per-post path
+        results = []
+        for post_id, (likes_data, insights_data) in zip(post_ids, pairs):
+            if isinstance(likes_data, GraphBatchError) or isinstance(insights_data, GraphBatchError):
+                error = likes_data if isinstance(likes_data, GraphBatchError) else insights_data
+                print(f"Batch sub-request failed for post {post_id} ({error}), fetching individually")
+                GRAPH_RETRIES.labels(reason="batch_fallback").inc()
+                try:
+                    results.append(await safe_fetch(post_id))
+                except Exception as e:
+                    if failures is None:
+                        raise
+                    failures[post_id] = str(e)
+                    results.append(None)
+            else:
+                results.append((likes_data, insights_data))
+        return results
+
+    async def fetch_or_record(post_ids):
+        try:
+            return await safe_fetch_batch(post_ids)
+        except Exception as e:
+            if failures is None:
+                raise
+            failures.update((post_id, str(e)) for post_id in post_ids)
+            return [None] * len(post_ids)
 
-    for post in posts:
-        post_id = post["id"]
-        tasks.append(safe_fetch(post_id))
+    post_ids = [post["id"] for post in posts]
+    tasks = [fetch_or_record(post_ids[i:i + batch_size]) for i in range(0, len(post_ids), batch_size)]
 
-    # Gather all tasks and let exceptions propagate if retries fail
-    results = await asyncio.gather(*tasks)
-    return results
+    # Gather all batches and let exceptions propagate if retries fail
+    batches = await asyncio.gather(*tasks)
+    return [pair for batch in batches for pair in batch]
 
 
 async def get_posts_async(url, params):
-    global shared_session
     try:
-        async with shared_session.get(url, params=params) as response:
-            if response.status != 200:
-                raise HTTPException(
-                    status_code=response.status,
-                    detail=f"Failed to fetch posts: {await response.text()}",
-                )
-            return await response.json()
+        response_status, body = await graph_client.get(url, params=params)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred while fetching posts: {str(e)}",
         )
+    graph_recorder.record("media_page", strip_access_token(url, params), response_status, body)
+    if response_status != 200:
+        raise HTTPException(
+            status_code=response_status,
+            detail=f"Failed to fetch posts: {body}",
+        )
+    return body
+
 
-def store_posts_and_metrics(posts, metrics, db):
+def _with_fields(url, params, fields):
     """
-    Store posts and their metrics in the database.
+    Rebuild a /media page request as (url, params) asking for `fields`, keeping its cursor.
     """
-    try:
-        # Create or update posts in bulk
-        for i, post in enumerate(posts):
-            post_id = post["id"]
-            media_type = post["media_type"]
-            media_url = post.get("media_url", None)
-            raw_timestamp = post.get("timestamp")
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update(params or {})
+    query["fields"] = fields
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", "")), query
+
 
+def strip_access_token(url, params=None):
+    """
+    A request URL (with `params` folded in) without its access_token, safe to persist as a resume cursor.
+    """
+    if not url:
+        return url
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update(params or {})
+    query.pop("access_token", None)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _cursor_request(cursor, token):
+    """
+    Split a stored cursor into (url, params) with a current access token.
+    """
+    parts = urlsplit(cursor)
+    query = dict(parse_qsl(parts.query))
+    query["access_token"] = token
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", "")), query
+
+
+async def iter_post_pages(
+    account_id, token, high_water_mark=(None, None), page_size=100, max_pages=SYNC_MAX_PAGES, inline_metrics=True,
+    cursor=None, with_cursor=False,
+):
+    """
+    Yield the account's media one page at a time, newest first.
+    With `inline_metrics`, like_count and reach/saved insights are requested as nested fields so
+    they arrive with each page; a page whose expansion fails is re-read without them.
+    Pagination stops after the first page that reaches `high_water_mark`
+    (last_post_id, last_post_created), so established accounts only walk one or two pages.
+    Pass a `cursor` saved from an earlier walk to start from that page instead of the newest one.
+    With `with_cursor`, yields (cursor, page): the token-free URL that re-reads the page
+    (None for the newest page), then the page.
+    """
+    last_post_id, last_post_created = high_water_mark
+    fields = f"{MEDIA_FIELDS},{INLINE_METRIC_FIELDS}" if inline_metrics else MEDIA_FIELDS
+
+    posts_url = f"{BASE_URL}{account_id}/media"
+    params = {
+        "fields": fields,
+        "access_token": token,
+        "limit": page_size,
+    }
+    page_cursor = cursor
+    if cursor:
+        posts_url, params = _with_fields(*_cursor_request(cursor, token), fields)
+
+    pages = 0
+    while posts_url and pages < max_pages:  # Prevent infinite loops
+        try:
+            response = await get_posts_async(posts_url, params)
+        except HTTPException as e:
+            if not inline_metrics:
+                raise
+            # Some media types reject the insights expansion; read the page without it
+            print(f"Nested metric fields failed for {posts_url}, retrying without them: {e.detail}")
+            GRAPH_RETRIES.labels(reason="plain_fields").inc()
+            response = await get_posts_async(*_with_fields(posts_url, params, MEDIA_FIELDS))
+        pages += 1
+        page = response.get("data", [])
+        yield (page_cursor, page) if with_cursor else page
+
+        if page_reaches_high_water_mark(page, last_post_id, last_post_created):
+            break
+
+        # paging.next carries the cursor and the query parameters of the request that answered,
+        # which lost the nested fields if this page fell back; the walk asks for them again
+        posts_url = response.get("paging", {}).get("next")
+        if not posts_url:
+            break
+        posts_url, params = _with_fields(posts_url, None, fields)
+        page_cursor = strip_access_token(posts_url, params)
+
+
+def inline_post_metrics(post):
+    """
+    Return the (likes_data, insights_data) pair carried inline on a /media item,
+    or None if the nested expansion did not return both.
+    """
+    insights_data = post.get("insights")
+    if "like_count" not in post or not insights_data or "data" not in insights_data:
+        return None
+    return {"like_count": post["like_count"]}, insights_data
+
+
+async def collect_post_metrics(posts, token, failures=None):
+    """
+    Return one (likes_data, insights_data) pair per post, in order.
+    Metrics that arrived inline with the listing are used as-is; the rest are fetched separately.
+    With a `failures` dict, posts whose fetch failed get None and their error is recorded by post id.
+    """
+    metrics = [inline_post_metrics(post) for post in posts]
+    missing = [post for post, metric in zip(posts, metrics) if metric is None]
+
+    if missing:
+        print(f"Fetching metrics separately for {len(missing)} of {len(posts)} posts")
+        fetched = iter(await process_posts_async(missing, token, failures=failures))
+        metrics = [metric if metric is not None else next(fetched) for metric in metrics]
+
+    return metrics
+
+
+def _store_chunk(columns, db, today_date, now, account_id):
+    """
+    Write one chunk of PostColumns using a handful of set-based statements.
+    Posts whose stored fingerprint matches their counters are dropped before any write.
+    Returns (rows_inserted, rows_updated, posts_skipped).
+    """
+    post_ids = columns.post_ids.tolist()
+    fingerprints = columns.fingerprints()
+
+    # Prefetch the posts we already know about, with the fingerprint of their last written counters
+    known = (
+        db.query(Posts.post_id, Posts.id, PostRunningTotal.fingerprint, Posts.media_hash, Posts.media_url)
+        .outerjoin(PostRunningTotal, PostRunningTotal.posts_id == Posts.id)
+        .filter(Posts.post_id.in_(post_ids))
+        .all()
+    )
+    existing_posts = {post_id: posts_id for post_id, posts_id, _, _, _ in known}
+    stored = {post_id: fingerprint for post_id, _, fingerprint, _, _ in known}
+
+    # CDN URLs expire: posts not mirrored yet take the URL they were just listed with,
+    # and get a fresh set of mirroring attempts with it
+    unmirrored = {post_id: (posts_id, media_url) for post_id, posts_id, _, media_hash, media_url in known if media_hash is None}
+    url_updates = []
+    for post_id, media_url in zip(post_ids, columns.media_urls.tolist()):
+        if post_id in unmirrored and media_url and media_url != unmirrored[post_id][1]:
+            url_updates.append({
+                "id": unmirrored[post_id][0], "media_url": media_url, "media_failures": 0, "media_checked_ts": None,
+            })
+    if url_updates:
+        db.execute(update(Posts), url_updates)
+
+    unchanged = np.fromiter(
+        (stored.get(post_id) == fingerprint for post_id, fingerprint in zip(post_ids, fingerprints.tolist())),
+        bool,
+        len(columns),
+    )
+    skipped = int(unchanged.sum())
+    if skipped:
+        columns = columns.take(~unchanged)
+        fingerprints = fingerprints[~unchanged]
+        post_ids = columns.post_ids.tolist()
+    count = len(columns)
+    if not count:
+        return 0, 0, skipped
+
+    # Bulk insert the missing posts, then read back their primary keys
+    new_posts = []
+    is_new = np.fromiter((post_id not in existing_posts for post_id in post_ids), bool, count)
+    if is_new.any():
+        fresh = columns.take(is_new)
+        for post_id, media_type, media_url, post_created in zip(
+            fresh.post_ids.tolist(), fresh.media_types.tolist(), fresh.media_urls.tolist(), fresh.post_created.tolist()
+        ):
             if not media_url:
                 print(f"Post {post_id} is missing 'media_url'. Skipping...")
+            new_posts.append({
+                "post_id": post_id,
+                "account_id": account_id,
+                "media_type": media_type,
+                "media_url": media_url,
+                "post_created": post_created or None,
+                "created_ts": now,
+                "updated_ts": now,
+            })
 
-            # Parse post creation timestamp
-            post_created = None
-            if raw_timestamp:
-                utc_time = datetime.strptime(raw_timestamp, "%Y-%m-%dT%H:%M:%S%z")
-                post_created = utc_time.strftime("%Y-%m-%d")
-
-            # Check if the post already exists in the database
-            existing_post = db.query(Posts).filter(Posts.post_id == post_id).first()
-            if not existing_post:
-                db_post = Posts(
-                    post_id=post_id,
-                    media_type=media_type,
-                    media_url=media_url,
-                    post_created=post_created,
-                    created_ts=datetime.now(timezone.utc),
-                    updated_ts=datetime.now(timezone.utc),
-                )
-                db.add(db_post)
-                db.commit()
-                db.refresh(db_post)
-            else:
-                db_post = existing_post
-
-            # Process metrics
-            likes_data, insights_data = metrics[i]
-            like_count = likes_data.get("like_count", 0)
-            reach = next(
-                (item["values"][0]["value"] for item in insights_data.get("data", []) if item["name"] == "reach"), 0
-            )
-            saves = next(
-                (item["values"][0]["value"] for item in insights_data.get("data", []) if item["name"] == "saved"), 0
-            )
-
-            # Fetch existing metrics and calculate differences
-            existing_sums = db.query(
-                func.sum(PostInsights.likes).label("total_likes"),
-                func.sum(PostInsights.saves).label("total_saves"),
-                func.sum(PostInsights.reach).label("total_reach"),
-            ).filter(PostInsights.posts_id == db_post.id).first()
-
-            total_likes = existing_sums.total_likes or 0
-            total_saves = existing_sums.total_saves or 0
-            total_reach = existing_sums.total_reach or 0
-
-            new_likes = like_count - total_likes
-            new_saves = saves - total_saves
-            new_reach = reach - total_reach
-
-            today_date = datetime.now(timezone.utc).date()
-            existing_insight = db.query(PostInsights).filter(
-                PostInsights.posts_id == db_post.id,
-                func.date(PostInsights.created_ts) == today_date,
-            ).first()
-
-            if existing_insight:
-                existing_insight.reach += new_reach
-                existing_insight.likes += new_likes
-                existing_insight.saves += new_saves
-                existing_insight.updated_ts = datetime.now(timezone.utc)
-                db.commit()
-                db.refresh(existing_insight)
-            else:
-                db_insight = PostInsights(
-                    posts_id=db_post.id,
-                    reach=new_reach,
-                    likes=new_likes,
-                    saves=new_saves,
-                    created_ts=datetime.now(timezone.utc),
-                    updated_ts=datetime.now(timezone.utc),
-                )
-                db.add(db_insight)
-                db.commit()
-                db.refresh(db_insight)
+        # The unique key on post_id makes a concurrent insert of the same post a no-op
+        stmt = insert(Posts).values(new_posts)
+        db.execute(stmt.on_duplicate_key_update(post_id=stmt.inserted.post_id))
+        existing_posts.update(
+            db.query(Posts.post_id, Posts.id)
+            .filter(Posts.post_id.in_([row["post_id"] for row in new_posts]))
+            .all()
+        )
+
+    pk_ids = [existing_posts[post_id] for post_id in post_ids]
+
+    # Prefetch the last known cumulative counters, and which posts already have a row today
+    prior_totals = get_post_totals(db, pk_ids)
+
+    has_row_today = {
+        posts_id
+        for (posts_id,) in db.query(PostInsights.posts_id).filter(
+            PostInsights.posts_id.in_(pk_ids),
+            PostInsights.snapshot_date == today_date,
+        )
+    }
+
+    # Every delta in one vectorized pass: current counters minus prior totals, columns (likes, reach, saves)
+    current = columns.counters()
+    prior = np.array([prior_totals.get(posts_id, (0, 0, 0)) for posts_id in pk_ids], dtype=np.int64).reshape(count, 3)
+    deltas = current - prior
+
+    insight_rows, totals = [], []
+    for posts_id, (likes, reach, saves), (total_likes, total_reach, total_saves), fingerprint in zip(
+        pk_ids, deltas.tolist(), current.tolist(), fingerprints.tolist()
+    ):
+        totals.append({
+            "posts_id": posts_id,
+            "likes": total_likes,
+            "reach": total_reach,
+            "saves": total_saves,
+            "fingerprint": fingerprint,
+        })
+        insight_rows.append({
+            "posts_id": posts_id,
+            "snapshot_date": today_date,
+            "reach": reach,
+            "likes": likes,
+            "saves": saves,
+            "created_ts": now,
+            "updated_ts": now,
+        })
+
+    # One upsert on (posts_id, snapshot_date): new days insert, today's row accumulates the delta
+    if insight_rows:
+        stmt = insert(PostInsights).values(insight_rows)
+        db.execute(stmt.on_duplicate_key_update(
+            reach=PostInsights.reach + stmt.inserted.reach,
+            likes=PostInsights.likes + stmt.inserted.likes,
+            saves=PostInsights.saves + stmt.inserted.saves,
+            updated_ts=stmt.inserted.updated_ts,
+        ))
+    set_post_totals(db, totals)
+    add_post_deltas(db, account_id, insight_rows)
+
+    updated = sum(1 for posts_id in pk_ids if posts_id in has_row_today)
+    return len(new_posts) + count - updated, updated, skipped
+
+
+def store_posts_and_metrics(posts, metrics, db, chunk_size=None, account_id=None):
+    """
+    Store posts and their metrics in the database.
+    Posts are written in chunks of `chunk_size` with one transaction per chunk.
+    Returns a summary with the number of rows inserted and updated, and of unchanged posts skipped.
+    """
+    return store_post_columns(PostColumns.from_posts(posts, metrics), db, chunk_size, account_id)
+
+
+def store_post_columns(columns, db, chunk_size=None, account_id=None, snapshot_date=None):
+    """
+    Store a PostColumns batch, `chunk_size` posts per transaction.
+    Posts whose likes/reach/saves haven't moved since they were last written are skipped
+    without touching the database when the fingerprint LRU knows them.
+    Deltas land on `snapshot_date`, today (UTC) by default.
+    Returns a summary with the number of rows inserted and updated, and of posts skipped.
+    """
+    chunk_size = chunk_size or STORE_CHUNK_SIZE
+    account_id = account_id or PKM_INSTAGRAM_ACCOUNT_ID
+
+    # Later entries win if the listing returned the same post twice
+    columns = columns.dedupe()
+
+    today_date = snapshot_date or datetime.now(timezone.utc).date()
+    now = datetime.now(timezone.utc)
+    summary = {"inserted": 0, "updated": 0, "skipped": 0}
+
+    # Drop posts the LRU has already seen with these exact counters
+    fingerprints = columns.fingerprints()
+    cached = metric_fingerprints.get_many(columns.post_ids.tolist())
+    unchanged = np.fromiter(
+        (seen == fingerprint for seen, fingerprint in zip(cached, fingerprints.tolist())), bool, len(columns)
+    )
+    if unchanged.any():
+        summary["skipped"] += int(unchanged.sum())
+        columns = columns.take(~unchanged)
+
+    try:
+        for start in range(0, len(columns), chunk_size):
+            chunk = columns.take(slice(start, start + chunk_size))
+            inserted, updated, skipped = _store_chunk(chunk, db, today_date, now, account_id)
+            db.commit()
+            # Only committed counters go into the LRU
+            metric_fingerprints.update(zip(chunk.post_ids.tolist(), chunk.fingerprints().tolist()))
+            summary["inserted"] += inserted
+            summary["updated"] += updated
+            summary["skipped"] += skipped
+
+        return summary
 
     except Exception as e:
+        db.rollback()
         traceback.print_exc()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to store posts and metrics: {str(e)}",
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,45 @@
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRIC_FINGERPRINT_CACHE_SIZE = int(os.getenv("METRIC_FINGERPRINT_CACHE_SIZE", 200_000))  # posts remembered
+
+
+class FingerprintCache:
+    """
+    LRU of post_id -> fingerprint of the counters last written for the post.
+    Backed by social_post_totals.fingerprint: a miss here falls back to the stored column.
+    Only updated after a commit, so it never claims a write that was rolled back.
+    """
+    def __init__(self, max_size=METRIC_FINGERPRINT_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()  # writers run in worker threads
+
+    def get_many(self, post_ids):
+        with self.lock:
+            found = []
+            for post_id in post_ids:
+                fingerprint = self.entries.get(post_id)
+                if fingerprint is not None:
+                    self.entries.move_to_end(post_id)
+                found.append(fingerprint)
+            return found
+
+    def update(self, pairs):
+        with self.lock:
+            for post_id, fingerprint in pairs:
+                self.entries[post_id] = fingerprint
+                self.entries.move_to_end(post_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+metric_fingerprints = FingerprintCache()
@@ -0,0 +1,99 @@
+import os
+import json
+import asyncio
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from utilities.graph_client import graph_client, TOKEN_REJECTED_CODE
+from utilities.graph_recorder import graph_recorder
+from utilities.rate_limiter import current_rate_governor, throttle_error_code
+from utilities.metrics import GRAPH_RETRIES, GRAPH_THROTTLES
+
+load_dotenv()
+
+BASE_URL = os.getenv("BASE_URL")
+MAX_BATCH_SIZE = 50  # Graph API limit on sub-requests per batch
+
+
+class GraphBatchError(Exception):
+    """
+    A single failed sub-request inside a Graph API batch.
+    """
+    def __init__(self, status_code, detail, code=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.code = code  # Graph error code, if the sub-response carried one
+
+
+def _batch_payload(relative_urls, token):
+    return {
+        "access_token": token,
+        "include_headers": "false",
+        "batch": json.dumps([{"method": "GET", "relative_url": url} for url in relative_urls]),
+    }
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def unpack_batch_response(relative_urls, batch_response):
+    """
+    Turn a raw batch response into one entry per sub-request, in order.
+    Successful entries are the decoded JSON body, failed ones a GraphBatchError.
+    """
+    results = []
+    for url, item in zip(relative_urls, batch_response):
+        # Graph returns null for sub-requests it did not get to before timing out
+        if item is None:
+            results.append(GraphBatchError(504, f"Batch sub-request timed out: {url}"))
+            continue
+
+        try:
+            body = json.loads(item.get("body") or "{}")
+        except ValueError:
+            body = {}
+
+        code = throttle_error_code(body)
+        if code is not None:
+            GRAPH_THROTTLES.labels(code=code).inc()
+            current_rate_governor.get().throttled(code, 0)
+
+        if item.get("code") != 200 or "error" in body:
+            error = body.get("error", {})
+            message = error.get("message", item.get("body"))
+            results.append(GraphBatchError(item.get("code") or 502, f"{url}: {message}", error.get("code")))
+        else:
+            results.append(body)
+    return results
+
+
+async def graph_batch_async(relative_urls, token, timeout=None):
+    """
+    Run GET sub-requests through the Graph API batch endpoint, 50 per round trip.
+    Chunks are sent concurrently; returns one result per url (decoded body or GraphBatchError).
+    """
+    async def send(chunk, token=token, retried=False):
+        response_status, body = await graph_client.post(BASE_URL, data=_batch_payload(chunk, token), timeout=timeout)
+        if response_status != 200:
+            raise HTTPException(
+                status_code=response_status,
+                detail=f"Batch request failed: {body}",
+            )
+        graph_recorder.record_batch(chunk, body)
+        results = unpack_batch_response(chunk, body)
+
+        # The batch itself went through but its sub-requests were refused the token
+        rejected = any(isinstance(result, GraphBatchError) and result.code == TOKEN_REJECTED_CODE for result in results)
+        if rejected and not retried:
+            fresh = await graph_client.refreshed_token(token)
+            if fresh:
+                print(f"Graph rejected the access token for {len(chunk)} batch sub-requests, retrying with a refreshed one")
+                GRAPH_RETRIES.labels(reason="token").inc()
+                return await send(chunk, fresh, retried=True)
+        return results
+
+    chunks = list(_chunks(list(relative_urls), MAX_BATCH_SIZE))
+    responses = await asyncio.gather(*(send(chunk) for chunk in chunks))
+    return [result for chunk_results in responses for result in chunk_results]
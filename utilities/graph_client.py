@@ -0,0 +1,185 @@
+import os
+import time
+from contextvars import ContextVar
+from urllib.parse import urlsplit, parse_qsl
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from dotenv import load_dotenv
+from utilities.rate_limiter import current_rate_governor, throttle_error_code
+from utilities.metrics import GRAPH_REQUEST_SECONDS, GRAPH_RETRIES, GRAPH_THROTTLES, GRAPH_SLOT_WAIT_SECONDS, graph_endpoint
+
+load_dotenv()
+
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", 60))  # seconds, per call
+GRAPH_CONNECTION_LIMIT = int(os.getenv("GRAPH_CONNECTION_LIMIT", 100))
+GRAPH_CONNECTIONS_PER_HOST = int(os.getenv("GRAPH_CONNECTIONS_PER_HOST", 50))
+GRAPH_DNS_CACHE_TTL = int(os.getenv("GRAPH_DNS_CACHE_TTL", 300))
+GRAPH_KEEPALIVE_TIMEOUT = float(os.getenv("GRAPH_KEEPALIVE_TIMEOUT", 60))
+GRAPH_THROTTLE_RETRIES = int(os.getenv("GRAPH_THROTTLE_RETRIES", 5))
+
+# OAuthException: the token expired early, was revoked or was invalidated by a password change
+TOKEN_REJECTED_CODE = 190
+
+# Token manager the current task's Graph calls take their access token from
+current_token_manager = ContextVar("current_token_manager", default=None)
+
+
+def token_rejected(body):
+    """
+    True if `body` is Graph's error for an access token it no longer accepts.
+    """
+    return isinstance(body, dict) and isinstance(body.get("error"), dict) and body["error"].get("code") == TOKEN_REJECTED_CODE
+
+
+def _request_token(url, params, data):
+    for values in (params, data):
+        if isinstance(values, dict) and values.get("access_token"):
+            return values["access_token"]
+    return dict(parse_qsl(urlsplit(url).query)).get("access_token")
+
+
+def _with_token(url, params, data, old, new):
+    """
+    (url, params, data) with access token `old` replaced by `new` wherever it is carried.
+    """
+    def swap(values):
+        if isinstance(values, dict) and values.get("access_token") == old:
+            return {**values, "access_token": new}
+        return values
+    return url.replace(f"access_token={old}", f"access_token={new}"), swap(params), swap(data)
+
+
+class GraphClient:
+    """
+    One pooled aiohttp session for every Graph API call made by the service.
+    """
+    def __init__(self):
+        self.session = None
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            connector = TCPConnector(
+                limit=GRAPH_CONNECTION_LIMIT,
+                limit_per_host=GRAPH_CONNECTIONS_PER_HOST,
+                ttl_dns_cache=GRAPH_DNS_CACHE_TTL,
+                keepalive_timeout=GRAPH_KEEPALIVE_TIMEOUT,
+            )
+            self.session = ClientSession(
+                connector=connector,
+                timeout=ClientTimeout(total=GRAPH_TIMEOUT),
+                headers={"Accept-Encoding": "gzip, deflate"},
+                auto_decompress=True,
+            )
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def request(self, method, url, params=None, data=None, timeout=None):
+        """
+        Send a request and return (status, decoded JSON body).
+        Non-JSON bodies are wrapped as {"error": {"message": <text>}}.
+        Calls are paced by the shared rate governor and retried with backoff on throttle errors.
+        With a token manager in current_token_manager, a call whose token Graph rejects (code 190)
+        invalidates it and is sent once more with the refreshed token; later calls still carrying the
+        rejected token get the refreshed one before they are sent.
+        """
+        if self.session is None:
+            await self.start()
+
+        token = _request_token(url, params, data) if current_token_manager.get() else None
+        fresh = await self.current_token(token)
+        if fresh != token:
+            url, params, data = _with_token(url, params, data, token, fresh)
+            token = fresh
+
+        response_status, body = await self._send(method, url, params, data, timeout)
+        if token_rejected(body):
+            fresh = await self.refreshed_token(token)
+            if fresh:
+                print("Graph rejected the access token, retrying with a refreshed one")
+                GRAPH_RETRIES.labels(reason="token").inc()
+                url, params, data = _with_token(url, params, data, token, fresh)
+                response_status, body = await self._send(method, url, params, data, timeout)
+        return response_status, body
+
+    async def current_token(self, token):
+        """
+        `token`, or the refreshed token if Graph already rejected it.
+        """
+        manager = current_token_manager.get()
+        if manager is None or not token or not manager.issued(token):
+            return token
+        return await manager.current_for(token)
+
+    async def refreshed_token(self, token):
+        """
+        Invalidate a token Graph just rejected and return its refreshed replacement,
+        or None if it was not issued by the current token manager or did not change.
+        """
+        manager = current_token_manager.get()
+        if manager is None:
+            return None
+        return await manager.refreshed_token(token)
+
+    async def _send(self, method, url, params, data, timeout):
+        rate_governor = current_rate_governor.get()
+        kwargs = {"timeout": ClientTimeout(total=timeout)} if timeout else {}
+        endpoint = graph_endpoint(url)
+        for attempt in range(GRAPH_THROTTLE_RETRIES + 1):
+            wait_start = time.perf_counter()
+            async with rate_governor.slot():
+                start = time.perf_counter()
+                GRAPH_SLOT_WAIT_SECONDS.observe(start - wait_start)
+                async with self.session.request(method, url, params=params, data=data, **kwargs) as response:
+                    rate_governor.observe(response.headers)
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = {"error": {"message": await response.text()}}
+                GRAPH_REQUEST_SECONDS.labels(endpoint=endpoint, status=response.status).observe(time.perf_counter() - start)
+
+            code = throttle_error_code(body)
+            if code is not None:
+                GRAPH_THROTTLES.labels(code=code).inc()
+            if code is None or attempt == GRAPH_THROTTLE_RETRIES:
+                return response.status, body
+
+            GRAPH_RETRIES.labels(reason="throttle").inc()
+
+            # The governor pauses every caller; the next slot() waits out the backoff
+            delay = rate_governor.throttled(code, attempt)
+            print(f"Graph throttled request (code {code}), backing off {delay:.1f}s (Attempt {attempt + 1}/{GRAPH_THROTTLE_RETRIES})")
+
+    async def download(self, url, sink, max_bytes, timeout=None):
+        """
+        Stream a file (e.g. a CDN media URL) into `sink` over the shared session, outside the Graph rate governor.
+        `sink` takes each chunk through write(), so only one chunk is held in memory.
+        Returns (status, content type); nothing is written unless the status is 200.
+        Raises ValueError past `max_bytes`.
+        """
+        if self.session is None:
+            await self.start()
+
+        kwargs = {"timeout": ClientTimeout(total=timeout)} if timeout else {}
+        async with self.session.get(url, **kwargs) as response:
+            if response.status != 200:
+                return response.status, None
+            if response.content_length and response.content_length > max_bytes:
+                raise ValueError(f"{response.content_length} bytes is over the {max_bytes} byte limit")
+            size = 0
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Download is over the {max_bytes} byte limit")
+                sink.write(chunk)
+            return response.status, response.content_type
+
+    async def get(self, url, params=None, timeout=None):
+        return await self.request("GET", url, params=params, timeout=timeout)
+
+    async def post(self, url, data=None, timeout=None):
+        return await self.request("POST", url, data=data, timeout=timeout)
+
+
+graph_client = GraphClient()
@@ -0,0 +1,118 @@
+import os
+import gzip
+import heapq
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GRAPH_RECORD_DIR = os.getenv("GRAPH_RECORD_DIR")  # unset: nothing is recorded
+GRAPH_RECORD_SEGMENT_BYTES = int(os.getenv("GRAPH_RECORD_SEGMENT_BYTES", 64 * 1024 * 1024))  # uncompressed, per segment
+
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+
+class GraphRecorder:
+    """
+    Appends raw Graph API responses to gzip-compressed NDJSON segments under `directory`.
+    One record per line: {"ts", "source", "url", "status", "body"}; URLs never carry the access token.
+    A new segment is started once the current one holds `segment_bytes` of uncompressed records,
+    and segments are never rewritten, so they can be copied or replayed while recording goes on.
+    """
+    def __init__(self, directory=GRAPH_RECORD_DIR, segment_bytes=GRAPH_RECORD_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.file = None
+        self.written = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def record(self, source, url, status, body):
+        """
+        `source` is "media_page", "post_metrics" or "batch"; `url` is relative to BASE_URL or absolute.
+        """
+        if not self.enabled:
+            return
+        line = json.dumps(
+            {"ts": time.time(), "source": source, "url": url, "status": status, "body": body},
+            separators=(",", ":"),
+        ).encode() + b"\n"
+        with self.lock:
+            if self.file is None or self.written >= self.segment_bytes:
+                self._roll()
+            self.file.write(line)
+            self.written += len(line)
+
+    def record_batch(self, relative_urls, batch_response):
+        """
+        Record each raw sub-response of a batch call ({"code", "body"} or null) under its relative url.
+        """
+        if not self.enabled or not isinstance(batch_response, list):
+            return
+        for url, item in zip(relative_urls, batch_response):
+            self.record("batch", url, item.get("code") if item else None, item)
+
+    def _roll(self):
+        if self.file is not None:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.sequence += 1
+        started = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        name = f"graph-{started}-{os.getpid()}-{self.sequence:04d}{SEGMENT_SUFFIX}"
+        # Exclusive create: an existing segment is never appended to or truncated
+        self.file = gzip.open(os.path.join(self.directory, name), "xb")
+        self.written = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def segment_paths(paths):
+    """
+    Expand directories into their segments.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(SEGMENT_SUFFIX)
+            )
+        else:
+            found.append(path)
+    return found
+
+
+def _segment_records(path):
+    """
+    Yield the records of one segment. A segment cut short (its process was killed mid-write)
+    yields what it holds up to the cut.
+    """
+    with gzip.open(path, "rb") as segment:
+        try:
+            for line in segment:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile, ValueError) as e:
+            print(f"Segment {path} ends early ({e}), continuing with the next one")
+
+
+def read_records(paths):
+    """
+    Yield the records of every segment in recording order.
+    Several workers record side by side, each to its own segments, so segments overlap in time:
+    records are merged across all of them by `ts` rather than read one segment after another.
+    """
+    yield from heapq.merge(*(_segment_records(path) for path in segment_paths(paths)), key=lambda record: record["ts"])
+
+
+graph_recorder = GraphRecorder()
@@ -0,0 +1,168 @@
+"""
+Feed recorded Graph API responses back through the posts storage path, without calling the API.
+
+    python -m utilities.graph_replay <segment or directory>... [--account <account_id>]
+
+Segments come from GRAPH_RECORD_DIR (see utilities.graph_recorder). Media pages and per-post
+likes/insights are paired up and stored with store_post_columns, with each delta dated on the
+day it was recorded. Account and demographic insights are recorded but not replayed.
+"""
+import sys
+import json
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from utilities.graph_recorder import read_records
+from utilities.fetch_posts_helper import inline_post_metrics, store_post_columns, STORE_CHUNK_SIZE, PKM_INSTAGRAM_ACCOUNT_ID
+from utilities.post_columns import PostColumns
+
+LIKES_QUERY = "fields=like_count"
+INSIGHTS_QUERY = "metric=reach,saved"
+
+
+def _response_body(record):
+    """
+    The decoded body of a successful response, or None if the call failed.
+    """
+    body = record["body"]
+    if record["source"] == "batch":
+        # Raw batch sub-response: {"code", "body": "<json>"} or null
+        if not body or body.get("code") != 200:
+            return None
+        try:
+            body = json.loads(body.get("body") or "{}")
+        except ValueError:
+            return None
+    elif record["status"] != 200:
+        return None
+    if not isinstance(body, dict) or "error" in body:
+        return None
+    return body
+
+
+def _post_metric_kind(url):
+    """
+    ("likes" | "insights", post_id) for a per-post metrics url, else (None, None).
+    """
+    path, _, query = url.partition("?")
+    if query == LIKES_QUERY and "/" not in path:
+        return "likes", path
+    if query == INSIGHTS_QUERY and path.endswith("/insights"):
+        return "insights", path[: -len("/insights")]
+    return None, None
+
+
+class PostReplay:
+    """
+    Pairs recorded posts with their metrics and stores them in batches of `chunk_size`,
+    flushing whenever the recording moves on to a new day. Records must arrive in `ts` order (see read_records).
+    """
+    def __init__(self, db, account_id=None, chunk_size=STORE_CHUNK_SIZE):
+        self.db = db
+        self.account_id = account_id
+        self.chunk_size = chunk_size
+        self.listed = {}  # post_id -> (/media item, account_id) for every post seen on a page
+        self.partial = {}  # post_id -> {"likes": ..., "insights": ...} until both have arrived
+        self.buffers = {}  # account_id -> ([/media items], [(likes_data, insights_data)])
+        self.buffered = 0
+        self.day = None
+        self.summary = {"records": 0, "posts": 0, "failed_responses": 0, "inserted": 0, "updated": 0, "skipped": 0}
+
+    def feed(self, record):
+        self.summary["records"] += 1
+        day = datetime.fromtimestamp(record["ts"], timezone.utc).date()
+        if self.day is None or day > self.day:
+            self.flush()
+            self.day = day
+        # A record stamped just before midnight can land after the first one of the next day;
+        # it is stored on the current day, as snapshot dates and running totals only move forward
+
+        body = _response_body(record)
+        if body is None:
+            self.summary["failed_responses"] += 1
+            return
+
+        if record["source"] == "media_page":
+            self._media_page(record["url"], body)
+            return
+
+        kind, post_id = _post_metric_kind(record["url"])
+        if kind is None:
+            return  # account-level insights
+        pair = self.partial.setdefault(post_id, {})
+        pair[kind] = body
+        if len(pair) == 2:
+            del self.partial[post_id]
+            post, account_id = self.listed.get(post_id, ({"id": post_id}, self.account_id))
+            self._add(account_id, post, ({"like_count": pair["likes"].get("like_count", 0)}, pair["insights"]))
+
+    def _media_page(self, url, body):
+        # .../<account_id>/media
+        account_id = self.account_id or urlsplit(url).path.rstrip("/").split("/")[-2]
+        for post in body.get("data", []):
+            metrics = inline_post_metrics(post)
+            if metrics is not None:
+                self._add(account_id, post, metrics)
+            else:
+                # Metrics follow in per-post or batch records
+                self.listed[post["id"]] = (
+                    {key: post.get(key) for key in ("id", "media_type", "media_url", "timestamp")}, account_id
+                )
+
+    def _add(self, account_id, post, metrics):
+        posts, pairs = self.buffers.setdefault(account_id, ([], []))
+        posts.append(post)
+        pairs.append(metrics)
+        self.buffered += 1
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        for account_id, (posts, pairs) in self.buffers.items():
+            result = store_post_columns(
+                PostColumns.from_posts(posts, pairs), self.db, self.chunk_size,
+                account_id or PKM_INSTAGRAM_ACCOUNT_ID, snapshot_date=self.day,
+            )
+            self.summary["posts"] += len(posts)
+            for key in ("inserted", "updated", "skipped"):
+                self.summary[key] += result[key]
+        self.buffers = {}
+        self.buffered = 0
+
+
+def replay_segments(paths, db, account_id=None, chunk_size=STORE_CHUNK_SIZE):
+    """
+    Store every post recorded in the segments at `paths` (files or directories).
+    Returns a summary with record, post and row counts and the throughput.
+    """
+    start = time.perf_counter()
+    replay = PostReplay(db, account_id, chunk_size)
+    for record in read_records(paths):
+        replay.feed(record)
+    replay.flush()
+
+    elapsed = time.perf_counter() - start
+    summary = replay.summary
+    summary["unpaired_metrics"] = len(replay.partial)
+    summary["seconds"] = round(elapsed, 3)
+    summary["posts_per_second"] = round(summary["posts"] / elapsed, 1) if elapsed else None
+    return summary
+
+
+if __name__ == "__main__":
+    from database.database import SessionLocal
+
+    args = sys.argv[1:]
+    account_id = None
+    if "--account" in args:
+        index = args.index("--account")
+        account_id = args[index + 1]
+        del args[index:index + 2]
+    if not args:
+        raise SystemExit("usage: python -m utilities.graph_replay <segment or directory>... [--account <account_id>]")
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(replay_segments(args, db, account_id)))
+    finally:
+        db.close()
@@ -0,0 +1,154 @@
+import os
+import uuid
+import socket
+import asyncio
+from contextlib import asynccontextmanager
+from sqlalchemy import DateTime, case, delete, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from database.database import AsyncSessionLocal
+from database.models import Lease
+
+# Identifies this worker process as a lease holder
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class db_utc_now(FunctionElement):
+    """
+    The database's own clock in UTC, plus an optional number of seconds. Expiry is always
+    judged on this clock, so workers on hosts whose clocks drift apart still agree.
+    """
+    type = DateTime()
+    inherit_cache = True
+
+    def __init__(self, seconds=0):
+        super().__init__(literal(int(seconds)))
+
+
+@compiles(db_utc_now, "mysql")
+def _db_utc_now_mysql(element, compiler, **kw):
+    return f"UTC_TIMESTAMP() + INTERVAL {compiler.process(element.clauses, **kw)} SECOND"
+
+
+@compiles(db_utc_now, "sqlite")
+def _db_utc_now_sqlite(element, compiler, **kw):
+    return f"datetime('now', {compiler.process(element.clauses, **kw)} || ' seconds')"
+
+
+class LeaseUnavailable(Exception):
+    """
+    The lease is held by another worker.
+    """
+    def __init__(self, name, owner):
+        super().__init__(f"Lease {name} is held by {owner}")
+        self.name = name
+        self.owner = owner
+
+
+def acquire_lease(db, name, ttl, owner=LEASE_OWNER):
+    """
+    Take the named lease for `ttl` seconds, or extend it if `owner` already holds it.
+    A conditional UPDATE claims a lease that is ours or has expired; when no row matched,
+    an INSERT creates it, and losing that race to another worker is a unique key error. Commits.
+    Returns the owner after the attempt: the lease was acquired if that is `owner`.
+    """
+    claimed = db.execute(
+        update(Lease)
+        .where(Lease.name == name, or_(Lease.owner == owner, Lease.expires_at < db_utc_now()))
+        # MySQL assigns left to right, so acquired_ts must still see the previous owner
+        .ordered_values(
+            (Lease.acquired_ts, case((Lease.owner == owner, Lease.acquired_ts), else_=db_utc_now())),
+            (Lease.owner, owner),
+            (Lease.expires_at, db_utc_now(ttl)),
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        try:
+            db.execute(insert(Lease).values(name=name, owner=owner, expires_at=db_utc_now(ttl), acquired_ts=db_utc_now()))
+        except IntegrityError:
+            # Held by someone else, or created by another worker since the UPDATE
+            db.rollback()
+    holder = db.execute(select(Lease.owner).where(Lease.name == name)).scalar()
+    db.commit()
+    return holder
+
+
+def release_lease(db, name, owner=LEASE_OWNER):
+    """
+    Give the lease up if `owner` still holds it. Commits.
+    """
+    db.execute(delete(Lease).where(Lease.name == name, Lease.owner == owner).execution_options(synchronize_session=False))
+    db.commit()
+
+
+class LeaseLost(Exception):
+    """
+    Another worker took the lease over while this one still held it; the guarded block was stopped.
+    """
+    def __init__(self, name, owner):
+        super().__init__(f"Lease {name} was taken over by {owner}")
+        self.name = name
+        self.owner = owner
+
+
+async def try_acquire_lease(name, ttl):
+    """
+    True if this worker now holds the lease. Uses its own session, so callers' transactions are untouched.
+    """
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(acquire_lease, name, ttl) == LEASE_OWNER
+
+
+async def give_up_lease(name):
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(release_lease, name)
+
+
+@asynccontextmanager
+async def lease(name, ttl):
+    """
+    Hold a cluster-wide lease while the block runs, renewing it every third of `ttl`.
+    Raises LeaseUnavailable if another worker holds it. If this worker stalls past `ttl` and
+    another one takes the lease over, the renewal cancels the task running the block,
+    which then raises LeaseLost, so two workers never carry on side by side.
+    """
+    async with AsyncSessionLocal() as db:
+        holder = await db.run_sync(acquire_lease, name, ttl)
+    if holder != LEASE_OWNER:
+        raise LeaseUnavailable(name, holder)
+
+    guarded = asyncio.current_task()
+    taken_by = []
+
+    async def renew():
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    holder = await db.run_sync(acquire_lease, name, ttl)
+            except Exception as e:
+                print(f"Failed to renew lease {name}: {e}")
+                continue
+            if holder != LEASE_OWNER:
+                print(f"Lease {name} was taken over by {holder}, stopping")
+                taken_by.append(holder)
+                guarded.cancel()
+                return
+
+    renewal = asyncio.create_task(renew())
+    try:
+        yield
+    except asyncio.CancelledError:
+        if not taken_by:
+            raise
+        # Our own cancellation, not the caller's: report it as the lost lease.
+        # Task.uncancel is 3.11+; before that the pending cancel request is simply dropped
+        if hasattr(guarded, "uncancel"):
+            guarded.uncancel()
+        raise LeaseLost(name, taken_by[0]) from None
+    finally:
+        renewal.cancel()
+        await asyncio.gather(renewal, return_exceptions=True)
+        await give_up_lease(name)
@@ -0,0 +1,238 @@
+import io
+import os
+import re
+import asyncio
+import hashlib
+import tempfile
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import update, or_
+from sqlalchemy.dialects.mysql import insert
+from database.database import run_db
+from database.models import Posts, MediaObject
+from utilities.graph_client import graph_client
+from utilities.metrics import span
+
+load_dotenv()
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "media_cache")
+MEDIA_MIRROR_CONCURRENCY = int(os.getenv("MEDIA_MIRROR_CONCURRENCY", 8))  # downloads in flight per sync
+MEDIA_MIRROR_MAX_POSTS = int(os.getenv("MEDIA_MIRROR_MAX_POSTS", 500))  # posts mirrored per sync at most
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", 100 * 1024 * 1024))
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", 120))  # seconds, per file
+MEDIA_RETRY_HOURS = float(os.getenv("MEDIA_RETRY_HOURS", 24))  # wait before retrying a failed download
+MEDIA_MAX_ATTEMPTS = int(os.getenv("MEDIA_MAX_ATTEMPTS", 3))  # failed downloads of one URL before the post is left alone
+MEDIA_THUMBNAIL_SIZE = int(os.getenv("MEDIA_THUMBNAIL_SIZE", 320))  # longest side, in pixels
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_media_hash(value):
+    return bool(_SHA256.match(value or ""))
+
+
+def media_path(media_hash, thumbnail=False):
+    """
+    Where a file lives in the cache: <dir>/<aa>/<bb>/<sha256>, thumbnails under <dir>/thumbs/.
+    """
+    root = os.path.join(MEDIA_CACHE_DIR, "thumbs") if thumbnail else MEDIA_CACHE_DIR
+    return os.path.join(root, media_hash[:2], media_hash[2:4], media_hash + (".jpg" if thumbnail else ""))
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Readers never see a half-written file: write aside, then rename into place
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(handle, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class _HashingWriter:
+    """
+    Writes downloaded chunks to a file while hashing them, so the content address is known
+    once the download ends without reading the file back.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        self.file.write(chunk)
+
+
+def _thumbnail(path):
+    """
+    (JPEG thumbnail bytes, width, height) of an image file, or None if it is not one Pillow can read.
+    """
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            image.thumbnail((MEDIA_THUMBNAIL_SIZE, MEDIA_THUMBNAIL_SIZE))
+            buffer = io.BytesIO()
+            image.convert("RGB").save(buffer, "JPEG", quality=80, optimize=True)
+            return buffer.getvalue(), width, height
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def store_media(temp_path, media_hash, size, content_type):
+    """
+    Move a downloaded file (written under MEDIA_CACHE_DIR) to its content address; identical content
+    is stored once and the duplicate download is left for the caller to remove.
+    Returns (MediaObject row dict, True if the file was already cached).
+    """
+    path = media_path(media_hash)
+    existed = os.path.exists(path)
+    if not existed:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Same filesystem as the download, so readers see either no file or the whole file
+        os.replace(temp_path, path)
+
+    row = {
+        "sha256": media_hash,
+        "content_type": content_type,
+        "size_bytes": size,
+        "width": None,
+        "height": None,
+        "has_thumbnail": False,
+        "created_ts": datetime.now(timezone.utc),
+    }
+    thumbnail_path = media_path(media_hash, thumbnail=True)
+    if existed and os.path.exists(thumbnail_path):
+        # Already cached and thumbnailed by an earlier download of the same bytes
+        row["has_thumbnail"] = True
+        return row, existed
+
+    # Videos have no thumbnail here; the listing's thumbnail_url is not mirrored
+    thumbnail = _thumbnail(path) if (content_type or "").startswith("image/") else None
+    if thumbnail:
+        thumbnail_data, row["width"], row["height"] = thumbnail
+        if not os.path.exists(thumbnail_path):
+            _write_atomic(thumbnail_path, thumbnail_data)
+        row["has_thumbnail"] = True
+    return row, existed
+
+
+async def fetch_media(media_url):
+    """
+    Stream one media URL into the cache.
+    Returns (status, MediaObject row dict or None if the status is not 200, True if the file was already cached).
+    """
+    os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=MEDIA_CACHE_DIR, prefix=".tmp-")
+    try:
+        with os.fdopen(handle, "wb") as temp_file:
+            sink = _HashingWriter(temp_file)
+            response_status, content_type = await graph_client.download(
+                media_url, sink, MEDIA_MAX_BYTES, MEDIA_DOWNLOAD_TIMEOUT
+            )
+        if response_status != 200:
+            return response_status, None, False
+        # Disk moves and thumbnailing stay off the event loop
+        row, existed = await asyncio.to_thread(
+            store_media, temp_path, sink.sha256.hexdigest(), sink.size, content_type
+        )
+        return response_status, row, existed
+    finally:
+        # Left behind by a failed download or by content that was already cached
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def posts_to_mirror(db, account_id, now, limit=MEDIA_MIRROR_MAX_POSTS):
+    """
+    [(posts_id, media_url)] of the account's posts not mirrored yet, newest first.
+    Posts whose download failed are retried after MEDIA_RETRY_HOURS, at most MEDIA_MAX_ATTEMPTS times
+    per URL; a post listed again with a new URL starts over (see _store_chunk).
+    """
+    return (
+        db.query(Posts.id, Posts.media_url)
+        .filter(
+            Posts.account_id == account_id,
+            Posts.media_hash.is_(None),
+            Posts.media_url.isnot(None),
+            Posts.media_failures < MEDIA_MAX_ATTEMPTS,
+            or_(Posts.media_checked_ts.is_(None), Posts.media_checked_ts < now - timedelta(hours=MEDIA_RETRY_HOURS)),
+        )
+        .order_by(Posts.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def record_mirrored(db, results, now):
+    """
+    Link posts to their cached media. `results` holds (posts_id, MediaObject row dict or None on failure).
+    Commits.
+    """
+    objects = {row["sha256"]: row for _, row in results if row}
+    if objects:
+        stmt = insert(MediaObject).values(list(objects.values()))
+        db.execute(stmt.on_duplicate_key_update(sha256=stmt.inserted.sha256))
+        db.execute(update(Posts), [
+            {"id": posts_id, "media_hash": row["sha256"], "media_checked_ts": now}
+            for posts_id, row in results if row
+        ])
+    failed = [posts_id for posts_id, row in results if not row]
+    if failed:
+        db.execute(
+            update(Posts)
+            .where(Posts.id.in_(failed))
+            .values(media_failures=Posts.media_failures + 1, media_checked_ts=now)
+        )
+    db.commit()
+
+
+async def mirror_account_media(account_id, db, timings=None):
+    """
+    Download media of the account's posts not mirrored yet into the local cache,
+    MEDIA_MIRROR_CONCURRENCY at a time over the shared aiohttp session.
+    Each file is streamed to disk, so memory stays at one chunk per download whatever the file size.
+    Returns {"media_mirrored", "media_deduplicated", "media_failed"}.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    pending = await run_db(db, posts_to_mirror, account_id, now)
+    summary = {"media_mirrored": 0, "media_deduplicated": 0, "media_failed": 0}
+    if not pending:
+        return summary
+
+    slots = asyncio.Semaphore(MEDIA_MIRROR_CONCURRENCY)
+
+    async def mirror(posts_id, media_url):
+        async with slots:
+            try:
+                response_status, row, existed = await fetch_media(media_url)
+                if row is None:
+                    # Expired CDN URLs answer 403; retried once the listing brings a fresh URL
+                    print(f"Media download for post {posts_id} returned {response_status}")
+                    summary["media_failed"] += 1
+                    return posts_id, None
+            except Exception as e:
+                print(f"Media download for post {posts_id} failed: {e}")
+                summary["media_failed"] += 1
+                return posts_id, None
+
+        summary["media_mirrored"] += 1
+        if existed:
+            summary["media_deduplicated"] += 1
+        return posts_id, row
+
+    with span("media", timings) as measure:
+        results = await asyncio.gather(*(mirror(posts_id, media_url) for posts_id, media_url in pending))
+        measure["items"] = len(pending)
+    await run_db(db, record_mirrored, results, now)
+    return summary
+
+
+def get_media_object(db, media_hash):
+    return db.query(MediaObject).filter(MediaObject.sha256 == media_hash).first()
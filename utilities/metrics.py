@@ -0,0 +1,133 @@
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+
+GRAPH_REQUEST_SECONDS = Histogram(
+    "graph_request_seconds", "Graph API call latency", ["endpoint", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+GRAPH_RETRIES = Counter("graph_retries_total", "Graph API calls retried", ["reason"])
+GRAPH_THROTTLES = Counter("graph_throttles_total", "Graph API throttle errors", ["code"])
+GRAPH_SLOT_WAIT_SECONDS = Histogram(
+    "graph_slot_wait_seconds", "Time spent waiting for a rate governor slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 120),
+)
+
+DB_QUERIES = Counter("db_queries_total", "Database statements executed", ["stage"])
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Database statement latency", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+DB_POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool", ["engine"])
+DB_POOL_CONNECTS = Counter("db_pool_connects_total", "New connections opened by the pool", ["engine"])
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out", ["engine"])
+DB_POOL_SIZE = Gauge("db_pool_size", "Connections held by the pool", ["engine"])
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections open beyond the pool size", ["engine"])
+
+SYNC_STAGE_SECONDS = Histogram(
+    "sync_stage_seconds", "Time spent per sync stage operation", ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SYNC_POSTS = Counter("sync_posts_total", "Posts synced", ["account_id"])
+SYNC_POSTS_PER_SECOND = Gauge("sync_posts_per_second", "Throughput of the last finished sync", ["account_id"])
+
+# Stage label for DB statements; spans set it, to_thread and child tasks inherit it
+current_stage = ContextVar("current_stage", default="request")
+
+_ID_SEGMENT = re.compile(r"^\d+$")
+
+
+def graph_endpoint(url):
+    """
+    Low-cardinality label for a Graph URL: ids become {id}, the batch endpoint is "batch".
+    """
+    path = url.split("?", 1)[0].split("://", 1)[-1]
+    segments = path.split("/")[1:]
+    if segments and re.match(r"^v\d+(\.\d+)?$", segments[0]):
+        segments = segments[1:]
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment for segment in segments if segment]
+    return "/".join(segments) or "batch"
+
+
+class SyncTimings:
+    """
+    Per-sync timing spans: calls, total and slowest seconds per stage.
+    Stages of the pipeline overlap, so totals can add up to more than the wall time.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.started_at = time.perf_counter()
+
+    def record(self, stage, seconds, items=0):
+        entry = self.stages.setdefault(stage, {"calls": 0, "items": 0, "seconds": 0.0, "max_seconds": 0.0})
+        entry["calls"] += 1
+        entry["items"] += items
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def to_dict(self):
+        return {
+            "wall_seconds": round(time.perf_counter() - self.started_at, 3),
+            "stages": {
+                stage: {**entry, "seconds": round(entry["seconds"], 3), "max_seconds": round(entry["max_seconds"], 3)}
+                for stage, entry in self.stages.items()
+            },
+        }
+
+
+@contextmanager
+def span(stage, timings=None):
+    """
+    Time a block as one operation of `stage`, labelling the DB statements it runs with the stage.
+    Yields a dict; set its "items" to record how many items the operation handled.
+    """
+    token = current_stage.set(stage)
+    measure = {"items": 0}
+    start = time.perf_counter()
+    try:
+        yield measure
+    finally:
+        seconds = time.perf_counter() - start
+        current_stage.reset(token)
+        SYNC_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+        if timings is not None:
+            timings.record(stage, seconds, measure["items"])
+
+
+def instrument_engine(engine, name="sync"):
+    """
+    Count and time every statement by sync stage, and track pool checkouts under `name`.
+    For an AsyncEngine pass its `sync_engine`.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stage = current_stage.get()
+        DB_QUERIES.labels(stage=stage).inc()
+        DB_QUERY_SECONDS.labels(stage=stage).observe(time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.labels(engine=name).inc()
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        DB_POOL_CONNECTS.labels(engine=name).inc()
+
+    pool = engine.pool
+    DB_POOL_CHECKED_OUT.labels(engine=name).set_function(pool.checkedout)
+    if hasattr(pool, "size"):
+        DB_POOL_SIZE.labels(engine=name).set_function(pool.size)
+        DB_POOL_OVERFLOW.labels(engine=name).set_function(lambda: max(0, pool.overflow()))
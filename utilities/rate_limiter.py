@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GRAPH_MAX_RATE = float(os.getenv("GRAPH_MAX_RATE", 50))  # requests per second
+GRAPH_MIN_RATE = float(os.getenv("GRAPH_MIN_RATE", 1))
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", 50))
+GRAPH_MIN_CONCURRENCY = int(os.getenv("GRAPH_MIN_CONCURRENCY", 2))
+GRAPH_BACKOFF_BASE = float(os.getenv("GRAPH_BACKOFF_BASE", 2))  # seconds
+GRAPH_BACKOFF_MAX = float(os.getenv("GRAPH_BACKOFF_MAX", 300))
+
+# Graph error codes for app, user, page and API-level throttling
+THROTTLE_ERROR_CODES = {4, 17, 32, 613}
+
+# Usage (in percent of quota) below which we run at full speed
+USAGE_SOFT_LIMIT = 50
+
+
+def throttle_error_code(body):
+    """
+    Return the Graph error code if `body` is a throttling error, else None.
+    """
+    if not isinstance(body, dict):
+        return None
+    code = body.get("error", {}).get("code")
+    return code if code in THROTTLE_ERROR_CODES else None
+
+
+def parse_usage_headers(headers):
+    """
+    Read X-App-Usage and X-Business-Use-Case-Usage.
+    Returns (highest usage percentage, seconds until access is regained or 0).
+    """
+    usage, regain_seconds = 0, 0
+
+    app_usage = headers.get("X-App-Usage")
+    if app_usage:
+        try:
+            usage = max([usage, *json.loads(app_usage).values()])
+        except (ValueError, TypeError, AttributeError):
+            pass
+
+    buc_usage = headers.get("X-Business-Use-Case-Usage")
+    if buc_usage:
+        try:
+            for entries in json.loads(buc_usage).values():
+                for entry in entries:
+                    usage = max(
+                        usage,
+                        entry.get("call_count", 0),
+                        entry.get("total_cputime", 0),
+                        entry.get("total_time", 0),
+                    )
+                    regain_seconds = max(regain_seconds, entry.get("estimated_time_to_regain_access", 0) * 60)
+        except (ValueError, TypeError, AttributeError):
+            pass
+
+    return usage, regain_seconds
+
+
+class RateGovernor:
+    """
+    Token bucket plus concurrency window shared by every Graph API call.
+    Both shrink as Graph reports higher usage and all callers pause after a throttle error.
+    """
+    def __init__(
+        self,
+        max_rate=GRAPH_MAX_RATE,
+        min_rate=GRAPH_MIN_RATE,
+        max_concurrency=GRAPH_MAX_CONCURRENCY,
+        min_concurrency=GRAPH_MIN_CONCURRENCY,
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+
+        self.rate = max_rate
+        self.concurrency = max_concurrency
+        self.tokens = max_rate
+        self.last_refill = time.monotonic()
+        self.active = 0
+        self.usage = 0
+        self.regain_seconds = 0
+        self.paused_until = 0
+        self.throttle_count = 0
+        self.last_throttle_code = None
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.concurrency)
+            self.active += 1
+
+        try:
+            while True:
+                now = time.monotonic()
+                if self.paused_until > now:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(max(1, self.rate), self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        except BaseException:
+            await self.release()
+            raise
+
+    async def release(self):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            await self.release()
+
+    def observe(self, headers):
+        """
+        Update rate and concurrency from the usage headers of a Graph response.
+        """
+        previous_concurrency = self.concurrency
+        if "X-App-Usage" in headers or "X-Business-Use-Case-Usage" in headers:
+            self.usage, self.regain_seconds = parse_usage_headers(headers)
+
+            # Full speed below the soft limit, then scale down linearly with the remaining headroom
+            headroom = min(1.0, max(0.0, (100 - self.usage) / (100 - USAGE_SOFT_LIMIT)))
+            self.rate = max(self.min_rate, self.max_rate * headroom)
+            self.concurrency = max(self.min_concurrency, round(self.max_concurrency * headroom))
+        else:
+            # No usage reported: creep back towards full speed after a throttle
+            self.rate = min(self.max_rate, self.rate * 1.1)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+        # A wider window may let waiters through
+        if self.concurrency > previous_concurrency:
+            asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    def throttled(self, code, attempt):
+        """
+        Record a throttle error and pause every caller. Returns the pause in seconds.
+        """
+        self.throttle_count += 1
+        self.last_throttle_code = code
+        self.rate = self.min_rate
+        self.concurrency = self.min_concurrency
+        self.tokens = 0
+
+        backoff = min(GRAPH_BACKOFF_MAX, GRAPH_BACKOFF_BASE * 2 ** attempt)
+        delay = max(self.regain_seconds, backoff * random.uniform(0.5, 1.5))
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+    def state(self):
+        return {
+            "rate_per_second": round(self.rate, 2),
+            "concurrency_window": self.concurrency,
+            "active_requests": self.active,
+            "available_tokens": round(self.tokens, 2),
+            "usage_percent": self.usage,
+            "paused_for_seconds": round(max(0, self.paused_until - time.monotonic()), 2),
+            "throttle_count": self.throttle_count,
+            "last_throttle_code": self.last_throttle_code,
+        }
+
+
+rate_governor = RateGovernor()
+
+# Each account gets its own governor so one throttled account does not pause the others
+account_governors = {}
+
+# Governor used by Graph calls in the current task; account syncs set this on entry
+current_rate_governor = ContextVar("current_rate_governor", default=rate_governor)
+
+
+def get_rate_governor(account_id, max_concurrency=None):
+    """
+    Return the governor for an account, creating it on first use.
+    """
+    governor = account_governors.get(account_id)
+    if governor is None:
+        governor = RateGovernor(max_concurrency=max_concurrency or GRAPH_MAX_CONCURRENCY)
+        account_governors[account_id] = governor
+    elif max_concurrency and governor.max_concurrency != max_concurrency:
+        governor.max_concurrency = max_concurrency
+        governor.concurrency = min(governor.concurrency, max_concurrency)
+    return governor
+
+
+def use_account_governor(account_id, max_concurrency=None):
+    """
+    Route Graph calls made by the current task (and tasks it spawns) through the account's governor.
+    """
+    governor = get_rate_governor(account_id, max_concurrency)
+    current_rate_governor.set(governor)
+    return governor
+
+
+def governors_state():
+    return {
+        "global": rate_governor.state(),
+        "accounts": {account_id: governor.state() for account_id, governor in account_governors.items()},
+    }
@@ -0,0 +1,222 @@
+import os
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.mysql import insert
+from database.database import run_db
+from database.models import Posts, PostRefreshSchedule
+from utilities.fetch_posts_helper import process_posts_async, store_post_columns, STORE_CHUNK_SIZE
+from utilities.post_columns import PostColumns
+from utilities.running_totals import get_post_totals
+from utilities.metrics import span
+
+load_dotenv()
+
+# "<max post age>:<refresh interval>" tiers, youngest first; "*" matches any age
+REFRESH_RULES = os.getenv("REFRESH_RULES", "2d:1h,30d:1d,*:7d")
+REFRESH_MAX_BACKOFF = int(os.getenv("REFRESH_MAX_BACKOFF", 2))  # interval doublings once counters stop moving
+REFRESH_HOT_RATE = float(os.getenv("REFRESH_HOT_RATE", 50))  # counter change per hour that keeps a post on the fastest tier
+REFRESH_MAX_POSTS = int(os.getenv("REFRESH_MAX_POSTS", 2000))  # due posts refreshed per sync at most
+
+_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(value):
+    """
+    "90m", "1h", "2d" or "1w" as a timedelta.
+    """
+    value = value.strip()
+    if value[-1:] not in _UNITS:
+        raise ValueError(f"Unknown duration unit in {value!r}, expected one of {', '.join(_UNITS)}")
+    return timedelta(seconds=float(value[:-1]) * _UNITS[value[-1]])
+
+
+def parse_rules(spec):
+    """
+    Parse "2d:1h,30d:1d,*:7d" into [(max_age or None, interval)], youngest tier first.
+    """
+    rules = []
+    for rule in spec.split(","):
+        max_age, interval = rule.split(":")
+        rules.append((None if max_age.strip() == "*" else parse_duration(max_age), parse_duration(interval)))
+    rules.sort(key=lambda rule: rule[0] if rule[0] is not None else timedelta.max)
+    if rules[-1][0] is not None:
+        raise ValueError(f"REFRESH_RULES needs a '*' tier for posts older than every limit: {spec!r}")
+    return rules
+
+
+REFRESH_TIERS = parse_rules(REFRESH_RULES)
+
+
+def refresh_interval(post_created, now, unchanged_streak=0, change_rate=0.0, rules=REFRESH_TIERS):
+    """
+    How long until a post is due again.
+    The tier comes from the post's age; a post whose counters move faster than REFRESH_HOT_RATE per hour
+    stays on the fastest tier, and one that stopped changing backs off by doubling, up to REFRESH_MAX_BACKOFF times.
+    """
+    if change_rate >= REFRESH_HOT_RATE:
+        return rules[0][1]
+    age = now - post_created if post_created else None
+    for max_age, interval in rules:
+        if max_age is None or (age is not None and age < max_age):
+            return interval * 2 ** min(unchanged_streak, REFRESH_MAX_BACKOFF)
+
+
+def _utc_now():
+    # Timestamps are stored as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def due_posts(db, account_id, now, limit=REFRESH_MAX_POSTS):
+    """
+    Posts of the account whose refresh is due at `now`, most overdue first, as /media-like dicts.
+    Posts never scheduled are due unless they were stored after `now` (i.e. by the sync in progress).
+    """
+    rows = (
+        db.query(
+            Posts.id, Posts.post_id, Posts.media_type, Posts.media_url, Posts.post_created,
+            PostRefreshSchedule.unchanged_streak, PostRefreshSchedule.last_refreshed_ts,
+        )
+        .outerjoin(PostRefreshSchedule, PostRefreshSchedule.posts_id == Posts.id)
+        .filter(
+            Posts.account_id == account_id,
+            or_(
+                PostRefreshSchedule.next_due_ts <= now,
+                and_(PostRefreshSchedule.next_due_ts.is_(None), Posts.created_ts < now),
+            ),
+        )
+        .order_by(PostRefreshSchedule.next_due_ts)  # MySQL sorts NULLs (never scheduled) first
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "id": post_id,
+            "media_type": media_type,
+            "media_url": media_url,
+            "timestamp": post_created.strftime("%Y-%m-%dT%H:%M:%S+0000") if post_created else None,
+            "posts_id": posts_id,
+            "post_created": post_created,
+            "unchanged_streak": unchanged_streak or 0,
+            "last_refreshed_ts": last_refreshed_ts,
+        }
+        for posts_id, post_id, media_type, media_url, post_created, unchanged_streak, last_refreshed_ts in rows
+    ]
+
+
+def reschedule(db, account_id, posts, prior_totals, current_totals, now):
+    """
+    Set the next due time of refreshed posts from their age and how much their counters moved.
+    `prior_totals` is keyed by posts_id, `current_totals` by Graph post id; both hold (likes, reach, saves).
+    """
+    rows = []
+    for post in posts:
+        current = tuple(current_totals[post["id"]])
+        prior = prior_totals.get(post["posts_id"])
+        changed = prior is None or tuple(prior) != current
+        unchanged_streak = 0 if changed else post["unchanged_streak"] + 1
+
+        change_rate = 0.0
+        if prior is not None and post["last_refreshed_ts"]:
+            hours = (now - post["last_refreshed_ts"]).total_seconds() / 3600
+            if hours > 0:
+                change_rate = sum(abs(new - old) for new, old in zip(current, prior)) / hours
+
+        interval = refresh_interval(post["post_created"], now, unchanged_streak, change_rate)
+        rows.append({
+            "posts_id": post["posts_id"],
+            "account_id": account_id,
+            "next_due_ts": now + interval,
+            "interval_seconds": int(interval.total_seconds()),
+            "unchanged_streak": unchanged_streak,
+            "last_refreshed_ts": now,
+            "updated_ts": now,
+        })
+
+    if rows:
+        stmt = insert(PostRefreshSchedule).values(rows)
+        db.execute(stmt.on_duplicate_key_update(
+            next_due_ts=stmt.inserted.next_due_ts,
+            interval_seconds=stmt.inserted.interval_seconds,
+            unchanged_streak=stmt.inserted.unchanged_streak,
+            last_refreshed_ts=stmt.inserted.last_refreshed_ts,
+            updated_ts=stmt.inserted.updated_ts,
+        ))
+
+
+def _schedule_state(db, post_ids):
+    """
+    {post_id: post dict as reschedule() takes it} for the stored posts among `post_ids`.
+    """
+    rows = (
+        db.query(
+            Posts.post_id, Posts.id, Posts.post_created,
+            PostRefreshSchedule.unchanged_streak, PostRefreshSchedule.last_refreshed_ts,
+        )
+        .outerjoin(PostRefreshSchedule, PostRefreshSchedule.posts_id == Posts.id)
+        .filter(Posts.post_id.in_(post_ids))
+        .all()
+    )
+    return {
+        post_id: {
+            "id": post_id,
+            "posts_id": posts_id,
+            "post_created": post_created,
+            "unchanged_streak": unchanged_streak or 0,
+            "last_refreshed_ts": last_refreshed_ts,
+        }
+        for post_id, posts_id, post_created, unchanged_streak, last_refreshed_ts in rows
+    }
+
+
+def store_and_reschedule(db, account_id, columns, now, chunk_size=None):
+    """
+    Store a PostColumns batch and schedule the next refresh of every post in it. Commits.
+    Used by the sync pipeline as well as the refresh pass, so a post the listing just stored
+    is not due again until its interval has passed. Counters are compared against the totals
+    read before the write; posts new to the database start a fresh schedule.
+    """
+    post_ids = columns.post_ids.tolist()
+    known = _schedule_state(db, post_ids)
+    prior_totals = get_post_totals(db, [post["posts_id"] for post in known.values()])
+    result = store_post_columns(columns, db, chunk_size, account_id)
+
+    new_ids = [post_id for post_id in post_ids if post_id not in known]
+    if new_ids:
+        known.update(_schedule_state(db, new_ids))
+    current_totals = dict(zip(post_ids, columns.counters().tolist()))
+    reschedule(db, account_id, known.values(), prior_totals, current_totals, now)
+    db.commit()
+    return result
+
+
+async def refresh_due_posts(account_id, token, db, started=None, timings=None):
+    """
+    Refetch metrics for the account's posts that are due, STORE_CHUNK_SIZE posts at a time.
+    `started` (naive UTC) is when the calling sync began; posts it stored were rescheduled by the
+    pipeline and new ones stored after `started` are left alone, so nothing is fetched twice.
+    Posts whose fetch fails keep their due time and are picked up by the next sync.
+    Returns {"refresh_due", "refreshed", "refresh_failed"}.
+    """
+    now = started or _utc_now()
+    due = await run_db(db, due_posts, account_id, now)
+    summary = {"refresh_due": len(due), "refreshed": 0, "refresh_failed": 0}
+
+    for start in range(0, len(due), STORE_CHUNK_SIZE):
+        chunk = due[start:start + STORE_CHUNK_SIZE]
+        errors = {}
+        with span("refresh", timings) as measure:
+            metrics = await process_posts_async(chunk, token, failures=errors)
+            measure["items"] = len(chunk)
+
+        fetched = [(post, metric) for post, metric in zip(chunk, metrics) if metric is not None]
+        summary["refresh_failed"] += len(chunk) - len(fetched)
+        if not fetched:
+            continue
+        columns = PostColumns.from_posts([post for post, _ in fetched], [metric for _, metric in fetched])
+        with span("store", timings) as measure:
+            await run_db(db, lambda session: store_and_reschedule(session, account_id, columns, _utc_now()))
+            measure["items"] = len(columns)
+        summary["refreshed"] += len(fetched)
+
+    return summary
@@ -0,0 +1,211 @@
+import os
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy import func, delete, select, literal
+from sqlalchemy.dialects.mysql import insert
+from database.models import PostInsights, Posts, SocialMedia, PostRollup, AccountRollup
+
+load_dotenv()
+
+PKM_INSTAGRAM_ACCOUNT_ID = os.getenv("PKM_INSTAGRAM_ACCOUNT_ID")
+
+PERIODS = ("day", "week", "month")
+
+POST_METRICS = ("reach", "likes", "saves")
+ACCOUNT_METRICS = ("post_reach", "likes", "saves", "followers", "reach", "accounts_engaged", "website_clicks")
+
+
+def period_starts(snapshot_date):
+    """
+    Return {period: first day of the period containing snapshot_date}. Weeks start on Monday.
+    """
+    return {
+        "day": snapshot_date,
+        "week": snapshot_date - timedelta(days=snapshot_date.weekday()),
+        "month": snapshot_date.replace(day=1),
+    }
+
+
+def _period_start_sql(period, column):
+    # MySQL SUBDATE(date, n) subtracts n days
+    if period == "week":
+        return func.subdate(column, func.weekday(column))
+    if period == "month":
+        return func.subdate(column, func.dayofmonth(column) - 1)
+    return column
+
+
+def _accumulate(table_model, rows, metrics):
+    # Deltas are added to whatever the bucket already holds
+    stmt = insert(table_model).values(rows)
+    return stmt.on_duplicate_key_update(
+        **{metric: getattr(table_model, metric) + getattr(stmt.inserted, metric) for metric in metrics},
+        updated_ts=stmt.inserted.updated_ts,
+    )
+
+
+def add_post_deltas(db, account_id, insight_rows):
+    """
+    Fold a batch of post insight deltas (posts_id, snapshot_date, reach, likes, saves)
+    into the per-post and per-account day/week/month rollups.
+    """
+    if not insight_rows:
+        return
+    now = datetime.now(timezone.utc)
+
+    post_rows, account_totals = [], {}
+    for row in insight_rows:
+        for period, period_start in period_starts(row["snapshot_date"]).items():
+            post_rows.append({
+                "posts_id": row["posts_id"],
+                "period": period,
+                "period_start": period_start,
+                "reach": row["reach"],
+                "likes": row["likes"],
+                "saves": row["saves"],
+                "updated_ts": now,
+            })
+            bucket = account_totals.setdefault((period, period_start), {"post_reach": 0, "likes": 0, "saves": 0})
+            bucket["post_reach"] += row["reach"]
+            bucket["likes"] += row["likes"]
+            bucket["saves"] += row["saves"]
+
+    db.execute(_accumulate(PostRollup, post_rows, POST_METRICS))
+
+    account_rows = [
+        {
+            "account_id": account_id,
+            "period": period,
+            "period_start": period_start,
+            **{metric: 0 for metric in ACCOUNT_METRICS},
+            **bucket,
+            "updated_ts": now,
+        }
+        for (period, period_start), bucket in account_totals.items()
+    ]
+    db.execute(_accumulate(AccountRollup, account_rows, ("post_reach", "likes", "saves")))
+
+
+def add_account_deltas(db, account_id, snapshot_date, followers, reach, accounts_engaged, website_clicks):
+    """
+    Fold one profile delta into the account's day/week/month rollups.
+    """
+    now = datetime.now(timezone.utc)
+    deltas = {
+        "followers": followers,
+        "reach": reach,
+        "accounts_engaged": accounts_engaged,
+        "website_clicks": website_clicks,
+    }
+    rows = [
+        {
+            "account_id": account_id,
+            "period": period,
+            "period_start": period_start,
+            **{metric: 0 for metric in ACCOUNT_METRICS},
+            **deltas,
+            "updated_ts": now,
+        }
+        for period, period_start in period_starts(snapshot_date).items()
+    ]
+    db.execute(_accumulate(AccountRollup, rows, tuple(deltas)))
+
+
+def rebuild_rollups(db, account_id):
+    """
+    Rebuild one account's rollups from the raw daily delta tables.
+    """
+    now = datetime.now(timezone.utc)
+    account_posts = select(Posts.id).where(Posts.account_id == account_id)
+    db.execute(delete(PostRollup).where(PostRollup.posts_id.in_(account_posts)))
+    db.execute(delete(AccountRollup).where(AccountRollup.account_id == account_id))
+
+    for period in PERIODS:
+        period_start = _period_start_sql(period, PostInsights.snapshot_date).label("period_start")
+        db.execute(
+            insert(PostRollup).from_select(
+                ["posts_id", "period", "period_start", "reach", "likes", "saves", "updated_ts"],
+                select(
+                    PostInsights.posts_id,
+                    literal(period),
+                    period_start,
+                    func.coalesce(func.sum(PostInsights.reach), 0),
+                    func.coalesce(func.sum(PostInsights.likes), 0),
+                    func.coalesce(func.sum(PostInsights.saves), 0),
+                    literal(now),
+                ).where(PostInsights.posts_id.in_(account_posts)).group_by(PostInsights.posts_id, period_start),
+            )
+        )
+
+        stmt = insert(AccountRollup).from_select(
+            ["account_id", "period", "period_start", "post_reach", "likes", "saves", "updated_ts"],
+            select(
+                literal(account_id),
+                literal(period),
+                period_start,
+                func.coalesce(func.sum(PostInsights.reach), 0),
+                func.coalesce(func.sum(PostInsights.likes), 0),
+                func.coalesce(func.sum(PostInsights.saves), 0),
+                literal(now),
+            ).where(PostInsights.posts_id.in_(account_posts)).group_by(period_start),
+        )
+        db.execute(stmt)
+
+        profile_start = _period_start_sql(period, SocialMedia.snapshot_date).label("period_start")
+        stmt = insert(AccountRollup).from_select(
+            ["account_id", "period", "period_start", "followers", "reach", "accounts_engaged", "website_clicks", "updated_ts"],
+            select(
+                literal(account_id),
+                literal(period),
+                profile_start,
+                func.coalesce(func.sum(SocialMedia.followers), 0),
+                func.coalesce(func.sum(SocialMedia.reach), 0),
+                func.coalesce(func.sum(SocialMedia.accounts_engaged), 0),
+                func.coalesce(func.sum(SocialMedia.website_clicks), 0),
+                literal(now),
+            ).where(SocialMedia.account_id == account_id).group_by(profile_start),
+        )
+        db.execute(stmt.on_duplicate_key_update(
+            followers=stmt.inserted.followers,
+            reach=stmt.inserted.reach,
+            accounts_engaged=stmt.inserted.accounts_engaged,
+            website_clicks=stmt.inserted.website_clicks,
+        ))
+
+    db.commit()
+
+
+def _serialize(row, metrics):
+    return {"period_start": row.period_start.isoformat(), **{metric: getattr(row, metric) for metric in metrics}}
+
+
+def get_post_rollups(db, posts_id, period, start=None, end=None):
+    query = db.query(PostRollup).filter(PostRollup.posts_id == posts_id, PostRollup.period == period)
+    if start:
+        query = query.filter(PostRollup.period_start >= start)
+    if end:
+        query = query.filter(PostRollup.period_start <= end)
+    return [_serialize(row, POST_METRICS) for row in query.order_by(PostRollup.period_start)]
+
+
+def get_account_rollups(db, account_id, period, start=None, end=None):
+    query = db.query(AccountRollup).filter(AccountRollup.account_id == account_id, AccountRollup.period == period)
+    if start:
+        query = query.filter(AccountRollup.period_start >= start)
+    if end:
+        query = query.filter(AccountRollup.period_start <= end)
+    return [_serialize(row, ACCOUNT_METRICS) for row in query.order_by(AccountRollup.period_start)]
+
+
+if __name__ == "__main__":
+    # One-off rebuild: python -m utilities.rollups
+    from database.database import SessionLocal
+    from utilities.accounts import list_active_account_ids
+
+    db = SessionLocal()
+    try:
+        for account_id in list_active_account_ids(db):
+            rebuild_rollups(db, account_id)
+            print(f"Rollups rebuilt for {account_id}.")
+    finally:
+        db.close()
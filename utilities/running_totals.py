@@ -0,0 +1,232 @@
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from sqlalchemy import func, delete, select, literal, cast, String
+from sqlalchemy.dialects.mysql import insert
+from database.models import (
+    Posts, PostInsights, SocialMedia, EngagedAudienceAge, EngagedAudienceGender, EngagedAudienceLocation,
+    PostRunningTotal, AccountRunningTotal, DemographicRunningTotal,
+)
+
+load_dotenv()
+
+PKM_INSTAGRAM_ACCOUNT_ID = os.getenv("PKM_INSTAGRAM_ACCOUNT_ID")
+
+# breakdown name -> (delta table, dimension column name)
+DEMOGRAPHIC_TABLES = {
+    "age": (EngagedAudienceAge, "age_group"),
+    "gender": (EngagedAudienceGender, "gender"),
+    "city": (EngagedAudienceLocation, "city"),
+}
+
+
+def get_post_totals(db, posts_ids):
+    """
+    Return {posts_id: (likes, reach, saves)} with the last known cumulative counters.
+    Posts without a running-total row fall back to summing their delta history once.
+    """
+    posts_ids = list(posts_ids)
+    if not posts_ids:
+        return {}
+
+    totals = {
+        row.posts_id: (row.likes, row.reach, row.saves)
+        for row in db.query(
+            PostRunningTotal.posts_id, PostRunningTotal.likes, PostRunningTotal.reach, PostRunningTotal.saves
+        ).filter(PostRunningTotal.posts_id.in_(posts_ids))
+    }
+
+    missing = [posts_id for posts_id in posts_ids if posts_id not in totals]
+    if missing:
+        for row in db.query(
+            PostInsights.posts_id,
+            func.sum(PostInsights.likes).label("total_likes"),
+            func.sum(PostInsights.reach).label("total_reach"),
+            func.sum(PostInsights.saves).label("total_saves"),
+        ).filter(PostInsights.posts_id.in_(missing)).group_by(PostInsights.posts_id):
+            totals[row.posts_id] = (int(row.total_likes or 0), int(row.total_reach or 0), int(row.total_saves or 0))
+
+    return totals
+
+
+def set_post_totals(db, rows):
+    """
+    Upsert the cumulative counters for a batch of posts.
+    `rows` is a list of dicts with posts_id, likes, reach, saves and optionally fingerprint
+    (left out, the stored fingerprint is cleared).
+    """
+    if not rows:
+        return
+    now = datetime.now(timezone.utc)
+    stmt = insert(PostRunningTotal).values([{**row, "updated_ts": now} for row in rows])
+    stmt = stmt.on_duplicate_key_update(
+        likes=stmt.inserted.likes,
+        reach=stmt.inserted.reach,
+        saves=stmt.inserted.saves,
+        fingerprint=stmt.inserted.fingerprint,
+        updated_ts=stmt.inserted.updated_ts,
+    )
+    db.execute(stmt)
+
+
+def get_account_totals(db, account_id):
+    """
+    Return the last known cumulative account counters as a dict.
+    Falls back to summing the SocialMedia history if no running-total row exists yet.
+    """
+    row = db.query(AccountRunningTotal).filter(AccountRunningTotal.account_id == account_id).first()
+    if row:
+        return {
+            "followers": row.followers,
+            "reach": row.reach,
+            "accounts_engaged": row.accounts_engaged,
+            "website_clicks": row.website_clicks,
+        }
+
+    existing_sums = db.query(
+        func.sum(SocialMedia.followers).label("total_followers"),
+        func.sum(SocialMedia.reach).label("total_reach"),
+        func.sum(SocialMedia.accounts_engaged).label("total_accounts_engaged"),
+        func.sum(SocialMedia.website_clicks).label("total_website_clicks"),
+    ).filter(SocialMedia.account_id == account_id).first()
+    return {
+        "followers": existing_sums.total_followers or 0,
+        "reach": existing_sums.total_reach or 0,
+        "accounts_engaged": existing_sums.total_accounts_engaged or 0,
+        "website_clicks": existing_sums.total_website_clicks or 0,
+    }
+
+
+def set_account_totals(db, account_id, followers, reach, accounts_engaged, website_clicks):
+    """
+    Upsert the cumulative counters for an account.
+    """
+    now = datetime.now(timezone.utc)
+    stmt = insert(AccountRunningTotal).values(
+        account_id=account_id,
+        followers=followers,
+        reach=reach,
+        accounts_engaged=accounts_engaged,
+        website_clicks=website_clicks,
+        updated_ts=now,
+    )
+    stmt = stmt.on_duplicate_key_update(
+        followers=stmt.inserted.followers,
+        reach=stmt.inserted.reach,
+        accounts_engaged=stmt.inserted.accounts_engaged,
+        website_clicks=stmt.inserted.website_clicks,
+        updated_ts=stmt.inserted.updated_ts,
+    )
+    db.execute(stmt)
+
+
+def get_demographic_totals(db, socialmedia_id, breakdown, values):
+    """
+    Return {dimension_value: count} with the last known cumulative count for each value.
+    Values without a running-total row fall back to summing their delta history.
+    """
+    values = list(values)
+    if not values:
+        return {}
+
+    totals = dict(
+        db.query(DemographicRunningTotal.dimension_value, DemographicRunningTotal.count).filter(
+            DemographicRunningTotal.socialmedia_id == socialmedia_id,
+            DemographicRunningTotal.breakdown == breakdown,
+            DemographicRunningTotal.dimension_value.in_(values),
+        )
+    )
+
+    missing = [value for value in values if value not in totals]
+    if missing:
+        table_model, attribute_name = DEMOGRAPHIC_TABLES[breakdown]
+        column = getattr(table_model, attribute_name)
+        for value, total in db.query(column, func.sum(table_model.count)).filter(
+            table_model.socialmedia_id == socialmedia_id,
+            column.in_(missing),
+        ).group_by(column):
+            totals[value] = total or 0
+
+    return totals
+
+
+def set_demographic_totals(db, socialmedia_id, breakdown, counts):
+    """
+    Upsert the cumulative counts for one breakdown. `counts` maps dimension value -> count.
+    """
+    if not counts:
+        return
+    now = datetime.now(timezone.utc)
+    stmt = insert(DemographicRunningTotal).values([
+        {
+            "socialmedia_id": socialmedia_id,
+            "breakdown": breakdown,
+            "dimension_value": value,
+            "count": count,
+            "updated_ts": now,
+        }
+        for value, count in counts.items()
+    ])
+    stmt = stmt.on_duplicate_key_update(count=stmt.inserted.count, updated_ts=stmt.inserted.updated_ts)
+    db.execute(stmt)
+
+
+def rebuild_running_totals(db, account_id):
+    """
+    Rebuild the account's running totals (posts, profile and demographics) from its delta history.
+    Other accounts' totals are left untouched.
+    """
+    now = datetime.now(timezone.utc)
+    account_posts = select(Posts.id).where(Posts.account_id == account_id)
+    account_profiles = select(SocialMedia.id).where(SocialMedia.account_id == account_id)
+
+    # Rebuilt rows carry no fingerprint, so the next sync writes these posts once more
+    db.execute(delete(PostRunningTotal).where(PostRunningTotal.posts_id.in_(account_posts)))
+    db.execute(
+        insert(PostRunningTotal).from_select(
+            ["posts_id", "likes", "reach", "saves", "updated_ts"],
+            select(
+                PostInsights.posts_id,
+                func.coalesce(func.sum(PostInsights.likes), 0),
+                func.coalesce(func.sum(PostInsights.reach), 0),
+                func.coalesce(func.sum(PostInsights.saves), 0),
+                literal(now),
+            ).where(PostInsights.posts_id.in_(account_posts)).group_by(PostInsights.posts_id),
+        )
+    )
+
+    db.execute(delete(AccountRunningTotal).where(AccountRunningTotal.account_id == account_id))
+    account = get_account_totals(db, account_id)
+    set_account_totals(db, account_id, **account)
+
+    db.execute(delete(DemographicRunningTotal).where(DemographicRunningTotal.socialmedia_id.in_(account_profiles)))
+    for breakdown, (table_model, attribute_name) in DEMOGRAPHIC_TABLES.items():
+        column = getattr(table_model, attribute_name)
+        db.execute(
+            insert(DemographicRunningTotal).from_select(
+                ["socialmedia_id", "breakdown", "dimension_value", "count", "updated_ts"],
+                select(
+                    table_model.socialmedia_id,
+                    literal(breakdown),
+                    cast(column, String(255)),
+                    func.coalesce(func.sum(table_model.count), 0),
+                    literal(now),
+                ).where(table_model.socialmedia_id.in_(account_profiles)).group_by(table_model.socialmedia_id, column),
+            )
+        )
+
+    db.commit()
+
+
+if __name__ == "__main__":
+    # One-off rebuild: python -m utilities.running_totals
+    from database.database import SessionLocal
+    from utilities.accounts import list_active_account_ids
+
+    db = SessionLocal()
+    try:
+        for account_id in list_active_account_ids(db):
+            rebuild_running_totals(db, account_id)
+            print(f"Running totals rebuilt for {account_id}.")
+    finally:
+        db.close()
@@ -0,0 +1,115 @@
+import os
+import json
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from sqlalchemy import case, and_
+from sqlalchemy.dialects.mysql import insert
+from database.models import SyncCheckpoint, SyncCheckpointPost
+
+load_dotenv()
+
+SYNC_MAX_POST_ATTEMPTS = int(os.getenv("SYNC_MAX_POST_ATTEMPTS", 5))  # failed syncs of one post before it is parked
+
+DONE = "done"
+FAILED = "failed"
+PARKED = "parked"  # failed SYNC_MAX_POST_ATTEMPTS times; only retried if the listing brings it up again
+
+
+def get_checkpoint(db, account_id):
+    """
+    Load what an interrupted sync left behind for the account.
+    Returns {"in_progress", "cursor", "full_resync", "newest_post", "done", "failed", "attempts"}, where
+    `done` is the set of post ids already stored, `failed` maps post id -> /media item of posts still to
+    retry and `attempts` maps post id -> failed attempts so far, parked posts included.
+    Failed posts outlive the listing, so `failed` may be set when `in_progress` is False.
+    """
+    checkpoint = db.query(SyncCheckpoint).filter(SyncCheckpoint.account_id == account_id).first()
+    rows = db.query(
+        SyncCheckpointPost.post_id, SyncCheckpointPost.status, SyncCheckpointPost.media, SyncCheckpointPost.attempts
+    ).filter(SyncCheckpointPost.account_id == account_id)
+    done, failed, attempts = set(), {}, {}
+    for post_id, post_status, media, post_attempts in rows:
+        if post_status == DONE:
+            done.add(post_id)
+            continue
+        attempts[post_id] = post_attempts
+        if post_status == FAILED:
+            failed[post_id] = json.loads(media) if media else {"id": post_id}
+
+    return {
+        "in_progress": checkpoint is not None,
+        "cursor": checkpoint.cursor if checkpoint else None,
+        "full_resync": bool(checkpoint and checkpoint.full_resync),
+        "newest_post": json.loads(checkpoint.newest_post) if checkpoint and checkpoint.newest_post else None,
+        "done": done,
+        "failed": failed,
+        "attempts": attempts,
+    }
+
+
+def save_checkpoint(db, account_id, cursor, full_resync, newest_post, done_ids, failures):
+    """
+    Record sync progress: the listing cursor, posts stored since the last save and posts that failed.
+    `failures` is a list of (/media item, error message); a post failing for the
+    SYNC_MAX_POST_ATTEMPTS-th time is parked instead of retried. Commits.
+    """
+    now = datetime.now(timezone.utc)
+    stmt = insert(SyncCheckpoint).values(
+        account_id=account_id,
+        cursor=cursor,
+        full_resync=full_resync,
+        newest_post=json.dumps(
+            {"id": newest_post["id"], "timestamp": newest_post.get("timestamp")}
+        ) if newest_post else None,
+        created_ts=now,
+        updated_ts=now,
+    )
+    db.execute(stmt.on_duplicate_key_update(
+        cursor=stmt.inserted.cursor,
+        newest_post=stmt.inserted.newest_post,
+        updated_ts=stmt.inserted.updated_ts,
+    ))
+
+    rows = [
+        {"account_id": account_id, "post_id": post_id, "status": DONE, "media": None, "error": None,
+         "attempts": 0, "updated_ts": now}
+        for post_id in done_ids
+    ]
+    rows += [
+        {"account_id": account_id, "post_id": post["id"], "status": FAILED, "media": json.dumps(post),
+         "error": error, "attempts": 1, "updated_ts": now}
+        for post, error in failures
+    ]
+    if rows:
+        stmt = insert(SyncCheckpointPost).values(rows)
+        # Ordered: status is decided from the attempts count before it is incremented
+        db.execute(stmt.on_duplicate_key_update([
+            ("status", case(
+                (
+                    and_(
+                        stmt.inserted.status == FAILED,
+                        SyncCheckpointPost.attempts + stmt.inserted.attempts >= SYNC_MAX_POST_ATTEMPTS,
+                    ),
+                    PARKED,
+                ),
+                else_=stmt.inserted.status,
+            )),
+            ("media", stmt.inserted.media),
+            ("error", stmt.inserted.error),
+            ("attempts", SyncCheckpointPost.attempts + stmt.inserted.attempts),
+            ("updated_ts", stmt.inserted.updated_ts),
+        ]))
+    db.commit()
+
+
+def finish_checkpoint(db, account_id):
+    """
+    Close the account's listing once a sync has walked every page.
+    Failed posts are kept so the next sync retries them, parked ones so they stay reported. Commits.
+    """
+    db.query(SyncCheckpoint).filter(SyncCheckpoint.account_id == account_id).delete(synchronize_session=False)
+    db.query(SyncCheckpointPost).filter(
+        SyncCheckpointPost.account_id == account_id,
+        SyncCheckpointPost.status == DONE,
+    ).delete(synchronize_session=False)
+    db.commit()
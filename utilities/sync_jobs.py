@@ -0,0 +1,144 @@
+import os
+import time
+import uuid
+import asyncio
+import traceback
+from collections import OrderedDict
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from database.database import AsyncSessionLocal, run_db
+from utilities.sync_pipeline import sync_account_posts
+from utilities.accounts import account_concurrency, list_active_account_ids
+from utilities.rate_limiter import use_account_governor
+from utilities.leases import lease, LeaseUnavailable, LeaseLost
+
+load_dotenv()
+
+SYNC_JOB_HISTORY = int(os.getenv("SYNC_JOB_HISTORY", 100))  # finished jobs kept for the status endpoint
+SYNC_MAX_CONCURRENT_ACCOUNTS = int(os.getenv("SYNC_MAX_CONCURRENT_ACCOUNTS", 4))  # accounts syncing at once
+SYNC_LEASE_TTL = int(os.getenv("SYNC_LEASE_TTL", 300))  # seconds; renewed while the sync runs
+
+
+class SyncJob:
+    """
+    A posts sync running in the background of this process.
+    """
+    def __init__(self, account_id, full_resync):
+        self.job_id = uuid.uuid4().hex
+        self.account_id = account_id
+        self.full_resync = full_resync
+        self.status = "queued"
+        self.progress = {}
+        self.errors = []
+        self.started_at = time.time()
+        self.finished_at = None
+        self.task = None
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        progress = self.progress
+        return {
+            "job_id": self.job_id,
+            "account_id": self.account_id,
+            "full_resync": self.full_resync,
+            "status": self.status,
+            "pages_listed": progress.get("pages_listed", 0),
+            "posts_fetched": progress.get("posts_fetched", 0),
+            "rows_inserted": progress.get("inserted", 0),
+            "rows_updated": progress.get("updated", 0),
+            "rows_written": progress.get("inserted", 0) + progress.get("updated", 0),
+            "writes_skipped": progress.get("skipped", 0),
+            "posts_failed": progress.get("failed", 0),
+            "posts_retried": progress.get("retried", 0),
+            "posts_parked": progress.get("parked", 0),
+            "resumed": progress.get("resumed", False),
+            "posts_refreshed": progress.get("refreshed", 0),
+            "refresh_failed": progress.get("refresh_failed", 0),
+            "media_mirrored": progress.get("media_mirrored", 0),
+            "media_failed": progress.get("media_failed", 0),
+            "timings": progress["timings"].to_dict() if "timings" in progress else None,
+            "errors": self.errors,
+            "elapsed_seconds": round(end - self.started_at, 2),
+        }
+
+
+class SyncJobRunner:
+    """
+    In-process job runner: at most one running sync per account, later triggers attach to it.
+    At most `max_accounts` accounts sync at once; the rest stay queued until a slot frees up.
+    Across workers a sync:<account_id> lease keeps it to one sync per account; a job that finds
+    the lease taken ends as "skipped", and one whose lease is taken over mid-sync is stopped.
+    """
+    def __init__(self, history=SYNC_JOB_HISTORY, max_accounts=SYNC_MAX_CONCURRENT_ACCOUNTS):
+        self.jobs = OrderedDict()
+        self.running = {}  # account_id -> SyncJob, queued or running
+        self.history = history
+        self.max_accounts = max_accounts
+        self._slots = None
+
+    def start(self, account_id, full_resync=False):
+        """
+        Start a sync for the account, or return the one already running.
+        Returns (job, created).
+        """
+        job = self.running.get(account_id)
+        if job:
+            return job, False
+
+        job = SyncJob(account_id, full_resync)
+        self.jobs[job.job_id] = job
+        self.running[account_id] = job
+        job.task = asyncio.create_task(self._run(job))
+        self._trim()
+        return job, True
+
+    async def start_all(self, db, full_resync=False):
+        """
+        Start a sync for every active account. Returns [(job, created)].
+        """
+        account_ids = await run_db(db, list_active_account_ids)
+        return [self.start(account_id, full_resync) for account_id in account_ids]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def _run(self, job):
+        # Created lazily so it binds to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_accounts)
+
+        # The request's session is closed once the response is sent, so the job owns its own
+        db = AsyncSessionLocal()
+        try:
+            async with self._slots, lease(f"sync:{job.account_id}", SYNC_LEASE_TTL):
+                job.status = "running"
+                # Graph calls made by this task are paced by the account's own governor
+                use_account_governor(job.account_id, await db.run_sync(account_concurrency, job.account_id))
+                await sync_account_posts(job.account_id, db, job.full_resync, progress=job.progress)
+            job.status = "succeeded"
+        except LeaseUnavailable as e:
+            job.errors.append(f"Account {job.account_id} is already syncing on another worker ({e.owner})")
+            job.status = "skipped"
+        except LeaseLost as e:
+            job.errors.append(f"Sync stopped: account {job.account_id} was taken over by another worker ({e.owner})")
+            job.status = "failed"
+        except HTTPException as e:
+            traceback.print_exc()
+            job.errors.append(str(e.detail))
+            job.status = "failed"
+        except Exception as e:
+            traceback.print_exc()
+            job.errors.append(str(e))
+            job.status = "failed"
+        finally:
+            await db.close()
+            job.finished_at = time.time()
+            self.running.pop(job.account_id, None)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+
+sync_jobs = SyncJobRunner()
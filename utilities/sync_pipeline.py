@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from utilities.fetch_posts_helper import iter_post_pages, collect_post_metrics, STORE_CHUNK_SIZE
+from utilities.post_columns import PostColumns
+from utilities.sync_state import get_high_water_mark, set_high_water_mark
+from utilities.sync_checkpoint import get_checkpoint, save_checkpoint, finish_checkpoint, SYNC_MAX_POST_ATTEMPTS
+from utilities.refresh_schedule import refresh_due_posts, store_and_reschedule
+from utilities.media_cache import mirror_account_media
+from database.database import run_db
+from utilities.accounts import get_token_manager
+from utilities.graph_client import current_token_manager
+from utilities.metrics import SyncTimings, span, SYNC_POSTS, SYNC_POSTS_PER_SECOND
+
+load_dotenv()
+
+SYNC_QUEUE_SIZE = int(os.getenv("SYNC_QUEUE_SIZE", 4))  # pages buffered between stages
+SYNC_METRIC_WORKERS = int(os.getenv("SYNC_METRIC_WORKERS", 4))
+
+_DONE = object()
+
+
+async def run_sync_pipeline(
+    account_id, token, db, full_resync=False,
+    queue_size=SYNC_QUEUE_SIZE, metric_workers=SYNC_METRIC_WORKERS, chunk_size=None, progress=None,
+):
+    """
+    Sync posts and metrics as a three-stage pipeline: list media pages -> fetch metrics -> write chunks.
+    Stages are connected by bounded queues, so listing, metric fetches and DB writes overlap
+    while only a few pages are held in memory at any time.
+    Returns a summary with pages listed, posts fetched, rows inserted/updated, unchanged posts skipped,
+    posts failed/retried/parked, the newest post seen and per-stage timing spans (list, fetch, store) under "timings".
+    Pass a dict as `progress` to have it updated with the same counters while the sync runs.
+    `db` may be an AsyncSession or a plain Session; neither blocks the event loop.
+
+    Progress is checkpointed after every write: the cursor of the oldest page not fully stored,
+    the ids stored so far and the posts that failed. A sync that finds a checkpoint resumes from
+    its cursor, skips posts already stored and first retries the earlier failures.
+    A post that still fails is recorded instead of failing the run; see "failed" in the summary.
+    After SYNC_MAX_POST_ATTEMPTS failures a post is parked: no longer retried, counted under "parked".
+    """
+    chunk_size = chunk_size or STORE_CHUNK_SIZE
+    page_queue = asyncio.Queue(maxsize=queue_size)
+    write_queue = asyncio.Queue(maxsize=queue_size)
+    summary = progress if progress is not None else {}
+    summary.update({
+        "pages_listed": 0, "posts_fetched": 0, "inserted": 0, "updated": 0, "skipped": 0,
+        "failed": 0, "retried": 0, "parked": 0, "resumed": False, "newest_post": None,
+    })
+    timings = summary["timings"] = SyncTimings()
+
+    # Read before the writer stage starts using the session
+    checkpoint = await run_db(db, get_checkpoint, account_id)
+    if checkpoint["in_progress"]:
+        # Finish the interrupted walk the way it started
+        full_resync = full_resync or checkpoint["full_resync"]
+        summary["resumed"] = True
+        summary["newest_post"] = checkpoint["newest_post"]
+    high_water_mark = (None, None) if full_resync else await run_db(db, get_high_water_mark, account_id)
+    already_handled = checkpoint["done"] | checkpoint["failed"].keys()
+
+    # page index -> cursor of every listed page whose posts are not all stored or recorded as failed
+    open_pages = {}
+    last_cursor = checkpoint["cursor"]
+
+    async def list_pages():
+        nonlocal last_cursor
+        # Earlier failures go first, as a page of their own outside the cursor bookkeeping
+        retry_page = list(checkpoint["failed"].values())
+        if retry_page:
+            summary["retried"] = len(retry_page)
+            await page_queue.put((None, retry_page))
+
+        pages = iter_post_pages(account_id, token, high_water_mark, cursor=checkpoint["cursor"], with_cursor=True)
+        while True:
+            with span("list", timings) as measure:
+                item = await anext(pages, _DONE)
+                measure["items"] = len(item[1]) if item is not _DONE else 0
+            if item is _DONE:
+                break
+            page_cursor, page = item
+            index = summary["pages_listed"]
+            summary["pages_listed"] += 1
+            last_cursor = page_cursor
+            if summary["newest_post"] is None and page:
+                summary["newest_post"] = page[0]
+            page = [post for post in page if post["id"] not in already_handled]
+            if page:
+                open_pages[index] = page_cursor
+                await page_queue.put((index, page))
+        for _ in range(metric_workers):
+            await page_queue.put(_DONE)
+
+    async def fetch_metrics():
+        while True:
+            item = await page_queue.get()
+            if item is _DONE:
+                await write_queue.put(_DONE)
+                return
+            index, page = item
+            errors = {}
+            with span("fetch", timings) as measure:
+                metrics = await collect_post_metrics(page, token, failures=errors)
+                measure["items"] = len(page)
+            fetched, failures = [], []
+            for post, metric in zip(page, metrics):
+                if metric is None:
+                    failures.append((post, errors.get(post["id"], "metrics missing")))
+                else:
+                    fetched.append((post, metric))
+            summary["posts_fetched"] += len(fetched)
+            # Only the compact columns travel on; the raw page dicts are dropped here
+            columns = PostColumns.from_posts([post for post, _ in fetched], [metric for _, metric in fetched])
+            await write_queue.put((index, columns, failures))
+
+    async def flush(batches):
+        columns = PostColumns.concat([columns for _, columns, _ in batches])
+        failures = [failure for _, _, page_failures in batches for failure in page_failures]
+        # The session is only used by this stage while the pipeline runs
+        if len(columns):
+            with span("store", timings) as measure:
+                # Listed posts count as refreshed: their next refresh is scheduled from the totals before this write
+                result = await run_db(db, lambda session: store_and_reschedule(
+                    session, account_id, columns, datetime.now(timezone.utc).replace(tzinfo=None), chunk_size
+                ))
+                measure["items"] = len(columns)
+            summary["inserted"] += result["inserted"]
+            summary["updated"] += result["updated"]
+            summary["skipped"] += result["skipped"]
+        summary["failed"] += len(failures)
+        # Posts failing for the last allowed time are parked by save_checkpoint and not retried again
+        summary["parked"] += sum(
+            1 for post, _ in failures if checkpoint["attempts"].get(post["id"], 0) + 1 >= SYNC_MAX_POST_ATTEMPTS
+        )
+
+        for index, _, _ in batches:
+            open_pages.pop(index, None)
+        # Resume from the oldest page still open, or re-read the last page listed (its posts are skipped)
+        cursor = open_pages[min(open_pages)] if open_pages else last_cursor
+        done_ids = columns.post_ids.tolist()
+        await run_db(db, lambda session: save_checkpoint(
+            session, account_id, cursor, full_resync, summary["newest_post"], done_ids, failures
+        ))
+
+    async def write_chunks():
+        batches, pending = [], 0
+        remaining = metric_workers
+        while remaining:
+            item = await write_queue.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            batches.append(item)
+            pending += len(item[1]) + len(item[2])
+            if pending >= chunk_size:
+                await flush(batches)
+                batches, pending = [], 0
+        if batches:
+            await flush(batches)
+
+    tasks = [
+        asyncio.create_task(list_pages()),
+        *(asyncio.create_task(fetch_metrics()) for _ in range(metric_workers)),
+        asyncio.create_task(write_chunks()),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return summary
+
+
+async def sync_account_posts(account_id, db, full_resync=False, progress=None):
+    """
+    Run a full posts sync for one account, advance its high-water mark and close its checkpoint.
+    New posts come from the listing; older ones are refetched only when their refresh is due.
+    Media of new posts is then mirrored into the local media cache.
+    Returns the pipeline summary without the newest post, with the timing spans as a dict.
+    """
+    start = time.perf_counter()
+    started = datetime.now(timezone.utc).replace(tzinfo=None)
+    # Cached per-account token; only refreshes when close to expiry
+    token_manager = await run_db(db, get_token_manager, account_id)
+    # Graph calls of this sync swap in a refreshed token if the current one is rejected
+    current_token_manager.set(token_manager)
+    access_token = await token_manager.get_token()
+
+    summary = await run_sync_pipeline(account_id, access_token, db, full_resync, progress=progress)
+
+    # Newest post first, so the first listed item becomes the new high-water mark
+    newest_post = summary.get("newest_post")
+    if newest_post:
+        await run_db(db, set_high_water_mark, account_id, newest_post)
+    # Every page was walked; only the posts that failed stay behind for the next sync
+    await run_db(db, finish_checkpoint, account_id)
+
+    # A full resync has just refetched every post, so only incremental syncs refresh due posts
+    if not full_resync:
+        summary.update(await refresh_due_posts(account_id, access_token, db, started, summary["timings"]))
+
+    # Mirror media of the posts just stored before their CDN URLs expire
+    summary.update(await mirror_account_media(account_id, db, summary["timings"]))
+
+    elapsed = time.perf_counter() - start
+    posts = summary["posts_fetched"] + summary.get("refreshed", 0)
+    SYNC_POSTS.labels(account_id=account_id).inc(posts)
+    SYNC_POSTS_PER_SECOND.labels(account_id=account_id).set(posts / elapsed if elapsed else 0)
+
+    result = {key: value for key, value in summary.items() if key not in ("newest_post", "timings")}
+    result["timings"] = summary["timings"].to_dict()
+    print(json.dumps({"event": "sync_finished", "account_id": account_id, **result}))
+    return result
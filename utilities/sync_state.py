@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+from sqlalchemy.dialects.mysql import insert
+from database.models import SyncState
+
+
+def parse_post_timestamp(raw_timestamp):
+    """
+    Parse a Graph API timestamp ("2024-01-31T10:00:00+0000") into a naive UTC datetime.
+    """
+    if not raw_timestamp:
+        return None
+    return datetime.strptime(raw_timestamp, "%Y-%m-%dT%H:%M:%S%z").astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def get_high_water_mark(db, account_id):
+    """
+    Return (last_post_id, last_post_created) for the newest post seen on a previous sync,
+    or (None, None) if the account has never been synced.
+    """
+    state = db.query(SyncState).filter(SyncState.account_id == account_id).first()
+    if not state:
+        return None, None
+    return state.last_post_id, state.last_post_created
+
+
+def set_high_water_mark(db, account_id, post):
+    """
+    Record `post` (a raw /media item) as the newest post seen for the account.
+    """
+    now = datetime.now(timezone.utc)
+    stmt = insert(SyncState).values(
+        account_id=account_id,
+        last_post_id=post["id"],
+        last_post_created=parse_post_timestamp(post.get("timestamp")),
+        updated_ts=now,
+    )
+    stmt = stmt.on_duplicate_key_update(
+        last_post_id=stmt.inserted.last_post_id,
+        last_post_created=stmt.inserted.last_post_created,
+        updated_ts=stmt.inserted.updated_ts,
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def page_reaches_high_water_mark(page, last_post_id, last_post_created):
+    """
+    True if a /media page (newest first) contains a post that an earlier sync already stored.
+    """
+    for post in page:
+        if last_post_id and post["id"] == last_post_id:
+            return True
+        created = parse_post_timestamp(post.get("timestamp"))
+        if last_post_created and created and created <= last_post_created:
+            return True
+    return False
@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from utilities.access_token import refresh_access_token, generate_new_long_lived_token, debug_token
+from utilities.leases import try_acquire_lease, give_up_lease
+
+load_dotenv()
+
+APP_ID = os.getenv("META_APP_ID")
+APP_SECRET = os.getenv("META_APP_SECRET")
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", 24 * 3600))  # seconds before expiry
+TOKEN_LEASE_TTL = int(os.getenv("TOKEN_LEASE_TTL", 60))  # seconds one worker may spend refreshing
+TOKEN_LEASE_WAIT = float(os.getenv("TOKEN_LEASE_WAIT", 30))  # seconds to wait for another worker's refresh
+TOKEN_LEASE_POLL = float(os.getenv("TOKEN_LEASE_POLL", 1))
+
+
+class TokenManager:
+    """
+    Caches the access token with its expiry and refreshes it before it runs out.
+    Concurrent callers share a single in-flight refresh.
+
+    With a shared store (`load` and `persist`) and a `lease_name`, workers coordinate through the
+    database: a stale token is first re-read from the store, only the worker holding the lease
+    refreshes it, and the others wait for the refreshed token to show up in the store.
+    """
+    def __init__(
+        self, access_token, long_lived_token, refresh_margin=TOKEN_REFRESH_MARGIN, expires_at=None,
+        persist=None, load=None, lease_name=None,
+    ):
+        self.access_token = access_token
+        self.long_lived_token = long_lived_token
+        self.refresh_margin = refresh_margin
+        self.expires_at = expires_at  # unix timestamp; None until known
+        self.persist = persist  # called as persist(access_token, long_lived_token, expires_at)
+        self.load = load  # returns (access_token, long_lived_token, expires_at) from the shared store
+        self.lease_name = lease_name
+        self.rejected_tokens = set()  # tokens Graph refused before they expired
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        return (
+            self.access_token is not None
+            and self.access_token not in self.rejected_tokens
+            and self.expires_at is not None
+            and time.time() < self.expires_at - self.refresh_margin
+        )
+
+    async def get_token(self):
+        """
+        Return a valid access token without any network call while the cached one is fresh.
+        """
+        if self._is_fresh():
+            return self.access_token
+
+        async with self._lock:
+            # Another caller, or another worker, may have refreshed while we waited for the lock
+            if not self._is_fresh():
+                await self._reload()
+            if not self._is_fresh():
+                await self._refresh_shared()
+            return self.access_token
+
+    def invalidate(self, token=None):
+        """
+        Force a refresh on the next get_token call, e.g. after Graph rejects the token (code 190).
+        """
+        self.rejected_tokens.add(token or self.access_token)
+
+    def issued(self, token):
+        """
+        True if `token` was handed out by this manager, now or before a refresh.
+        """
+        return token == self.access_token or token in self.rejected_tokens
+
+    async def current_for(self, token):
+        """
+        The token to send in place of `token`: itself, unless it was rejected, then the refreshed one.
+        """
+        if token not in self.rejected_tokens:
+            return token
+        return await self.get_token()
+
+    async def refreshed_token(self, token):
+        """
+        Invalidate a token Graph just rejected and return its refreshed replacement,
+        or None if it was not issued by this manager or did not change.
+        """
+        if not token or not self.issued(token):
+            return None
+        self.invalidate(token)
+        fresh = await self.current_for(token)
+        return fresh if fresh != token else None
+
+    async def _token_expiry(self, token):
+        """
+        debug_token's answer for `token`, or None if the check itself failed.
+        """
+        try:
+            return await debug_token(token)
+        except Exception as e:
+            print(f"Failed to check the access token expiry: {e}")
+            return None
+
+    async def _reload(self):
+        if self.load is None:
+            return
+        stored = await asyncio.to_thread(self.load)
+        if stored and stored[0]:
+            access_token, self.long_lived_token, self.expires_at = stored
+            # The stored token may still be the one Graph rejected; it stays rejected until replaced
+            if access_token != self.access_token:
+                self._replace_token(access_token)
+
+    def _replace_token(self, token):
+        # Calls still in flight may carry the token just replaced; older rejections are settled
+        self.rejected_tokens = {self.access_token} - {token} if self.access_token in self.rejected_tokens else set()
+        self.access_token = token
+
+    async def _refresh_shared(self):
+        """
+        Refresh under the cluster-wide lease, or wait for the worker that holds it.
+        """
+        if self.lease_name is None:
+            await self._refresh()
+            return
+
+        deadline = time.monotonic() + TOKEN_LEASE_WAIT
+        while True:
+            if await try_acquire_lease(self.lease_name, TOKEN_LEASE_TTL):
+                try:
+                    # The previous holder may have stored a new token just before we got the lease
+                    await self._reload()
+                    if not self._is_fresh():
+                        await self._refresh()
+                finally:
+                    await give_up_lease(self.lease_name)
+                return
+
+            await asyncio.sleep(TOKEN_LEASE_POLL)
+            await self._reload()
+            if self._is_fresh():
+                return
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Access token refresh is still running on another worker",
+                )
+
+    async def _refresh(self):
+        # First use: learn the expiry of the token we were started with
+        if self.expires_at is None and self.access_token:
+            expires_at = await self._token_expiry(self.access_token)
+            if expires_at is not None:
+                self.expires_at = expires_at or float("inf")  # 0 means it never expires
+                if self._is_fresh():
+                    # Share the expiry so other workers skip this check
+                    if self.persist:
+                        await asyncio.to_thread(self.persist, self.access_token, self.long_lived_token, self.expires_at)
+                    return
+
+        try:
+            token, expires_in = await refresh_access_token(APP_ID, APP_SECRET, self.long_lived_token, True)
+        except Exception as e:
+            try:
+                self.long_lived_token = await generate_new_long_lived_token(self.access_token)
+                token, expires_in = await refresh_access_token(APP_ID, APP_SECRET, self.long_lived_token, True)
+            except Exception as gen_error:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to refresh access token: {str(e)}; "
+                           f"failed to generate new long-lived token: {str(gen_error)}"
+                )
+
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to refresh access token: no token in response",
+            )
+
+        if expires_in:
+            self.expires_at = time.time() + expires_in
+        else:
+            expires_at = await self._token_expiry(token)
+            if expires_at == 0:
+                self.expires_at = float("inf")
+            else:
+                # Unknown expiry: check again once the refresh margin has passed
+                self.expires_at = expires_at or time.time() + 2 * self.refresh_margin
+        self._replace_token(token)
+
+        if self.persist:
+            await asyncio.to_thread(self.persist, token, self.long_lived_token, self.expires_at)